@@ -1,44 +1,218 @@
-from typing import Dict, List, Optional
+import heapq
+import threading
+from collections import OrderedDict, deque
+from bisect import bisect_left, bisect_right, insort
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import (
+    IO,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+)
+from .fuzzy import SymSpellIndex
 from .contacts import Contact
-from .contact_exceptions import DuplicateContactError, ContactNotFoundError
+from .contact_validators import validate_many, PREFIX
+from .contact_exceptions import (
+    ContactError,
+    DuplicateContactError,
+    ContactNotFoundError,
+    StorageError,
+)
 from .storage import Storage
+from .exporters import export_contacts
+from .dedupe import DEFAULT_THRESHOLD, MergeSuggestion, find_duplicates, merge_groups, merged_contact
+
+SEARCH_CACHE_SIZE = 256  # max cached queries
+SEARCH_CACHE_MAX_IDS = 100_000  # max ids across all the cached results
+UNDO_LIMIT = 100  # changes (or transactions) that can be undone
+# changes applied together (undo, redo, transaction) from which the sorted
+# lists are sorted once at the end instead of kept sorted with bisect: an
+# insort moves the list tail, the sort at the end walks all of it
+SORT_BATCH_MIN = 256
+
+# (kind, contact, previous contact) with kind "add", "delete" or "update",
+# previous is the replaced contact for updates and None otherwise
+Operation = Tuple[str, Contact, Optional[Contact]]
+
+
+@dataclass
+class ImportReport:
+    added: List[Contact] = field(default_factory=list)
+    errors: List[Tuple[int, str]] = field(default_factory=list)  # (row number, message)
+    # filled by the importers pipeline (importers.import_records)
+    rows: int = 0
+    seconds: float = 0.0
+
+    @property
+    def rows_per_sec(self) -> float:
+        return self.rows / self.seconds if self.seconds else 0.0
+
+
+@dataclass
+class ChangeSet:
+    # ids of the contacts changed since the last save, by what the saved book
+    # has to do with them: a contact added and then deleted is in none
+    added: Set[str] = field(default_factory=set)
+    updated: Set[str] = field(default_factory=set)
+    deleted: Set[str] = field(default_factory=set)
+
+    def record(self, kind: str, id: str) -> None:
+        if kind == "add":
+            if id in self.deleted:
+                # deleted and added back (an undo): the saved book has it
+                self.deleted.discard(id)
+                self.updated.add(id)
+            else:
+                self.added.add(id)
+        elif kind == "update":
+            if id not in self.added:
+                self.updated.add(id)
+        elif id in self.added:
+            self.added.discard(id)
+        else:
+            self.updated.discard(id)
+            self.deleted.add(id)
+
+    def merge(self, newer: "ChangeSet") -> "ChangeSet":
+        # the changes of both, newer is relative to the book after self
+        merged = ChangeSet(set(self.added), set(self.updated), set(self.deleted))
+        newer_ids = (("add", newer.added), ("update", newer.updated), ("delete", newer.deleted))
+
+        for kind, ids in newer_ids:
+            for id in ids:
+                merged.record(kind, id)
+
+        return merged
+
+    def __len__(self):
+        return len(self.added) + len(self.updated) + len(self.deleted)
+
+
+@dataclass
+class SaveSnapshot:
+    path: str
+    contacts: Dict[str, Contact]
+    changes: Optional[ChangeSet] = None  # for save_delta, None for a full save
+
+    def merge(self, newer: "SaveSnapshot") -> "SaveSnapshot":
+        # two saves of the same path waiting to be written become one: the
+        # newest contacts, and the changes of both if both are deltas
+        if self.changes is None or newer.changes is None:
+            return SaveSnapshot(newer.path, newer.contacts, None)
+
+        return SaveSnapshot(newer.path, newer.contacts, self.changes.merge(newer.changes))
+
 
 class AddressBook:
     def __init__(self, storage: Storage):
-        self.contacts: Dict[str, Contact] = {}
-        # Dictionaries created for duplicates check in order to search faster
-        self._phone_idx: Dict[str, str] = {}  # maps phone -> id
-        self._email_idx: Dict[str, str] = {}  # maps email -> id
+        self._reset_indexes()
         self.storage: Storage = storage
 
         # Flag used to keep track of the changes
         self.is_changed = False
+        # search_contact counters, to tune the cache size
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.cache_narrowed = 0  # misses answered filtering a cached query
+        # Contacts changed since the last load/save of self._path, for the
+        # storages with save_delta (e.g. JournalStorage) that write only those
+        self._dirty = ChangeSet()
+        self._path: Optional[str] = None
+        # the background saver fills _encoded while the book changes
+        self._encoded_lock = threading.Lock()
+        # Operation log for undo/redo: every entry is the list of operations
+        # of one change (or transaction), undone in reverse order
+        self._undo_log: deque[List[Operation]] = deque(maxlen=UNDO_LIMIT)
+        self._redo_log: List[List[Operation]] = []
+        self._transaction_ops: Optional[List[Operation]] = None
+        # While not None the sorted lists are not kept sorted on every change:
+        # new items are appended and the removed ones collected here (one set
+        # per list of _sorted_items), _sort_pending updates them in one pass.
+        # Only for big batches of changes, see _deferred_sort
+        self._pending_removals: Optional[Tuple[Set, Set, Set]] = None
+        self._sorted_dirty = False
 
     def add_contact(self, contact: Contact) -> None:
         self._check_duplicate_contact(contact)
-
-        self.contacts[contact.id] = contact
-        self._phone_idx[contact.phone_number] = contact.id
-
-        if contact.email:
-            self._email_idx[contact.email] = contact.id
-
-        self.is_changed = True
+        self._apply_and_log(("add", contact, None))
 
     def delete_contact(self, contact: Contact) -> None:
-        deleted_contact = self.contacts.pop(contact.id, None)
+        deleted_contact = self.contacts.get(contact.id)
 
         if deleted_contact is None:
             raise ContactNotFoundError("Contact not found")
 
-
-        # Remove it also from second indexes dictionaries
-        self._phone_idx.pop(contact.phone_number, None)
-
-        if contact.email:
-            self._email_idx.pop(contact.email, None)
-
-        self.is_changed = True
+        self._apply_and_log(("delete", deleted_contact, None))
+
+    def bulk_add(self, records: Iterable[dict], atomic: bool = False) -> ImportReport:
+        # records are raw dicts (first_name, last_name, phone_number or phone,
+        # email). Every row is validated and checked for duplicates against the
+        # book and the previous rows, the errors are collected per row (numbered
+        # from 1) instead of raising. With atomic nothing is added if any row fails.
+        rows = enumerate(validate_many(records), start=1)
+        return self.add_validated(rows, atomic=atomic)
+
+    def add_validated(
+        self,
+        rows: Iterable[Tuple[int, Union[dict, str]]],
+        atomic: bool = False,
+        seen: Optional[Dict[str, int]] = None,
+    ) -> ImportReport:
+        # rows are (row number, fields returned by validate_many or the
+        # validation error message), in row order: on duplicates the first row wins.
+        # seen maps the phones and emails of the rows added so far to their row
+        # number, the importers pass the same one for every chunk of an input
+        report = ImportReport()
+        seen = {} if seen is None else seen
+
+        for row_number, fields in rows:
+            if isinstance(fields, str):
+                report.errors.append((row_number, fields))
+                continue
+
+            try:
+                contact = Contact(**fields)
+
+                # before the book checks: rows of earlier chunks are in the book
+                if contact.phone_number in seen:
+                    raise DuplicateContactError(
+                        f"Phone number already used by row {seen[contact.phone_number]}"
+                    )
+
+                if contact.email and contact.email in seen:
+                    raise DuplicateContactError(
+                        f"Email already used by row {seen[contact.email]}"
+                    )
+
+                self._check_duplicate_contact(contact)
+
+            except ContactError as e:
+                report.errors.append((row_number, str(e)))
+                continue
+
+            # phones start with "+" and emails have a "@", they can't collide
+            seen[contact.phone_number] = row_number
+            if contact.email:
+                seen[contact.email] = row_number
+
+            report.added.append(contact)
+
+        if atomic and report.errors:
+            report.added.clear()
+            return report
+
+        if report.added:
+            self._insert_many(report.added)
+            self.is_changed = True
+
+        return report
 
     def update_contact(
         self, contact_to_update: Contact, updated_contact: Contact
@@ -47,37 +221,249 @@ class AddressBook:
             raise ContactNotFoundError("Contact not found.")
 
         self._check_duplicate_contact(updated_contact, exclude_id=contact_to_update.id)
-        self._replace_contact(contact_to_update, updated_contact)
-        self.is_changed = True
 
-    def list_contacts(self) -> List[Contact]:
-        return [
-            contact
-            for contact in sorted(
-                # sort first for last name, then for first name and then for id
-                self.contacts.values(),
-                key=lambda contact: (contact.last_name, contact.first_name, contact.id),
-            )
-        ]
+        previous = self.contacts[contact_to_update.id]
+        updated_contact.id = previous.id
+        self._apply_and_log(("update", updated_contact, previous))
+
+    @contextmanager
+    def transaction(self):
+        # with addressbook.transaction(): ... applies the changes of the block
+        # as one: a single undo reverts all of them, an exception reverts them
+        # and is raised again. The sorted lists are updated once at the end
+        # instead of on every change. A nested transaction joins the outer one.
+        if self._transaction_ops is not None:
+            yield self
+            return
+
+        ops: List[Operation] = []
+        is_changed = self.is_changed
+        self._transaction_ops = ops
+
+        try:
+            with self._deferred_sort():
+                try:
+                    yield self
+                except BaseException:
+                    self._revert(ops)
+                    raise
+                finally:
+                    self._transaction_ops = None
+
+        except BaseException:
+            self.is_changed = is_changed
+            raise
+
+        if ops:
+            self._undo_log.append(ops)
+            self._redo_log.clear()
+
+    def undo(self) -> bool:
+        # revert the last change or transaction, False if there is none
+        self._check_no_transaction()
+        if not self._undo_log:
+            return False
+
+        ops = self._undo_log.pop()
+        with self._deferred_sort(len(ops)):
+            self._revert(ops)
+
+        self._redo_log.append(ops)
+        return True
+
+    def redo(self) -> bool:
+        # apply again the last undone change, False if there is none (or the
+        # book changed after the undo)
+        self._check_no_transaction()
+        if not self._redo_log:
+            return False
+
+        ops = self._redo_log.pop()
+        with self._deferred_sort(len(ops)):
+            for op in ops:
+                self._apply(op)
+
+        self._undo_log.append(ops)
+        return True
+
+    def get_contact(self, id: str) -> Optional[Contact]:
+        return self.contacts.get(id)
+
+    def list_contacts(self, offset: int = 0, limit: Optional[int] = None) -> List[Contact]:
+        # sorted first for last name, then for first name and then for id
+        self._sort_pending()
+        end = None if limit is None else offset + limit
+        return [self.contacts[key[2]] for key in self._sorted_keys[offset:end]]
+
+    def iter_contacts(
+        self, start: Optional[str] = None, end: Optional[str] = None
+    ) -> Iterator[Contact]:
+        # Iterate in sorted order the contacts whose last name goes from start to
+        # end, end included as a prefix: iter_contacts("M", "P") also yields "Parker"
+        self._sort_pending()
+        lo = 0 if start is None else bisect_left(self._sorted_keys, (start,))
+        hi = (
+            len(self._sorted_keys)
+            if end is None
+            else bisect_right(self._sorted_keys, (end + "\uffff",))
+        )
+
+        for pos in range(lo, hi):
+            yield self.contacts[self._sorted_keys[pos][2]]
 
     def search_contact(self, query: str) -> List[Contact]:
         normalized_query = query.strip().lower()
 
-        contacts_found = []
-        # The user can search contact by first or last name typing them entirely or typing  sub-string
-        for contact in self.contacts.values():
-            if normalized_query in contact.get_full_name().lower():
-                contacts_found.append(contact)
+        ids = self._cached_search(normalized_query)
+
+        if ids is None:
+            ids = self._narrowed_search(normalized_query)
+
+            if ids is None:
+                ids = self._index_search(normalized_query)
 
-        if not contacts_found:
+            self._cache_search(normalized_query, ids)
+
+        if not ids:
+            raise ContactNotFoundError("No contacts found")
+
+        return [self.contacts[id] for id in ids]
+
+    def cache_stats(self) -> Dict[str, int]:
+        return {
+            "hits": self.cache_hits,
+            "misses": self.cache_misses,
+            "narrowed": self.cache_narrowed,
+            "entries": len(self._search_cache),
+            "ids": self._search_cache_ids,
+        }
+
+    def search_fuzzy(
+        self, query: str, k: int = 5, max_distance: int = 2
+    ) -> List[Contact]:
+        # Typo tolerant search ("Einstien"): every word of the query is matched
+        # against the name tokens within max_distance edits, contacts are
+        # ranked by the sum of the distances of their best matching tokens
+        query_tokens = self._name_tokens(query)
+        scores: Dict[str, List[int]] = {}  # maps id -> best distance per query token
+
+        for i, query_token in enumerate(query_tokens):
+            for distance, token in self._name_tokens_idx.search(query_token, max_distance):
+                for id in self._token_ids.get(token, ()):
+                    best = scores.setdefault(id, [max_distance + 1] * len(query_tokens))
+                    best[i] = min(best[i], distance)
+
+        if not scores:
+            raise ContactNotFoundError("No contacts found")
+
+        ranked = heapq.nsmallest(
+            k,
+            scores.items(),
+            key=lambda item: (sum(item[1]), self._sort_key(self.contacts[item[0]])),
+        )
+        return [self.contacts[id] for id, _ in ranked]
+
+    def search_phone(
+        self, prefix: Optional[str] = None, suffix: Optional[str] = None
+    ) -> List[Contact]:
+        # Caller lookup: "+39 347 123" (or "347 123") matches the phones
+        # starting with it, suffix="4567" the phones ending with it
+        self._sort_pending()
+        ids: Optional[Set[str]] = None
+
+        if prefix:
+            prefix = "".join(prefix.split())
+            if not prefix.startswith("+"):
+                prefix = PREFIX + prefix
+
+            ids = {
+                self._phone_idx[phone]
+                for phone in self._prefix_range(self._phone_sorted, prefix)
+            }
+
+        if suffix:
+            reversed_suffix = "".join(suffix.split())[::-1]
+            suffix_ids = {
+                self._phone_idx[phone[::-1]]
+                for phone in self._prefix_range(self._phone_rev_sorted, reversed_suffix)
+            }
+            ids = suffix_ids if ids is None else ids & suffix_ids
+
+        if not ids:
+            raise ContactNotFoundError("No contacts found")
+
+        return sorted((self.contacts[id] for id in ids), key=self._sort_key)
+
+    def contacts_by_domain(self, domain: str) -> List[Contact]:
+        ids = self._domain_idx.get(domain.strip().lower().lstrip("@"), ())
+
+        if not ids:
             raise ContactNotFoundError("No contacts found")
 
-        return sorted(
-            contacts_found,
-            key=lambda contact: (contact.last_name, contact.first_name, contact.id),
+        return sorted((self.contacts[id] for id in ids), key=self._sort_key)
+
+    def domain_counts(self) -> Dict[str, int]:
+        # number of contacts per email domain, most common first
+        return dict(
+            sorted(
+                ((domain, len(ids)) for domain, ids in self._domain_idx.items()),
+                key=lambda item: (-item[1], item[0]),
+            )
         )
 
+    def find_duplicates(self, threshold: float = DEFAULT_THRESHOLD) -> List[MergeSuggestion]:
+        # Pairs of contacts that are probably the same person ("Mario Rossi"
+        # and "Rossi Mario", the same phone with a typo...), best first, see dedupe
+        return find_duplicates(self.iter_contacts(), threshold)
+
+    def merge_contacts(self, keep: Contact, duplicates: Iterable[Contact]) -> Contact:
+        # Delete the duplicates and keep a single contact with the fields of
+        # keep (the email of a duplicate if keep has none). Every contact is
+        # checked before changing anything, a missing one changes nothing.
+        keep = self._stored_contact(keep)
+        duplicates = [
+            self._stored_contact(contact)
+            for contact in {contact.id: contact for contact in duplicates}.values()
+            if contact.id != keep.id
+        ]
+        merged = merged_contact(keep, duplicates)
+
+        with self.transaction():
+            for duplicate in duplicates:
+                self._apply_and_log(("delete", duplicate, None))
+
+            # the duplicates are gone, merged can take the email of one of them
+            self._apply_and_log(("update", merged, keep))
+
+        return merged
+
+    def apply_merges(self, suggestions: Iterable[MergeSuggestion]) -> int:
+        # merge the suggestions (of find_duplicates) and return how many
+        # contacts were removed, groups with a contact already gone are skipped.
+        # All the merges are one transaction: a single undo, and the sorted
+        # lists are sorted once if there are many of them
+        removed = 0
+
+        with self.transaction():
+            for keep, *duplicates in merge_groups(suggestions):
+                try:
+                    self.merge_contacts(keep, duplicates)
+                except ContactNotFoundError:
+                    continue
+
+                removed += len(duplicates)
+
+        return removed
+
     # Helper functions for other methods in this class
+    def _stored_contact(self, contact: Contact) -> Contact:
+        stored = self.contacts.get(contact.id)
+
+        if stored is None:
+            raise ContactNotFoundError("Contact not found.")
+
+        return stored
+
     def _check_duplicate_contact(
         self, contact: Contact, exclude_id: Optional[str] = None
     ) -> None:
@@ -93,51 +479,481 @@ class AddressBook:
                 raise DuplicateContactError("Email already used by another contact")
 
     def _replace_contact(self, old_contact: Contact, new_contact: Contact) -> Contact:
+        # the updated contact keeps the id of the old one, otherwise the
+        # indexes would point to an id that is not a key of self.contacts
+        old_contact = self.contacts[old_contact.id]
+        new_contact.id = old_contact.id
+
+        self._unindex_contact(old_contact)
         self.contacts[old_contact.id] = new_contact
+        self._index_contact(new_contact)
+
+        return new_contact
+
+    def _reset_indexes(self) -> None:
+        # new objects instead of clear(), so load can restore the old ones
+        self.contacts: Dict[str, Contact] = {}
+        # Dictionaries created for duplicates check in order to search faster
+        self._phone_idx: Dict[str, str] = {}  # maps phone -> id
+        self._email_idx: Dict[str, str] = {}  # maps email -> id
+        # the size of each set is the number of contacts at that domain
+        self._domain_idx: Dict[str, Set[str]] = {}  # maps email domain -> ids
+        # Sorted phones and sorted reversed phones, prefix and suffix lookups
+        # for search_phone are a bisect range on them
+        self._phone_sorted: List[str] = []
+        self._phone_rev_sorted: List[str] = []
+        # Inverted index used by search_contact: every trigram of the lowercase
+        # full name points to the ids of the contacts containing it
+        self._name_idx: Dict[str, Set[str]] = {}  # maps trigram -> ids
+        self._name_keys: Dict[str, str] = {}  # maps id -> lowercase full name
+        # (last name, first name, id) keys kept sorted with bisect, so listing
+        # doesn't need to sort the whole book every time
+        self._sorted_keys: List[Tuple[str, str, str]] = []
+        # Edit distance index for search_fuzzy over the name tokens (lowercase
+        # first and last name words) and the contacts having each token
+        self._name_tokens_idx = SymSpellIndex()
+        self._token_ids: Dict[str, Set[str]] = {}  # maps name token -> ids
+        # LRU cache of search_contact: normalized query -> sorted result ids,
+        # bounded by the total number of cached ids
+        self._search_cache: OrderedDict[str, Tuple[str, ...]] = OrderedDict()
+        self._search_cache_ids = 0
+        # Storage.encode_entry of every contact saved, for the storages with
+        # save_encoded: a full save only encodes the contacts that changed.
+        # Only strings, so the gc doesn't have to walk a million more objects.
+        self._encoded: Dict[str, str] = {}  # maps id -> entry
+
+    def _cached_search(self, normalized_query: str) -> Optional[Tuple[str, ...]]:
+        ids = self._search_cache.get(normalized_query)
+
+        if ids is None:
+            self.cache_misses += 1
+            return None
+
+        self._search_cache.move_to_end(normalized_query)
+        self.cache_hits += 1
+        return ids
+
+    def _narrowed_search(self, normalized_query: str) -> Optional[Tuple[str, ...]]:
+        # When the user refines a query ("ein" -> "einst") the results are a
+        # subset of the cached ones, filter those instead of using the index.
+        # Only if there are fewer of them than ids in the rarest trigram of
+        # the query: the results of "" or "e" are most of the book.
+        narrowed_from = max(
+            (query for query in self._search_cache if query in normalized_query),
+            key=len,
+            default=None,
+        )
 
-        if new_contact.phone_number != old_contact.phone_number:
-            self._phone_idx.pop(old_contact.phone_number, None)
-            self._phone_idx[new_contact.phone_number] = new_contact.id
+        if narrowed_from is None:
+            return None
 
-        if (old_contact.email or None) != (new_contact.email or None):
-            if old_contact.email:
-                self._email_idx.pop(old_contact.email, None)
+        if len(self._search_cache[narrowed_from]) > self._index_cost(normalized_query):
+            return None
 
-            if new_contact.email:
-                self._email_idx[new_contact.email] = new_contact.id
+        self.cache_narrowed += 1
+        return tuple(
+            id
+            for id in self._search_cache[narrowed_from]
+            if normalized_query in self._name_keys[id]
+        )
 
-        return new_contact
+    def _index_search(self, normalized_query: str) -> Tuple[str, ...]:
+        # The user can search contact by first or last name typing them entirely or typing  sub-string
+        # Only the contacts sharing every trigram of the query can match, the
+        # substring check then removes the false positives
+        contacts_found = [
+            self.contacts[id]
+            for id in self._name_candidates(normalized_query)
+            if normalized_query in self._name_keys[id]
+        ]
+        contacts_found.sort(key=self._sort_key)
+
+        return tuple(contact.id for contact in contacts_found)
+
+    def _cache_search(self, normalized_query: str, ids: Tuple[str, ...]) -> None:
+        # results bigger than the whole cache are not worth keeping
+        if len(ids) > SEARCH_CACHE_MAX_IDS:
+            return
+
+        previous = self._search_cache.pop(normalized_query, ())
+        self._search_cache_ids -= len(previous)
+
+        self._search_cache[normalized_query] = ids
+        self._search_cache_ids += len(ids)
+
+        while (
+            len(self._search_cache) > SEARCH_CACHE_SIZE
+            or self._search_cache_ids > SEARCH_CACHE_MAX_IDS
+        ):
+            _, evicted = self._search_cache.popitem(last=False)
+            self._search_cache_ids -= len(evicted)
+
+    def _invalidate_search_cache(self, name_key: str) -> None:
+        # drop only the cached queries whose results contain this name
+        for query in [query for query in self._search_cache if query in name_key]:
+            self._search_cache_ids -= len(self._search_cache.pop(query))
+
+    def _insert_many(self, contacts: List[Contact]) -> None:
+        # contacts are already validated and checked for duplicates
+        self._search_cache.clear()
+        self._search_cache_ids = 0
+
+        with self.transaction():
+            for contact in contacts:
+                self._apply_and_log(("add", contact, None))
+
+    def _sort_indexes(self) -> None:
+        # timsort merges the appended keys with the already sorted ones
+        self._sorted_keys.sort()
+        self._phone_sorted.sort()
+        self._phone_rev_sorted.sort()
+
+    def _apply_and_log(self, op: Operation) -> None:
+        self._apply(op)
+
+        if self._transaction_ops is not None:
+            self._transaction_ops.append(op)
+
+            # the transaction got big, sort once when it ends
+            if len(self._transaction_ops) == SORT_BATCH_MIN and self._pending_removals is None:
+                self._pending_removals = (set(), set(), set())
+        else:
+            self._undo_log.append([op])
+            self._redo_log.clear()
+
+    def _apply(self, op: Operation) -> None:
+        # the contacts are already checked, only change the book and indexes
+        kind, contact, previous = op
+
+        if kind == "add":
+            self.contacts[contact.id] = contact
+            self._index_contact(contact)
+        elif kind == "delete":
+            del self.contacts[contact.id]
+            self._unindex_contact(contact)
+        else:
+            self._replace_contact(previous, contact)
+
+        self._record_change(kind, contact)
+        self.is_changed = True
 
-    def save(self, path: str):
-        # serialize data from json to a Dict[str, dict]
-        data = {contact.id: contact.to_dict() for contact in self.contacts.values()}
+    def _revert(self, ops: List[Operation]) -> None:
+        for kind, contact, previous in reversed(ops):
+            if kind == "add":
+                self._apply(("delete", contact, None))
+            elif kind == "delete":
+                self._apply(("add", contact, None))
+            else:
+                self._apply(("update", previous, contact))
+
+    def _check_no_transaction(self) -> None:
+        if self._transaction_ops is not None:
+            raise ContactError("Undo and redo are not allowed inside a transaction.")
+
+    @contextmanager
+    def _deferred_sort(self, changes: int = 0):
+        # A batch of changes: from SORT_BATCH_MIN changes (known up front, or
+        # reached by a transaction in _apply_and_log) the sorted lists are
+        # sorted once at the end, smaller batches keep them sorted with bisect
+        if self._pending_removals is not None:
+            yield
+            return
+
+        if changes >= SORT_BATCH_MIN:
+            self._pending_removals = (set(), set(), set())
+
+        try:
+            yield
+        finally:
+            if self._pending_removals is not None:
+                self._sort_pending()
+                self._pending_removals = None
+
+    def _sort_pending(self) -> None:
+        # drop the removed items and merge the appended ones, one pass per list
+        if not self._sorted_dirty:
+            return
+
+        sorted_lists = (self._sorted_keys, self._phone_sorted, self._phone_rev_sorted)
+        for sorted_list, removed in zip(sorted_lists, self._pending_removals):
+            if removed:
+                sorted_list[:] = [item for item in sorted_list if item not in removed]
+                removed.clear()
+
+            sorted_list.sort()
+
+        self._sorted_dirty = False
+
+    def _record_change(self, op: str, contact: Contact) -> None:
+        if op != "add":
+            with self._encoded_lock:
+                self._encoded.pop(contact.id, None)
+
+        if hasattr(self.storage, "save_delta"):
+            self._dirty.record(op, contact.id)
+
+    def _index_contact(self, contact: Contact, keep_sorted: bool = True) -> None:
+        self._phone_idx[contact.phone_number] = contact.id
+
+        if contact.email:
+            self._email_idx[contact.email] = contact.id
+            self._domain_idx.setdefault(self._email_domain(contact.email), set()).add(
+                contact.id
+            )
 
-        self.storage.save(data, path)
+        name_key = contact.get_full_name().lower()
+        self._name_keys[contact.id] = name_key
+
+        if self._search_cache:
+            self._invalidate_search_cache(name_key)
+
+        for gram in self._trigrams(name_key):
+            self._name_idx.setdefault(gram, set()).add(contact.id)
+
+        for token in self._name_tokens(name_key):
+            if token not in self._token_ids:
+                self._token_ids[token] = set()
+                self._name_tokens_idx.add(token)
+
+            self._token_ids[token].add(contact.id)
+
+        for i, (sorted_list, item) in enumerate(self._sorted_items(contact)):
+            if self._pending_removals is not None:
+                # an item removed and added back is still in the list
+                if item in self._pending_removals[i]:
+                    self._pending_removals[i].discard(item)
+                else:
+                    sorted_list.append(item)
+                self._sorted_dirty = True
+            elif keep_sorted:
+                insort(sorted_list, item)
+            else:
+                # the caller sorts the lists once at the end (see _sort_indexes)
+                sorted_list.append(item)
+
+    def _unindex_contact(self, contact: Contact) -> None:
+        self._phone_idx.pop(contact.phone_number, None)
+
+        if contact.email:
+            self._email_idx.pop(contact.email, None)
+
+            domain = self._email_domain(contact.email)
+            ids = self._domain_idx.get(domain)
+            if ids is not None:
+                ids.discard(contact.id)
+                if not ids:
+                    del self._domain_idx[domain]
+
+        name_key = self._name_keys.pop(contact.id, "")
+
+        if self._search_cache:
+            self._invalidate_search_cache(name_key)
+
+        for gram in self._trigrams(name_key):
+            ids = self._name_idx.get(gram)
+
+            if ids is None:
+                continue
+
+            ids.discard(contact.id)
+            # drop empty postings so the index doesn't grow with deleted names
+            if not ids:
+                del self._name_idx[gram]
+
+        for token in self._name_tokens(name_key):
+            ids = self._token_ids.get(token)
+
+            if ids is None:
+                continue
+
+            ids.discard(contact.id)
+            if not ids:
+                del self._token_ids[token]
+                self._name_tokens_idx.remove(token)
+
+        for i, (sorted_list, item) in enumerate(self._sorted_items(contact)):
+            if self._pending_removals is not None:
+                self._pending_removals[i].add(item)
+                self._sorted_dirty = True
+            else:
+                self._remove_sorted(sorted_list, item)
+
+    def _sorted_items(self, contact: Contact) -> Tuple[Tuple[list, object], ...]:
+        return (
+            (self._sorted_keys, self._sort_key(contact)),
+            (self._phone_sorted, contact.phone_number),
+            (self._phone_rev_sorted, contact.phone_number[::-1]),
+        )
+
+    def _index_cost(self, normalized_query: str) -> int:
+        # ids _name_candidates starts from: the smallest posting list, or the
+        # whole book for the queries shorter than a trigram
+        grams = self._trigrams(normalized_query)
+
+        if not grams:
+            return len(self._name_keys)
+
+        return min(len(self._name_idx.get(gram, ())) for gram in grams)
+
+    def _name_candidates(self, normalized_query: str):
+        grams = self._trigrams(normalized_query)
+
+        # queries shorter than a trigram can't use the index
+        if not grams:
+            return self._name_keys.keys()
+
+        postings = []
+        for gram in grams:
+            ids = self._name_idx.get(gram)
+
+            if not ids:
+                return set()
+
+            postings.append(ids)
+
+        # intersect starting from the smallest posting list
+        postings.sort(key=len)
+        return set(postings[0]).intersection(*postings[1:])
+
+    @staticmethod
+    def _remove_sorted(sorted_list: list, item) -> None:
+        pos = bisect_left(sorted_list, item)
+        if pos < len(sorted_list) and sorted_list[pos] == item:
+            del sorted_list[pos]
+
+    @staticmethod
+    def _prefix_range(sorted_list: List[str], prefix: str) -> List[str]:
+        lo = bisect_left(sorted_list, prefix)
+        hi = bisect_left(sorted_list, prefix + "\uffff")
+        return sorted_list[lo:hi]
+
+    @staticmethod
+    def _sort_key(contact: Contact) -> Tuple[str, str, str]:
+        return (contact.last_name, contact.first_name, contact.id)
+
+    @staticmethod
+    def _email_domain(email: str) -> str:
+        return email.rpartition("@")[2].lower()
+
+    @staticmethod
+    def _name_tokens(text: str) -> List[str]:
+        return text.lower().split()
+
+    @staticmethod
+    def _trigrams(text: str) -> Set[str]:
+        return {text[i : i + 3] for i in range(len(text) - 2)}
+
+    def export(self, fmt: str, fp: IO[str]) -> int:
+        # Stream the contacts in list order to fp as csv, ndjson, vcard3 or
+        # vcard4 (see exporters.EXPORT_FORMATS) and return how many were written
+        return export_contacts(self.iter_contacts(), fmt, fp)
+
+    def save(self, path: str):
         # if it fails, the storage will raise a StorageError
+        self._write_snapshot(self._take_snapshot(path))
+
+    def _take_snapshot(self, path: str) -> "SaveSnapshot":
+        # Cheap copy of what has to be saved: the contacts dict is copied by
+        # reference (updates replace Contact objects, they don't mutate them),
+        # the changed ids are swapped for a new set.
+        # Writing it (_write_snapshot) can then run on another thread.
+        changes = None
+        if hasattr(self.storage, "save_delta") and path == self._path:
+            changes = self._dirty
+
+        self._dirty = ChangeSet()
+        snapshot = SaveSnapshot(path, dict(self.contacts), changes)
+        self._path = path
         self.is_changed = False
 
-    def load(self, path: str):
-        contacts_loaded = self.storage.load(path)
+        return snapshot
+
+    def _write_snapshot(self, snapshot: "SaveSnapshot") -> None:
+        try:
+            if snapshot.changes is None:
+                self._save_all(snapshot)
+            elif snapshot.changes and self._save_delta(snapshot):
+                # the storage asks for a full rewrite (e.g. a long journal)
+                self._save_all(snapshot)
+
+        except StorageError:
+            # the snapshot was not written, the next save rewrites the whole book
+            self._path = None
+            self.is_changed = True
+            raise
+
+    def _save_delta(self, snapshot: "SaveSnapshot") -> bool:
+        # only write what changed since the last load/save of this path
+        changes = snapshot.changes
+        contacts = snapshot.contacts
+
+        return self.storage.save_delta(
+            {id: contacts[id].to_dict() for id in changes.added},
+            {id: contacts[id].to_dict() for id in changes.updated},
+            changes.deleted,
+            snapshot.path,
+        )
 
-        self.contacts.clear()
-        self._phone_idx.clear()
-        self._email_idx.clear()
+    def _save_all(self, snapshot: "SaveSnapshot"):
+        if hasattr(self.storage, "save_encoded"):
+            entries = map(self._encoded_entry, snapshot.contacts.values())
+            self.storage.save_encoded(entries, snapshot.path)
+            return
 
-        self.contacts = {
-            id: Contact.from_dict(contact) for id, contact in contacts_loaded.items()
-        }
+        # serialize data from json to a Dict[str, dict]
+        data = {id: contact.to_dict() for id, contact in snapshot.contacts.items()}
 
-        self._phone_idx = {
-            contact.phone_number: contact.id for contact in self.contacts.values()
-        }
+        self.storage.save(data, snapshot.path)
 
-        self._email_idx = {
-            contact.email: contact.id
-            for contact in self.contacts.values()
-            if contact.email
-        }
+    def _encoded_entry(self, contact: Contact) -> str:
+        # the snapshots are written in order and the entries of the changed
+        # contacts are dropped, a cached entry is the one of this contact
+        entry = self._encoded.get(contact.id)
+        if entry is not None:
+            return entry
+
+        entry = self.storage.encode_entry(contact.id, contact.to_dict())
 
+        # the snapshot may be older than the book, keep only current entries
+        with self._encoded_lock:
+            if self.contacts.get(contact.id) is contact:
+                self._encoded[contact.id] = entry
+
+        return entry
+
+    def load(self, path: str, progress: Optional[Callable[[int, int], None]] = None):
+        # Storages with iter_load stream the contacts one by one, so contacts
+        # and indexes are built in a single pass without the whole dict in memory
+        if hasattr(self.storage, "iter_load"):
+            contacts_loaded = self.storage.iter_load(path, progress)
+        else:
+            contacts_loaded = self.storage.load(path).items()
+
+        old_state = dict(vars(self))
+        self._reset_indexes()
+
+        try:
+            for id, contact_data in contacts_loaded:
+                contact = Contact.from_dict(contact_data)
+                self.contacts[id] = contact
+                self._index_contact(contact, keep_sorted=False)
+
+        except Exception:
+            # a file failing half way must not leave a half loaded book
+            vars(self).update(old_state)
+            raise
+
+        self._sort_indexes()
+
+        self._dirty = ChangeSet()
+        self._clear_history()
+        self._path = path
         self.is_changed = False
 
+    def _clear_history(self) -> None:
+        # the operations of another book can't be undone on this one
+        self._undo_log.clear()
+        self._redo_log.clear()
+
     def __len__(self):
         return len(self.contacts)
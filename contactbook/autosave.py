@@ -0,0 +1,118 @@
+import threading
+from typing import List, Optional
+from .addressbook import AddressBook, SaveSnapshot
+from .contact_exceptions import StorageError
+
+
+class BackgroundSaver:
+    # Saves an AddressBook on a background thread so the command loop doesn't
+    # wait for the serialization and the disk.
+    # request_save only takes a snapshot of the book (a dict copy), the thread
+    # writes it; back to back requests for the same path are coalesced into
+    # one write. With autosave_interval (or set_autosave) the book is also
+    # saved to path every that many seconds if it changed (is_changed); the
+    # saver thread takes that snapshot itself, so autosave needs a book that
+    # can be read from another thread (ThreadSafeAddressBook).
+    def __init__(
+        self,
+        addressbook: AddressBook,
+        path: Optional[str] = None,
+        autosave_interval: Optional[float] = None,
+    ):
+        self.addressbook = addressbook
+        self.path = path
+        self.autosave_interval = autosave_interval
+        self.saves = 0
+        self.last_error: Optional[StorageError] = None
+
+        self._pending: List[SaveSnapshot] = []
+        self._writing = False
+        self._closed = False
+        self._reconfigured = False
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def request_save(self, path: Optional[str] = None) -> None:
+        path = path or self.path
+        if not path:
+            raise StorageError("Save path is empty.")
+
+        self.path = path
+        snapshot = self.addressbook._take_snapshot(path)
+
+        with self._cond:
+            if self._pending and self._pending[-1].path == path:
+                self._pending[-1] = self._pending[-1].merge(snapshot)
+            else:
+                self._pending.append(snapshot)
+
+            self._cond.notify_all()
+
+    def set_autosave(self, interval: Optional[float], path: Optional[str] = None) -> None:
+        # start autosaving to path every interval seconds, None stops it
+        if interval is not None and not (path or self.path):
+            raise StorageError("Save path is empty.")
+
+        with self._cond:
+            self.autosave_interval = interval
+            self.path = path or self.path
+            self._reconfigured = True
+            self._cond.notify_all()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        # wait for the requested saves to be written, False on timeout
+        with self._cond:
+            return self._cond.wait_for(
+                lambda: not self._pending and not self._writing, timeout
+            )
+
+    def close(self) -> None:
+        self.flush()
+
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+        self._thread.join()
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                woken = self._cond.wait_for(
+                    lambda: self._pending or self._closed or self._reconfigured,
+                    self.autosave_interval,
+                )
+
+                if self._closed and not self._pending:
+                    return
+
+                if self._reconfigured:
+                    # wait again with the new interval
+                    self._reconfigured = False
+                    continue
+
+                if not woken:
+                    # autosave interval elapsed without requests
+                    snapshot = None
+                else:
+                    snapshot = self._pending.pop(0)
+                    self._writing = True
+
+            if snapshot is None:
+                if self.addressbook.is_changed and self.path:
+                    self.request_save()
+                continue
+
+            try:
+                self.addressbook._write_snapshot(snapshot)
+                self.saves += 1
+                self.last_error = None
+
+            except StorageError as e:
+                self.last_error = e
+
+            finally:
+                with self._cond:
+                    self._writing = False
+                    self._cond.notify_all()
@@ -0,0 +1,286 @@
+import os
+import sys
+import json
+import argparse
+from typing import IO, List, Optional
+from .addressbook import AddressBook, ImportReport
+from .contacts import Contact
+from .contact_validators import validate_record
+from .importers import import_file
+from .exporters import EXPORT_EXTENSIONS, EXPORT_FORMATS
+from .dedupe import DEFAULT_THRESHOLD
+from .sqlite_addressbook import SqliteAddressBook
+from .snapshot_addressbook import SnapshotAddressBook
+from .storage import JsonStorage, SnapshotStorage, SqliteStorage, Storage
+from .contact_exceptions import ContactError, ContactNotFoundError, StorageError
+
+# commands that change the book, the subcommands save the file after them
+WRITE_COMMANDS = ("add", "update", "delete", "import", "dedupe", "undo", "redo")
+
+
+def storage_for(path: str) -> Storage:
+    # the file extension picks the format, everything else is a json book
+    if path.endswith((".db", ".sqlite")):
+        return SqliteStorage()
+
+    if path.endswith(".cbk"):
+        return SnapshotStorage()
+
+    return JsonStorage()
+
+
+def open_book(path: str, create: bool = False) -> AddressBook:
+    # sqlite and snapshot books are opened lazily instead of loaded in memory
+    storage = storage_for(path)
+
+    if isinstance(storage, SqliteStorage):
+        addressbook = SqliteAddressBook(storage)
+        if create:
+            # creates the database, load then reuses the connection
+            addressbook.storage.connect(path, create=True)
+    elif isinstance(storage, SnapshotStorage):
+        addressbook = SnapshotAddressBook(storage)
+    else:
+        addressbook = AddressBook(storage)
+
+    if create and not os.path.exists(path):
+        return addressbook
+
+    addressbook.load(path)
+    return addressbook
+
+
+def export_book(addressbook: AddressBook, path: str, fmt: Optional[str] = None) -> int:
+    # Write the book to path in the format of its extension (or fmt): csv,
+    # ndjson and vcard are streamed by the exporters, for json, sqlite and
+    # snapshot books this is also the converter between them
+    fmt = fmt or EXPORT_EXTENSIONS.get(os.path.splitext(path)[1])
+
+    if fmt is not None:
+        try:
+            # csv and vcard have their own line endings
+            with open(path, "w", newline="", encoding="utf-8") as file:
+                return addressbook.export(fmt, file)
+
+        except OSError as e:
+            raise StorageError(f"Could not write '{path}': {e}") from e
+
+    # written by the storage directly: addressbook.save would move the book
+    # to path and mark it saved, the changes would never reach its own file
+    storage = storage_for(path)
+
+    if hasattr(storage, "save_encoded"):
+        entries = (storage.encode_entry(c.id, c.to_dict()) for c in addressbook.iter_contacts())
+        storage.save_encoded(entries, path)
+    else:
+        data = {contact.id: contact.to_dict() for contact in addressbook.iter_contacts()}
+        storage.save(data, path)
+
+    return len(addressbook)
+
+
+def import_result(report: ImportReport) -> dict:
+    return {
+        "added": len(report.added),
+        "errors": [{"row": row, "error": error} for row, error in report.errors],
+        "rows_per_sec": round(report.rows_per_sec),
+    }
+
+
+def run_command(addressbook: AddressBook, command: dict, path: str):
+    # Run one command given as a dict ({"cmd": "search", "query": "ein"}) on
+    # the book stored at path and return a json serializable result, errors are
+    # raised as ContactError or StorageError.
+    # Shared by the subcommands and the --stdin mode.
+    cmd = command.get("cmd")
+
+    if cmd == "add":
+        contact = Contact(**validate_record(command))
+        addressbook.add_contact(contact)
+        return contact.to_dict()
+
+    if cmd == "get":
+        return _find(addressbook, command.get("id")).to_dict()
+
+    if cmd == "update":
+        contact = _find(addressbook, command.get("id"))
+        # fields that are not given keep their current value
+        record = {**contact.to_dict(), **command}
+        updated_contact = Contact(**validate_record(record))
+        addressbook.update_contact(contact, updated_contact)
+        return updated_contact.to_dict()
+
+    if cmd == "delete":
+        contact = _find(addressbook, command.get("id"))
+        addressbook.delete_contact(contact)
+        return contact.to_dict()
+
+    if cmd == "search":
+        try:
+            contacts = addressbook.search_contact(command.get("query", ""))
+        except ContactNotFoundError:
+            contacts = []
+        return [contact.to_dict() for contact in contacts]
+
+    if cmd == "list":
+        contacts = addressbook.list_contacts(
+            offset=command.get("offset", 0), limit=command.get("limit")
+        )
+        return [contact.to_dict() for contact in contacts]
+
+    if cmd == "import":
+        report = import_file(
+            addressbook,
+            command.get("path", ""),
+            atomic=command.get("atomic", False),
+            workers=command.get("workers", 0),
+        )
+        return import_result(report)
+
+    if cmd == "dedupe":
+        # lists the merge suggestions, with apply also merges them
+        suggestions = addressbook.find_duplicates(command.get("threshold", DEFAULT_THRESHOLD))
+        return {
+            "suggestions": [
+                {
+                    "keep": suggestion.keep.to_dict(),
+                    "duplicate": suggestion.duplicate.to_dict(),
+                    "score": suggestion.score,
+                }
+                for suggestion in suggestions
+            ],
+            "merged": addressbook.apply_merges(suggestions) if command.get("apply") else 0,
+        }
+
+    if cmd in ("undo", "redo"):
+        # only useful in --stdin mode and on the server, where the book stays loaded
+        done = addressbook.undo() if cmd == "undo" else addressbook.redo()
+        return {"done": done}
+
+    if cmd == "save":
+        addressbook.save(command.get("path") or path)
+        return {"saved": len(addressbook)}
+
+    if cmd == "export":
+        return {"saved": export_book(addressbook, command.get("path", ""), command.get("format"))}
+
+    raise ContactError(f"Unknown command '{cmd}'")
+
+
+def run_stdin(
+    addressbook: AddressBook, path: str, stdin: IO[str], stdout: IO[str]
+) -> int:
+    # One json command per line in, one json result per line out. The book
+    # is loaded once and saved at the end if something changed.
+    failures = 0
+
+    for line in stdin:
+        if not line.strip():
+            continue
+
+        try:
+            command = json.loads(line)
+            if not isinstance(command, dict):
+                raise ContactError("Expected a json object")
+
+            response = {"ok": True, "result": run_command(addressbook, command, path)}
+
+        except (json.JSONDecodeError, ContactError, StorageError, TypeError) as e:
+            failures += 1
+            response = {"ok": False, "error": str(e)}
+
+        stdout.write(json.dumps(response) + "\n")
+        stdout.flush()
+
+    if addressbook.is_changed:
+        addressbook.save(path)
+
+    return 1 if failures else 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="contactbook",
+        description="Run without arguments for the interactive contact book.",
+    )
+    parser.add_argument("--file", required=True, help="contact book (.json, .db or .cbk)")
+    parser.add_argument(
+        "--stdin",
+        action="store_true",
+        help="read newline-delimited json commands from stdin",
+    )
+    subparsers = parser.add_subparsers(dest="cmd")
+
+    add = subparsers.add_parser("add", help="add a contact")
+    add.add_argument("--first-name", dest="first_name", required=True)
+    add.add_argument("--last-name", dest="last_name", required=True)
+    add.add_argument("--phone", dest="phone_number", required=True)
+    add.add_argument("--email")
+
+    search = subparsers.add_parser("search", help="search contacts by name")
+    search.add_argument("query")
+
+    list_ = subparsers.add_parser("list", help="list contacts sorted by name")
+    list_.add_argument("--offset", type=int, default=0)
+    list_.add_argument("--limit", type=int)
+
+    delete = subparsers.add_parser("delete", help="delete a contact by id")
+    delete.add_argument("id")
+
+    import_ = subparsers.add_parser("import", help="import contacts from a csv or vcard (.vcf) file")
+    import_.add_argument("path")
+    import_.add_argument("--atomic", action="store_true")
+    import_.add_argument("--workers", type=int, default=0)
+
+    dedupe = subparsers.add_parser("dedupe", help="find (and merge) duplicated contacts")
+    dedupe.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    dedupe.add_argument("--apply", action="store_true", help="merge the duplicates found")
+
+    export = subparsers.add_parser(
+        "export",
+        help="write the book to another file (.json, .db, .cbk, .csv, .ndjson or .vcf)",
+    )
+    export.add_argument("path")
+    export.add_argument(
+        "--format", choices=list(EXPORT_FORMATS), help="default: from the path extension"
+    )
+
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    if not args.stdin and args.cmd is None:
+        parser.error("a command or --stdin is required")
+
+    try:
+        addressbook = open_book(
+            args.file, create=args.stdin or args.cmd in WRITE_COMMANDS
+        )
+
+        if args.stdin:
+            return run_stdin(addressbook, args.file, sys.stdin, sys.stdout)
+
+        command = {key: value for key, value in vars(args).items() if value is not None}
+        result = run_command(addressbook, command, args.file)
+
+        if args.cmd in WRITE_COMMANDS and addressbook.is_changed:
+            addressbook.save(args.file)
+
+    except (ContactError, StorageError) as e:
+        print(json.dumps({"ok": False, "error": str(e)}))
+        return 1
+
+    print(json.dumps({"ok": True, "result": result}))
+    return 0
+
+
+def _find(addressbook: AddressBook, id: Optional[str]) -> Contact:
+    contact = addressbook.get_contact(id) if id else None
+
+    if contact is None:
+        raise ContactNotFoundError("Contact not found")
+
+    return contact
@@ -24,6 +24,9 @@ class DuplicateContactError(ContactError):
 class ContactNotFoundError(ContactError):
     """Contact was not found."""
 
+class UnsupportedOperationError(ContactError):
+    """The operation is not available for this kind of book."""
+
 class StorageError(Exception):
     """Generic persistence failure."""
 
@@ -1,6 +1,9 @@
 
 import re
+from functools import lru_cache
+from typing import Iterable, Iterator, Optional, Union
 from .contact_exceptions import (
+    ContactValidationError,
     InvalidEmailError,
     InvalidPhoneError,
     MissingRequiredFieldError,
@@ -10,9 +13,15 @@ EMAIL_PATTERN = r"^[\w\.]+@([\w]+\.)+[\w]{2,3}$"
 PHONE_NUMBER_PATTERN = r"^(?:\+39\s?)?3\d{2}\s?\d{3}\s?\d{4}$"
 PREFIX = "+39"
 
+# compiled once, the validators run for every imported row
+EMAIL_RE = re.compile(EMAIL_PATTERN)
+PHONE_NUMBER_RE = re.compile(PHONE_NUMBER_PATTERN)
+
 # TODO: In the MissingRequiredFieldError I could add a field_name parameter in order to have something to print out and be specific, I have to understand how I should add it 
 
 
+# names repeat a lot in big imports, don't title-case the same one again
+@lru_cache(maxsize=16384)
 def validate_name(name: str) -> str:
     if not name:
         raise MissingRequiredFieldError("Missing required field")
@@ -23,24 +32,79 @@ def validate_phone_number(phone_number: str) -> str:
     if not phone_number:
         raise MissingRequiredFieldError("Phone is require")
 
-    if not re.match(PHONE_NUMBER_PATTERN, phone_number.strip()):
+    phone_number = phone_number.strip()
+
+    if not PHONE_NUMBER_RE.match(phone_number):
         raise InvalidPhoneError(
             "Invalid phone: phone must contain only digits with optional leading + (e.g. +393491234567)"
         )
 
-    if not phone_number.strip().startswith(PREFIX):
-        phone_number = PREFIX + phone_number
+    # the pattern allows one whitespace between the groups, drop them
+    phone_number = "".join(phone_number.split())
 
-    phone_number_parts = phone_number.split()
+    if not phone_number.startswith(PREFIX):
+        phone_number = PREFIX + phone_number
 
-    return "".join(phone_number_parts)
+    return phone_number
 
 
 def validate_email(email: str | None) -> str | None:
     if not email:
         return
 
-    if not re.match(EMAIL_PATTERN, email):
+    if not EMAIL_RE.match(email):
         raise InvalidEmailError("Invalid email (expected email like name@example.com)")
 
     return email
+
+
+# validator of each Contact field, for validate_record(record, fields)
+FIELD_VALIDATORS = {
+    "first_name": validate_name,
+    "last_name": validate_name,
+    "phone_number": validate_phone_number,
+    "email": validate_email,
+}
+
+
+def validate_record(record: dict, fields: Optional[Iterable[str]] = None) -> dict:
+    # validate a raw record (e.g. a csv row) and return the Contact fields,
+    # only the given ones if fields is set (the prompts ask one at a time)
+    try:
+        if fields is not None:
+            return {field: FIELD_VALIDATORS[field](_field_value(record, field)) for field in fields}
+
+        return {
+            "first_name": validate_name(record.get("first_name")),
+            "last_name": validate_name(record.get("last_name")),
+            "phone_number": validate_phone_number(_field_value(record, "phone_number")),
+            "email": validate_email(record.get("email")),
+        }
+
+    except (AttributeError, TypeError) as e:
+        # non string values (e.g. numbers) can't be validated
+        raise ContactValidationError(f"Invalid field value: {e}") from e
+
+
+def _field_value(record: dict, field: str):
+    # the imported files can name the phone column "phone"
+    if field == "phone_number":
+        return record.get("phone_number") or record.get("phone")
+
+    return record.get(field)
+
+
+def validate_many(
+    records: Iterable[dict], fields: Optional[Iterable[str]] = None
+) -> Iterator[Union[dict, str]]:
+    # For each record yield the Contact fields or the validation error message,
+    # used by the bulk imports that report errors per row instead of raising
+    # and by the prompts (helpers.ask_field)
+    if fields is not None:
+        fields = tuple(fields)
+
+    for record in records:
+        try:
+            yield validate_record(record, fields)
+        except ContactValidationError as e:
+            yield str(e)
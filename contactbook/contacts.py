@@ -1,9 +1,11 @@
+from sys import intern
 from uuid import uuid4
 from typing import Optional
 from dataclasses import dataclass, field
 
 
-@dataclass
+# slots: no per-instance __dict__, contacts are kept in memory by the million
+@dataclass(slots=True)
 class Contact:
     first_name: str
     last_name: str
@@ -11,6 +13,10 @@ class Contact:
     id: str = field(default_factory=lambda: str(uuid4()))
     email: Optional[str] = None
 
+    def __post_init__(self):
+        # names repeat a lot across a book, share a single copy of each one
+        self.first_name = intern(self.first_name)
+        self.last_name = intern(self.last_name)
 
     def get_full_name(self) -> str:
         return f"{self.first_name.capitalize()} {self.last_name.capitalize()}"
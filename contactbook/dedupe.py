@@ -0,0 +1,158 @@
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from .contacts import Contact
+from .fuzzy import levenshtein
+
+PHONE_SUFFIX_DIGITS = 7  # phones ending with the same digits share a block
+# bigger blocks are skipped: a key shared by that many contacts (a very common
+# name, an "info" email) doesn't tell the same person, and comparing all of
+# them would make the pairs grow with the square of the block
+MAX_BLOCK_SIZE = 50
+DEFAULT_THRESHOLD = 0.6
+
+# weights of the name and of the best phone or email evidence in the score
+NAME_WEIGHT = 0.6
+CONTACT_WEIGHT = 0.4
+PHONE_SUFFIX_SCORE = 0.8
+EMAIL_LOCAL_SCORE = 0.7
+
+
+@dataclass
+class MergeSuggestion:
+    keep: Contact
+    duplicate: Contact
+    score: float  # from 0 to 1
+
+
+def find_duplicates(
+    contacts: Iterable[Contact], threshold: float = DEFAULT_THRESHOLD
+) -> List[MergeSuggestion]:
+    # Pairs of contacts that are probably the same person, best score first.
+    # Only contacts sharing a blocking key (see blocking_keys) are compared,
+    # instead of every contact with every other one.
+    blocks: Dict[str, List[Contact]] = {}
+    for contact in contacts:
+        for key in blocking_keys(contact):
+            blocks.setdefault(key, []).append(contact)
+
+    compared: Set[Tuple[str, str]] = set()
+    suggestions = []
+
+    for block in blocks.values():
+        if len(block) > MAX_BLOCK_SIZE:
+            continue
+
+        for i, contact in enumerate(block):
+            for other in block[i + 1 :]:
+                pair = (contact.id, other.id) if contact.id < other.id else (other.id, contact.id)
+                if pair in compared:
+                    continue
+                compared.add(pair)
+
+                score = score_pair(contact, other)
+                if score >= threshold:
+                    keep, duplicate = _pick_keep(contact, other)
+                    suggestions.append(MergeSuggestion(keep, duplicate, score))
+
+    suggestions.sort(key=lambda s: (-s.score, s.keep.id, s.duplicate.id))
+    return suggestions
+
+
+def blocking_keys(contact: Contact) -> Set[str]:
+    # the name tokens in any order ("Mario Rossi" and "Rossi Mario" share
+    # it), the last digits of the phone and the email local part
+    keys = {"name:" + " ".join(_name_tokens(contact)), "phone:" + _phone_suffix(contact)}
+
+    if contact.email:
+        keys.add("email:" + _email_local(contact.email))
+
+    return keys
+
+
+def score_pair(a: Contact, b: Contact) -> float:
+    name_a = " ".join(_name_tokens(a))
+    name_b = " ".join(_name_tokens(b))
+    if name_a == name_b:
+        name_score = 1.0
+    else:
+        name_score = 1 - levenshtein(name_a, name_b) / max(len(name_a), len(name_b))
+
+    contact_score = 0.0
+    if a.phone_number == b.phone_number:
+        contact_score = 1.0
+    elif _phone_suffix(a) == _phone_suffix(b):
+        contact_score = PHONE_SUFFIX_SCORE
+
+    if a.email and b.email:
+        if a.email.lower() == b.email.lower():
+            contact_score = 1.0
+        elif _email_local(a.email) == _email_local(b.email):
+            contact_score = max(contact_score, EMAIL_LOCAL_SCORE)
+
+    # the same name alone is not the same person, two "Mario Rossi" are common
+    if not contact_score:
+        return 0.0
+
+    return round(NAME_WEIGHT * name_score + CONTACT_WEIGHT * contact_score, 3)
+
+
+def merge_groups(suggestions: Iterable[MergeSuggestion]) -> List[List[Contact]]:
+    # Join the suggested pairs into groups of contacts to merge (if a is a
+    # duplicate of b and b of c, the three are one group), the first contact
+    # of each group is the one to keep
+    parent: Dict[str, str] = {}
+    contacts: Dict[str, Contact] = {}
+
+    def find(id: str) -> str:
+        while parent[id] != id:
+            parent[id] = parent[parent[id]]
+            id = parent[id]
+        return id
+
+    for suggestion in suggestions:
+        for contact in (suggestion.keep, suggestion.duplicate):
+            contacts.setdefault(contact.id, contact)
+            parent.setdefault(contact.id, contact.id)
+
+        root_keep, root_duplicate = find(suggestion.keep.id), find(suggestion.duplicate.id)
+        if root_keep != root_duplicate:
+            # the root is the contact to keep of the best scored pair
+            parent[root_duplicate] = root_keep
+
+    groups: Dict[str, List[Contact]] = {}
+    for id, contact in contacts.items():
+        groups.setdefault(find(id), []).append(contact)
+
+    return [
+        [contacts[root]] + [c for c in group if c.id != root]
+        for root, group in groups.items()
+    ]
+
+
+def merged_contact(keep: Contact, duplicates: Iterable[Contact]) -> Contact:
+    # keep's fields, the email of the first duplicate having one if keep has none
+    email = keep.email or next((c.email for c in duplicates if c.email), None)
+    return Contact(keep.first_name, keep.last_name, keep.phone_number, id=keep.id, email=email)
+
+
+def _pick_keep(a: Contact, b: Contact) -> Tuple[Contact, Contact]:
+    # keep the contact with an email, or the first in list order
+    if bool(a.email) != bool(b.email):
+        return (a, b) if a.email else (b, a)
+
+    key_a = (a.last_name, a.first_name, a.id)
+    key_b = (b.last_name, b.first_name, b.id)
+    return (a, b) if key_a <= key_b else (b, a)
+
+
+def _name_tokens(contact: Contact) -> List[str]:
+    return sorted(f"{contact.first_name} {contact.last_name}".lower().split())
+
+
+def _phone_suffix(contact: Contact) -> str:
+    return contact.phone_number[-PHONE_SUFFIX_DIGITS:]
+
+
+def _email_local(email: Optional[str]) -> str:
+    # "Mario.Rossi@x.it" and "mariorossi@y.com" have the same local part
+    return (email or "").partition("@")[0].lower().replace(".", "")
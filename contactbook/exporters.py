@@ -0,0 +1,147 @@
+import csv
+from itertools import islice
+from json.encoder import encode_basestring_ascii
+from typing import IO, Callable, Dict, Iterable, Iterator
+from .contacts import Contact
+from .contact_exceptions import StorageError
+
+# lines joined per write, the output is streamed in batches this big
+WRITE_BATCH = 1000
+CSV_HEADER = ("id", "first_name", "last_name", "phone", "email")
+VCARD_LINE_LENGTH = 75  # octets, longer lines are folded (RFC 6350 3.2)
+VCARD_ESCAPES = str.maketrans({"\\": "\\\\", ",": "\\,", ";": "\\;", "\n": "\\n"})
+
+
+def export_csv(contacts: Iterable[Contact], fp: IO[str]) -> int:
+    # Same columns as Contact.to_dict, so the file can be imported back with
+    # importers.import_csv. Open fp with newline="" like for csv.writer.
+    writer = csv.writer(fp)
+    writer.writerow(CSV_HEADER)
+
+    count = 0
+    for batch in _batches(contacts):
+        writer.writerows(
+            (c.id, c.first_name, c.last_name, c.phone_number, c.email or "") for c in batch
+        )
+        count += len(batch)
+
+    return count
+
+
+def export_ndjson(contacts: Iterable[Contact], fp: IO[str]) -> int:
+    # one json object per line, with the keys of Contact.to_dict
+    return _write_lines(fp, map(_ndjson_line, contacts))
+
+
+def export_vcard(contacts: Iterable[Contact], fp: IO[str], version: str = "3.0") -> int:
+    # vCard 3.0 (RFC 2426) or 4.0 (RFC 6350), lines end with CRLF as both
+    # require: open fp with newline="" so they are not translated
+    if version not in ("3.0", "4.0"):
+        raise StorageError(f"Unsupported vCard version '{version}'.")
+
+    return _write_lines(fp, (_vcard(contact, version) for contact in contacts))
+
+
+EXPORT_FORMATS: Dict[str, Callable[[Iterable[Contact], IO[str]], int]] = {
+    "csv": export_csv,
+    "ndjson": export_ndjson,
+    "vcard3": lambda contacts, fp: export_vcard(contacts, fp, "3.0"),
+    "vcard4": lambda contacts, fp: export_vcard(contacts, fp, "4.0"),
+}
+EXPORT_EXTENSIONS = {".csv": "csv", ".ndjson": "ndjson", ".jsonl": "ndjson", ".vcf": "vcard3"}
+
+
+def export_contacts(contacts: Iterable[Contact], fmt: str, fp: IO[str]) -> int:
+    # write the contacts to fp in one of EXPORT_FORMATS and return how many
+    exporter = EXPORT_FORMATS.get(fmt)
+
+    if exporter is None:
+        raise StorageError(
+            f"Unknown export format '{fmt}', expected one of {', '.join(EXPORT_FORMATS)}."
+        )
+
+    return exporter(contacts, fp)
+
+
+def _batches(contacts: Iterable[Contact]) -> Iterator[list]:
+    contacts = iter(contacts)
+    while True:
+        batch = list(islice(contacts, WRITE_BATCH))
+        if not batch:
+            return
+        yield batch
+
+
+def _write_lines(fp: IO[str], lines: Iterable[str]) -> int:
+    # few big writes instead of one per contact, memory stays at one batch
+    count = 0
+    for batch in _batches(lines):
+        fp.write("".join(batch))
+        count += len(batch)
+
+    return count
+
+
+def _ndjson_line(contact: Contact) -> str:
+    # formatted directly, no dict per contact
+    return '{"id": %s, "first_name": %s, "last_name": %s, "phone": %s, "email": %s}\n' % (
+        encode_basestring_ascii(contact.id),
+        encode_basestring_ascii(contact.first_name),
+        encode_basestring_ascii(contact.last_name),
+        encode_basestring_ascii(contact.phone_number),
+        "null" if contact.email is None else encode_basestring_ascii(contact.email),
+    )
+
+
+def _vcard(contact: Contact, version: str) -> str:
+    first_name = _vcard_escape(contact.first_name)
+    last_name = _vcard_escape(contact.last_name)
+
+    if version == "4.0":
+        phone = f"TEL;VALUE=uri;TYPE=cell:tel:{contact.phone_number}"
+        email = f"EMAIL:{contact.email}" if contact.email else None
+    else:
+        phone = f"TEL;TYPE=CELL:{contact.phone_number}"
+        email = f"EMAIL;TYPE=INTERNET:{contact.email}" if contact.email else None
+
+    lines = [
+        "BEGIN:VCARD",
+        f"VERSION:{version}",
+        f"UID:{_vcard_escape(contact.id)}",
+        f"FN:{first_name} {last_name}",
+        f"N:{last_name};{first_name};;;",
+        phone,
+    ]
+    if email:
+        lines.append(email)
+    lines.append("END:VCARD")
+
+    return "".join(_vcard_fold(line) + "\r\n" for line in lines)
+
+
+def _vcard_escape(text: str) -> str:
+    return text.translate(VCARD_ESCAPES)
+
+
+def _vcard_fold(line: str) -> str:
+    # fold on octets, a continuation line starts with a space
+    if len(line) <= VCARD_LINE_LENGTH and line.isascii():
+        return line
+
+    encoded = line.encode()
+    if len(encoded) <= VCARD_LINE_LENGTH:
+        return line
+
+    parts = []
+    start = 0
+    limit = VCARD_LINE_LENGTH
+    while start < len(encoded):
+        end = min(start + limit, len(encoded))
+        # don't cut a multi-byte utf-8 character
+        while end < len(encoded) and encoded[end] & 0xC0 == 0x80:
+            end -= 1
+        parts.append(encoded[start:end].decode())
+        start = end
+        limit = VCARD_LINE_LENGTH - 1
+
+    return "\r\n ".join(parts)
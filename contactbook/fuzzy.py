@@ -0,0 +1,95 @@
+from typing import Dict, List, Set, Tuple
+
+MAX_DISTANCE = 2
+
+
+def levenshtein(a: str, b: str) -> int:
+    # classic dynamic programming edit distance, keeping only one row
+    if len(a) < len(b):
+        a, b = b, a
+
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, start=1):
+        current = [i]
+        for j, char_b in enumerate(b, start=1):
+            current.append(
+                min(
+                    previous[j] + 1,  # deletion
+                    current[j - 1] + 1,  # insertion
+                    previous[j - 1] + (char_a != char_b),  # substitution
+                )
+            )
+        previous = current
+
+    return previous[-1]
+
+
+def deletes(word: str, max_distance: int) -> Set[str]:
+    # every string obtained removing up to max_distance chars from word
+    variants = {word}
+    edges = {word}
+
+    for _ in range(max_distance):
+        edges = {
+            variant[:i] + variant[i + 1 :]
+            for variant in edges
+            for i in range(len(variant))
+        }
+        variants |= edges
+
+    return variants
+
+
+class SymSpellIndex:
+    # Symmetric delete index: two words within n edits share at least one
+    # variant obtained deleting up to n chars from each of them, so a lookup
+    # is a few dict hits on the deletes of the query instead of comparing it
+    # with every word (candidates are then checked with levenshtein)
+    def __init__(self, max_distance: int = MAX_DISTANCE):
+        self.max_distance = max_distance
+        self._words: Set[str] = set()
+        self._deletes: Dict[str, Set[str]] = {}  # maps variant -> words
+
+    def add(self, word: str) -> None:
+        if word in self._words:
+            return
+
+        self._words.add(word)
+        for variant in deletes(word, self.max_distance):
+            self._deletes.setdefault(variant, set()).add(word)
+
+    def remove(self, word: str) -> None:
+        if word not in self._words:
+            return
+
+        self._words.discard(word)
+        for variant in deletes(word, self.max_distance):
+            words = self._deletes.get(variant)
+            if words is None:
+                continue
+
+            words.discard(word)
+            if not words:
+                del self._deletes[variant]
+
+    def search(self, word: str, max_distance: int) -> List[Tuple[int, str]]:
+        max_distance = min(max_distance, self.max_distance)
+
+        candidates: Set[str] = set()
+        for variant in deletes(word, max_distance):
+            candidates |= self._deletes.get(variant, set())
+
+        found = []
+        for candidate in candidates:
+            # skip the edit distance when the lengths alone are too far apart
+            if abs(len(candidate) - len(word)) > max_distance:
+                continue
+
+            distance = levenshtein(word, candidate)
+            if distance <= max_distance:
+                found.append((distance, candidate))
+
+        return sorted(found)
+
+    def __len__(self):
+        return len(self._words)
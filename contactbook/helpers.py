@@ -1,51 +1,35 @@
-from .addressbook import AddressBook
+import sys
+from itertools import islice
+from typing import Iterable
+from .addressbook import AddressBook, ImportReport
+from .importers import CHUNK_SIZE as IMPORT_CHUNK_SIZE
 from .contacts import Contact
-from .contact_validators import validate_name, validate_email, validate_phone_number
-from .contact_exceptions import (
-    ContactNotFoundError,
-    InvalidEmailError,
-    InvalidPhoneError,
-    MissingRequiredFieldError,
-)
+from .contact_validators import validate_many
+from .contact_exceptions import ContactNotFoundError
 
 
-def ask_name(prompt: str) -> str:
+def ask_field(prompt: str, field: str):
+    # ask until the answer is valid, with the same validation as the imports
     while True:
-        try:
-            name = validate_name(input(prompt))
-        except MissingRequiredFieldError as e:
-            print(e)
-            continue
+        result = next(validate_many([{field: input(prompt)}], fields=(field,)))
 
-        return name
+        if isinstance(result, str):
+            print(result)
+            continue
 
+        return result[field]
 
-def ask_phone_number() -> str:
-    while True:
-        try:
-            phone_number = validate_phone_number(input("Phone number (required): "))
 
-        except MissingRequiredFieldError as e:
-            print(e)
-            continue
+def ask_name(prompt: str) -> str:
+    return ask_field(prompt, "first_name")
 
-        except InvalidPhoneError as e:
-            print(e)
-            continue
 
-        return phone_number
+def ask_phone_number() -> str:
+    return ask_field("Phone number (required): ", "phone_number")
 
 
 def ask_email() -> str | None:
-    while True:
-        try:
-            email = validate_email(input("Email (optional): "))
-
-        except InvalidEmailError as e:
-            print(e)
-            continue
-
-        return email
+    return ask_field("Email (optional): ", "email")
 
 
 def prompt_contact_fields() -> dict:
@@ -63,18 +47,95 @@ def prompt_contact_fields() -> dict:
         }
 
 
-def render_contacts(contacts):
-    if not contacts:
-        print("No contacts in address book.")
+LARGE_FILE_SIZE = 10 * 1024 * 1024
+
+
+def print_load_progress(done: int, total: int) -> None:
+    # small books load instantly, only show the progress for big files
+    if total < LARGE_FILE_SIZE:
         return
-    print(f"{'Last':15}  {'First':15}  {'Phone':17}  {'Email'}")
-    print("-" * 90)
+
+    end = "\n" if done >= total else ""
+    print(f"\rLoading... {done * 100 // total}%", end=end, flush=True)
+
+
+def print_import_progress(report: ImportReport) -> None:
+    # called after every chunk of rows, imports of a single chunk are quick
+    # enough to not show it (see end_import_progress)
+    if report.rows < IMPORT_CHUNK_SIZE:
+        return
+
+    print(
+        f"\rImporting... {report.rows:,} rows ({report.rows_per_sec:,.0f} rows/s)",
+        end="",
+        flush=True,
+    )
+
+
+def end_import_progress(report: ImportReport) -> None:
+    # end the progress line, if print_import_progress printed it
+    if report.rows >= IMPORT_CHUNK_SIZE:
+        print()
+
+
+HEADER = f"{'Last':15}  {'First':15}  {'Phone':17}  {'Email'}\n" + "-" * 90 + "\n"
+PAGE_SIZE = 20
+
+
+def format_contact(contact: Contact) -> str:
+    # display phone number in international format so it's more readable
+    phone = contact.phone_number
+    render_phone_number = f"{phone[:3]} {phone[3:6]} {phone[6:9]} {phone[9:]}"
+    return f"{contact.last_name:15}  {contact.first_name:15}  {render_phone_number:17}  {contact.email or ''}\n"
+
+
+def render_contacts(contacts: Iterable[Contact], batch_size: int = 500) -> int:
+    # contacts can be any iterable (e.g. AddressBook.iter_contacts), lines are
+    # written in batches instead of calling print for every contact
+    lines = []
+    count = 0
+
     for contact in contacts:
-        # display phone number in international format so it's more readable
-        render_phone_number = f"{contact.phone_number[:3]} {contact.phone_number[3:6]} {contact.phone_number[6:9]} {contact.phone_number[9:]}"
-        print(
-            f"{(contact.last_name):15}  {(contact.first_name):15}  {render_phone_number:17}  {contact.email or ''}"
-        )
+        if count == 0:
+            lines.append(HEADER)
+
+        lines.append(format_contact(contact))
+        count += 1
+
+        if len(lines) >= batch_size:
+            sys.stdout.write("".join(lines))
+            lines.clear()
+
+    if count == 0:
+        print("No contacts in address book.")
+        return 0
+
+    sys.stdout.write("".join(lines))
+    sys.stdout.flush()
+    return count
+
+
+def page_contacts(addressbook: AddressBook, page_size: int = PAGE_SIZE) -> None:
+    contacts = addressbook.iter_contacts()
+
+    while True:
+        page = list(islice(contacts, page_size))
+        if not page:
+            print("No more contacts.")
+            return
+
+        render_contacts(page)
+
+        choice = input(
+            "\n[Enter] next page, a letter to jump to it, q to quit: "
+        ).strip()
+
+        if choice.lower() == "q":
+            return
+
+        # jump to the first last name starting with the given letter(s)
+        if choice:
+            contacts = addressbook.iter_contacts(start=choice.title())
 
 
 def get_contact(query: str, addressbook: AddressBook) -> Contact | None:
@@ -98,6 +159,17 @@ def get_contact(query: str, addressbook: AddressBook) -> Contact | None:
 
         except ContactNotFoundError:
             print("No contacts found.")
+
+            # maybe it's a typo, suggest the closest names
+            try:
+                suggestions = addressbook.search_fuzzy(query)
+            except ContactNotFoundError:
+                suggestions = []
+
+            if suggestions:
+                print("\nDid you mean:")
+                render_contacts(suggestions)
+
             choice = input("Try again? (y/N): ").strip().lower()
             if choice != 'y':
                 return None  # Allow exit
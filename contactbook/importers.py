@@ -0,0 +1,385 @@
+import csv
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import IO, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+from .addressbook import AddressBook, ImportReport
+from .contact_validators import validate_many
+from .contact_exceptions import StorageError, FileCorruptionError
+
+CHUNK_SIZE = 10_000
+
+# header names found in the csv dumps of other applications, after
+# normalize_record lowercases them and turns spaces and dashes into "_"
+FIELD_ALIASES = {
+    "first": "first_name",
+    "firstname": "first_name",
+    "given_name": "first_name",
+    "last": "last_name",
+    "lastname": "last_name",
+    "surname": "last_name",
+    "family_name": "last_name",
+    "phone_number": "phone",
+    "mobile": "phone",
+    "mobile_phone": "phone",
+    "tel": "phone",
+    "telephone": "phone",
+    "e_mail": "email",
+    "mail": "email",
+    "email_address": "email",
+}
+RECORD_FIELDS = ("first_name", "last_name", "phone", "email")
+
+Progress = Callable[[ImportReport], None]
+
+
+def import_file(
+    addressbook: AddressBook,
+    path: str,
+    atomic: bool = False,
+    workers: int = 0,
+    progress: Optional[Progress] = None,
+) -> ImportReport:
+    # vCard for .vcf/.vcard files, csv for everything else
+    if os.path.splitext(path)[1].lower() in (".vcf", ".vcard"):
+        return import_vcard(addressbook, path, atomic, workers, progress)
+
+    return import_csv(addressbook, path, atomic, workers, progress)
+
+
+def import_csv(
+    addressbook: AddressBook,
+    source: Union[str, IO[str]],
+    atomic: bool = False,
+    workers: int = 0,
+    progress: Optional[Progress] = None,
+) -> ImportReport:
+    # The csv needs a header with first_name, last_name, phone (or phone_number)
+    # and optionally email, like the keys of Contact.to_dict (or one of
+    # FIELD_ALIASES). With workers > 0 the rows are validated in a process pool.
+    return import_records(addressbook, csv_records(source), atomic, workers, progress=progress)
+
+
+def import_vcard(
+    addressbook: AddressBook,
+    source: Union[str, IO[str]],
+    atomic: bool = False,
+    workers: int = 0,
+    progress: Optional[Progress] = None,
+) -> ImportReport:
+    # every vCard (3.0 or 4.0) is a row, numbered from 1 in file order
+    return import_records(addressbook, vcard_records(source), atomic, workers, progress=progress)
+
+
+def csv_records(source: Union[str, IO[str]]) -> Iterator[dict]:
+    # the raw records of a csv file (or of an open one), read lazily: a bad
+    # byte or line stops them there
+    if isinstance(source, str):
+        try:
+            # utf-8-sig also skips the BOM that spreadsheets put in front
+            # of the header
+            with open(source, newline="", encoding="utf-8-sig") as file:
+                yield from csv_records(file)
+                return
+
+        except OSError as e:
+            raise StorageError(f"Could not read '{source}': {e}") from e
+
+    try:
+        yield from csv.DictReader(source)
+
+    except (UnicodeDecodeError, csv.Error) as e:
+        raise FileCorruptionError(f"Invalid CSV file: {e}") from e
+
+
+def vcard_records(source: Union[str, IO[str]]) -> Iterator[dict]:
+    # the raw records of a vCard file (or of an open one), see read_vcards
+    if isinstance(source, str):
+        try:
+            with open(source, encoding="utf-8") as file:
+                yield from vcard_records(file)
+                return
+
+        except OSError as e:
+            raise StorageError(f"Could not read '{source}': {e}") from e
+
+    try:
+        yield from read_vcards(source)
+
+    except UnicodeDecodeError as e:
+        raise FileCorruptionError(f"Invalid vCard file: {e}") from e
+
+
+def validate_file(path: str, workers: int = 0) -> List[Tuple[int, Union[dict, str]]]:
+    # The rows of a csv or vCard file (see import_file) normalized and
+    # validated, for AddressBook.add_validated. No book is touched, so it can
+    # run on another thread while the book is in use (see server.py).
+    if os.path.splitext(path)[1].lower() in (".vcf", ".vcard"):
+        records = vcard_records(path)
+    else:
+        records = csv_records(path)
+
+    return list(_validated(map(normalize_record, records), workers, CHUNK_SIZE))
+
+
+def import_records(
+    addressbook: AddressBook,
+    records: Iterable[dict],
+    atomic: bool = False,
+    workers: int = 0,
+    chunk_size: int = CHUNK_SIZE,
+    progress: Optional[Progress] = None,
+) -> ImportReport:
+    # Streaming pipeline over raw records: normalize -> validate -> dedupe and
+    # insert, chunk_size rows at a time. records is consumed lazily and only
+    # one chunk is in flight (a few with workers), so the memory doesn't grow
+    # with the input besides the contacts added to the book.
+    # With atomic nothing can be inserted before the last row is validated,
+    # the whole input goes to add_validated at once.
+    # progress is called with the report so far after every chunk.
+    start = time.perf_counter()
+    rows = _validated(map(normalize_record, records), workers, chunk_size)
+    report = _insert_rows(addressbook, rows, atomic, chunk_size, progress, start)
+
+    report.seconds = time.perf_counter() - start
+    return report
+
+
+def import_parallel(
+    addressbook: AddressBook,
+    records: Iterable[dict],
+    workers: Optional[int] = None,
+    chunk_size: int = CHUNK_SIZE,
+    atomic: bool = False,
+) -> ImportReport:
+    # Validation and normalization run in worker processes, one chunk of rows
+    # at a time, the duplicate checks and the inserts stay in this process.
+    # Results are merged in row order, so the outcome is the same as bulk_add.
+    return import_records(
+        addressbook, records, atomic, workers=workers or os.cpu_count() or 1, chunk_size=chunk_size
+    )
+
+
+def normalize_record(record: dict) -> dict:
+    # map the field names to the ones of Contact.to_dict and strip the values,
+    # unknown fields are dropped
+    normalized = {}
+
+    for key, value in record.items():
+        if not isinstance(key, str):
+            # csv.DictReader puts the values of extra columns under None
+            continue
+
+        key = key.strip().lower().replace(" ", "_").replace("-", "_")
+        key = FIELD_ALIASES.get(key, key)
+
+        if key in RECORD_FIELDS and key not in normalized:
+            normalized[key] = value.strip() if isinstance(value, str) else value
+
+    return normalized
+
+
+def read_vcards(lines: Iterable[str]) -> Iterator[dict]:
+    # Parse vCards line by line and yield one raw record per card with the
+    # fields of normalize_record: first and last name from N (or FN), the first
+    # cell phone (or the first phone) and the first email.
+    # Folded lines (RFC 6350 3.2) are joined before parsing.
+    card: Optional[dict] = None
+
+    for name, params, value in _vcard_properties(lines):
+        if name == "BEGIN" and value.upper() == "VCARD":
+            card = {}
+            continue
+
+        if card is None:
+            continue
+
+        if name == "END" and value.upper() == "VCARD":
+            yield _vcard_record(card)
+            card = None
+
+        elif name == "N":
+            card.setdefault("n", _vcard_split(value))
+
+        elif name == "FN":
+            card.setdefault("fn", _vcard_unescape(value))
+
+        elif name == "TEL":
+            phone = _vcard_unescape(value)
+            if phone.lower().startswith("tel:"):
+                phone = phone[4:]
+
+            if "CELL" in params.upper() and "cell" not in card:
+                card["cell"] = phone
+            card.setdefault("tel", phone)
+
+        elif name == "EMAIL":
+            card.setdefault("email", _vcard_unescape(value))
+
+
+def validate_chunk(
+    chunk: List[Tuple[int, dict]]
+) -> List[Tuple[int, Union[dict, str]]]:
+    # runs in the workers: fields are sent back as plain dicts, the parent
+    # builds the Contact objects (interned names don't survive pickling)
+    row_numbers = [row_number for row_number, _ in chunk]
+    return list(zip(row_numbers, validate_many(record for _, record in chunk)))
+
+
+def _validated(
+    records: Iterable[dict], workers: int, chunk_size: int
+) -> Iterator[Tuple[int, Union[dict, str]]]:
+    # (row number, fields or error message) per record, in row order
+    if workers > 0:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            yield from _validate_in_pool(executor, workers, records, chunk_size)
+    else:
+        yield from enumerate(validate_many(records), start=1)
+
+
+def _insert_rows(
+    addressbook: AddressBook,
+    rows: Iterator[Tuple[int, Union[dict, str]]],
+    atomic: bool,
+    chunk_size: int,
+    progress: Optional[Progress],
+    start: float,
+) -> ImportReport:
+    if atomic:
+        report = addressbook.add_validated(rows, atomic=True)
+        report.rows = len(report.added) + len(report.errors)
+        return report
+
+    # the chunks join one transaction: the import is a single undo, and a
+    # file that turns out unreadable half way adds nothing
+    report = ImportReport()
+    seen: Dict[str, int] = {}  # phones and emails added so far -> row number
+    with addressbook.transaction():
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                return report
+
+            chunk_report = addressbook.add_validated(chunk, seen=seen)
+            report.added.extend(chunk_report.added)
+            report.errors.extend(chunk_report.errors)
+            report.rows += len(chunk)
+            report.seconds = time.perf_counter() - start
+
+            if progress is not None:
+                progress(report)
+
+
+def _chunks(
+    records: Iterable[dict], chunk_size: int
+) -> Iterator[List[Tuple[int, dict]]]:
+    numbered = enumerate(records, start=1)
+    while True:
+        # csv.DictReader rows are plain dicts, they can be pickled as they are
+        chunk = list(islice(numbered, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _validate_in_pool(
+    executor: ProcessPoolExecutor, workers: int, records: Iterable[dict], chunk_size: int
+) -> Iterator[Tuple[int, Union[dict, str]]]:
+    # keep only a few chunks in flight so big inputs are not read all at once,
+    # workers is the size of the pool
+    max_pending = 2 * workers
+    pending = deque()
+
+    for chunk in _chunks(records, chunk_size):
+        pending.append(executor.submit(validate_chunk, chunk))
+
+        if len(pending) >= max_pending:
+            yield from pending.popleft().result()
+
+    while pending:
+        yield from pending.popleft().result()
+
+
+def _vcard_properties(lines: Iterable[str]) -> Iterator[Tuple[str, str, str]]:
+    # yield (name, params, value) per unfolded content line, the group prefix
+    # ("item1.TEL") is dropped and the name uppercased
+    current = None
+
+    for line in lines:
+        line = line.rstrip("\r\n")
+
+        if line[:1] in (" ", "\t") and current is not None:
+            current += line[1:]
+            continue
+
+        if current is not None:
+            yield _vcard_property(current)
+        current = line
+
+    if current is not None:
+        yield _vcard_property(current)
+
+
+def _vcard_property(line: str) -> Tuple[str, str, str]:
+    head, _, value = line.partition(":")
+    name, _, params = head.partition(";")
+    return name.rpartition(".")[2].strip().upper(), params, value.strip()
+
+
+def _vcard_record(card: dict) -> dict:
+    if "n" in card:
+        # N is last;first;additional;prefixes;suffixes
+        last_name, first_name = (card["n"] + ["", ""])[:2]
+    else:
+        # FN is the full name, the last word (if more than one) is the last name
+        names = card.get("fn", "").rsplit(" ", 1)
+        first_name, last_name = names[0], names[1] if len(names) > 1 else ""
+
+    return {
+        "first_name": first_name or None,
+        "last_name": last_name or None,
+        "phone": card.get("cell", card.get("tel")),
+        "email": card.get("email"),
+    }
+
+
+def _vcard_split(value: str, separator: str = ";") -> List[str]:
+    # split on the separators that are not escaped and unescape the parts
+    parts = []
+    current = []
+    escaped = False
+
+    for char in value:
+        if escaped:
+            current.append("\\" + char)
+            escaped = False
+        elif char == "\\":
+            escaped = True
+        elif char == separator:
+            parts.append(_vcard_unescape("".join(current)))
+            current = []
+        else:
+            current.append(char)
+
+    parts.append(_vcard_unescape("".join(current)))
+    return parts
+
+
+def _vcard_unescape(text: str) -> str:
+    if "\\" not in text:
+        return text
+
+    chars = []
+    escaped = False
+    for char in text:
+        if escaped:
+            chars.append("\n" if char in "nN" else char)
+            escaped = False
+        elif char == "\\":
+            escaped = True
+        else:
+            chars.append(char)
+
+    return "".join(chars)
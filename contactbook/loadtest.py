@@ -0,0 +1,103 @@
+import json
+import time
+import random
+import asyncio
+import argparse
+from typing import List, Optional
+
+# Load test client for contactbook.server: opens N connections, each one
+# sends requests one after the other, and reports req/s and the latencies
+QUERIES = ["a", "an", "ro", "mar", "ein", "ross", "bian", "ve"]
+# search responses can be long lines, the default stream limit is 64 KiB
+STREAM_LIMIT = 1 << 26
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+
+    index = min(len(sorted_values) - 1, int(len(sorted_values) * pct / 100))
+    return sorted_values[index]
+
+
+def make_command(mix: str, rnd: random.Random, n: int) -> dict:
+    if mix == "write" or (mix == "mixed" and rnd.random() < 0.1):
+        return {
+            "cmd": "add",
+            "first_name": "Load",
+            "last_name": f"Test{n}",
+            "phone": f"3{rnd.randrange(10**9):09d}",
+        }
+
+    if rnd.random() < 0.5:
+        return {"cmd": "list", "offset": rnd.randrange(100), "limit": 20}
+
+    return {"cmd": "search", "query": rnd.choice(QUERIES)}
+
+
+async def client(
+    args: argparse.Namespace, client_id: int, latencies: List[float]
+) -> int:
+    if args.socket:
+        reader, writer = await asyncio.open_unix_connection(
+            args.socket, limit=STREAM_LIMIT
+        )
+    else:
+        reader, writer = await asyncio.open_connection(
+            args.host, args.port, limit=STREAM_LIMIT
+        )
+
+    rnd = random.Random(client_id)
+    errors = 0
+
+    for n in range(args.requests):
+        command = make_command(args.mix, rnd, client_id * args.requests + n)
+
+        start = time.perf_counter()
+        writer.write(json.dumps(command).encode() + b"\n")
+        await writer.drain()
+        response = json.loads(await reader.readline())
+        latencies.append(time.perf_counter() - start)
+
+        if not response["ok"]:
+            errors += 1
+
+    writer.close()
+    await writer.wait_closed()
+    return errors
+
+
+async def run(args: argparse.Namespace) -> dict:
+    latencies: List[float] = []
+
+    start = time.perf_counter()
+    errors = await asyncio.gather(
+        *(client(args, i, latencies) for i in range(args.connections))
+    )
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": sum(errors),
+        "req_per_sec": round(len(latencies) / elapsed),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog="contactbook.loadtest")
+    parser.add_argument("--socket", help="unix socket path (default: tcp on localhost)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--connections", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=1000, help="per connection")
+    parser.add_argument("--mix", choices=("read", "write", "mixed"), default="mixed")
+
+    stats = asyncio.run(run(parser.parse_args(argv)))
+    print(" ".join(f"{key}={value}" for key, value in stats.items()))
+
+
+if __name__ == "__main__":
+    main()
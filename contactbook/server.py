@@ -0,0 +1,220 @@
+import os
+import json
+import time
+import asyncio
+import argparse
+from typing import List, Optional
+from .addressbook import AddressBook
+from .cli import open_book, import_result, run_command, WRITE_COMMANDS
+from .importers import validate_file
+from .sqlite_addressbook import SqliteAddressBook
+from .contact_exceptions import ContactError, StorageError
+
+SAVE_DELAY = 1.0  # seconds without writes before the book is saved
+
+
+class ContactServer:
+    # Keeps one AddressBook in memory and serves the cli commands as
+    # newline-delimited json over a unix socket or a localhost tcp port.
+    # Every command changes the book on the event loop thread without
+    # awaiting in between, so each one is atomic: many clients are served
+    # concurrently while the book only ever has a single writer.
+    # The slow parts run in the default executor meanwhile: reading and
+    # validating an imported file (its rows are added on the loop) and
+    # writing a save (the snapshot is taken on the loop, see
+    # AddressBook._take_snapshot).
+    # Writes are saved together, SAVE_DELAY seconds after the last one.
+    def __init__(self, addressbook: AddressBook, path: str, save_delay: float = SAVE_DELAY):
+        self.addressbook = addressbook
+        self.path = path
+        self.save_delay = save_delay
+        self.requests = 0
+        self.saves = 0
+        self._save_handle: Optional[asyncio.TimerHandle] = None
+        self._saving: Optional[asyncio.Future] = None  # the last snapshot write
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(
+        self, socket_path: Optional[str] = None, host: str = "127.0.0.1", port: int = 0
+    ) -> asyncio.AbstractServer:
+        if socket_path:
+            self._server = await asyncio.start_unix_server(self._handle, path=socket_path)
+        else:
+            self._server = await asyncio.start_server(self._handle, host=host, port=port)
+
+        return self._server
+
+    async def close(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+        # don't lose the writes still waiting for the debounced save
+        if self._save_handle is not None:
+            self._save_handle.cancel()
+            self._save_handle = None
+
+        if self.addressbook.is_changed:
+            self.save()
+
+        if self._saving is not None:
+            await self._saving
+
+    async def handle_line(self, line: bytes) -> dict:
+        self.requests += 1
+
+        try:
+            command = json.loads(line)
+            if not isinstance(command, dict):
+                raise ContactError("Expected a json object")
+
+            if command.get("cmd") == "import":
+                result = await self._import(command)
+            elif self._saves_own_file(command):
+                result = await self._save_now()
+            else:
+                result = run_command(self.addressbook, command, self.path)
+
+        except (json.JSONDecodeError, ContactError, StorageError, TypeError) as e:
+            return {"ok": False, "error": str(e)}
+
+        if command.get("cmd") in WRITE_COMMANDS and self.addressbook.is_changed:
+            self._schedule_save()
+
+        return {"ok": True, "result": result}
+
+    def save(self) -> None:
+        self._save_handle = None
+
+        # sqlite books only commit, and their connection can't leave this thread
+        if isinstance(self.addressbook, SqliteAddressBook):
+            try:
+                self.addressbook.save(self.path)
+                self.saves += 1
+            except StorageError as e:
+                print(f"Error: {e}")
+            return
+
+        snapshot = self.addressbook._take_snapshot(self.path)
+        self._saving = asyncio.ensure_future(self._write(snapshot, self._saving))
+
+    async def _save_now(self) -> dict:
+        # a save command goes after the snapshots still being written, like
+        # the save on close: written on the loop it could be replaced by an
+        # older snapshot finishing later
+        if self._save_handle is not None:
+            self._save_handle.cancel()
+            self._save_handle = None
+
+        if isinstance(self.addressbook, SqliteAddressBook):
+            self.addressbook.save(self.path)
+            self.saves += 1
+        else:
+            self.save()
+            error = await self._saving
+            if error is not None:
+                raise error
+
+        return {"saved": len(self.addressbook)}
+
+    def _saves_own_file(self, command: dict) -> bool:
+        # "save" without a path, or "save"/"export" to the book's own file
+        if command.get("cmd") not in ("save", "export"):
+            return False
+
+        path = command.get("path") or (self.path if command["cmd"] == "save" else "")
+        return bool(path) and os.path.abspath(path) == os.path.abspath(self.path)
+
+    async def _write(
+        self, snapshot, previous: Optional[asyncio.Future]
+    ) -> Optional[StorageError]:
+        # the snapshots are written in the order they were taken
+        if previous is not None:
+            await previous
+
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(None, self.addressbook._write_snapshot, snapshot)
+            self.saves += 1
+
+        except StorageError as e:
+            # keep serving, the next write schedules another attempt
+            print(f"Error: {e}")
+            return e
+
+        return None
+
+    async def _import(self, command: dict) -> dict:
+        start = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        rows = await loop.run_in_executor(
+            None, validate_file, command.get("path", ""), command.get("workers", 0)
+        )
+
+        report = self.addressbook.add_validated(rows, atomic=command.get("atomic", False))
+        report.rows = len(rows)
+        report.seconds = time.perf_counter() - start
+        return import_result(report)
+
+    def _schedule_save(self) -> None:
+        # debounce: every write pushes the save back, a burst of writes is
+        # saved once
+        if self._save_handle is not None:
+            self._save_handle.cancel()
+
+        loop = asyncio.get_running_loop()
+        self._save_handle = loop.call_later(self.save_delay, self.save)
+
+    async def _handle(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+
+                if not line.strip():
+                    continue
+
+                writer.write(json.dumps(await self.handle_line(line)).encode() + b"\n")
+                await writer.drain()
+
+        except ConnectionError:
+            pass
+
+        finally:
+            writer.close()
+
+
+async def serve(args: argparse.Namespace) -> None:
+    addressbook = open_book(args.file, create=True)
+    server = ContactServer(addressbook, args.file, save_delay=args.save_delay)
+    listener = await server.start(socket_path=args.socket, port=args.port)
+
+    address = args.socket or listener.sockets[0].getsockname()
+    print(f"Serving {len(addressbook)} contacts from {args.file} on {address}")
+
+    try:
+        await listener.serve_forever()
+    except asyncio.CancelledError:
+        pass
+    finally:
+        await server.close()
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog="contactbook.server")
+    parser.add_argument("--file", required=True, help="contact book (.json or .db)")
+    parser.add_argument("--socket", help="unix socket path (default: tcp on localhost)")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--save-delay", type=float, default=SAVE_DELAY)
+
+    try:
+        asyncio.run(serve(parser.parse_args(argv)))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+from .contacts import Contact
+from .addressbook import AddressBook, ChangeSet, ImportReport
+from .storage import SnapshotStorage, SnapshotReader
+from .contact_validators import PREFIX
+from .contact_exceptions import ContactNotFoundError
+
+
+class SnapshotAddressBook(AddressBook):
+    # AddressBook over a SnapshotStorage file: load only maps the file, lookups
+    # use the indexes stored in it and decode just the contacts they return.
+    # The snapshot is read only, the first change (or a lookup it has no index
+    # for, like search_fuzzy) loads the whole book in memory and from then on
+    # it works as a normal AddressBook.
+    def __init__(self, storage: SnapshotStorage):
+        super().__init__(storage)
+        self.reader: Optional[SnapshotReader] = None
+
+    def add_contact(self, contact: Contact) -> None:
+        self._materialize()
+        super().add_contact(contact)
+
+    def delete_contact(self, contact: Contact) -> None:
+        self._materialize()
+        super().delete_contact(contact)
+
+    def add_validated(
+        self,
+        rows: Iterable[Tuple[int, Union[dict, str]]],
+        atomic: bool = False,
+        seen: Optional[Dict[str, int]] = None,
+    ) -> ImportReport:
+        self._materialize()
+        return super().add_validated(rows, atomic, seen)
+
+    def update_contact(
+        self, contact_to_update: Contact, updated_contact: Contact
+    ) -> None:
+        self._materialize()
+        super().update_contact(contact_to_update, updated_contact)
+
+    def merge_contacts(self, keep: Contact, duplicates: Iterable[Contact]) -> Contact:
+        self._materialize()
+        return super().merge_contacts(keep, duplicates)
+
+    def get_contact(self, id: str) -> Optional[Contact]:
+        if self.reader is None:
+            return super().get_contact(id)
+
+        record = self.reader.find_id(id)
+        return None if record is None else self._to_contact(record)
+
+    def list_contacts(self, offset: int = 0, limit: Optional[int] = None) -> List[Contact]:
+        if self.reader is None:
+            return super().list_contacts(offset, limit)
+
+        # the records are stored in list order
+        end = None if limit is None else offset + limit
+        return [self._to_contact(record) for record in range(len(self.reader))[offset:end]]
+
+    def iter_contacts(
+        self, start: Optional[str] = None, end: Optional[str] = None
+    ) -> Iterator[Contact]:
+        if self.reader is None:
+            yield from super().iter_contacts(start, end)
+            return
+
+        for record in self.reader.last_name_range(start, end):
+            yield self._to_contact(record)
+
+    def search_contact(self, query: str) -> List[Contact]:
+        if self.reader is None:
+            return super().search_contact(query)
+
+        records = self.reader.search_names(query.strip().lower())
+
+        if not records:
+            raise ContactNotFoundError("No contacts found")
+
+        return [self._to_contact(record) for record in records]
+
+    def search_fuzzy(
+        self, query: str, k: int = 5, max_distance: int = 2
+    ) -> List[Contact]:
+        self._materialize()
+        return super().search_fuzzy(query, k, max_distance)
+
+    def search_phone(
+        self, prefix: Optional[str] = None, suffix: Optional[str] = None
+    ) -> List[Contact]:
+        # the snapshot has no reversed phones index for suffixes
+        if self.reader is None or suffix:
+            self._materialize()
+            return super().search_phone(prefix, suffix)
+
+        records = []
+        if prefix:
+            prefix = "".join(prefix.split())
+            if not prefix.startswith("+"):
+                prefix = PREFIX + prefix
+
+            records = self.reader.phone_prefix(prefix)
+
+        if not records:
+            raise ContactNotFoundError("No contacts found")
+
+        return [self._to_contact(record) for record in records]
+
+    def contacts_by_domain(self, domain: str) -> List[Contact]:
+        if self.reader is None:
+            return super().contacts_by_domain(domain)
+
+        records = self.reader.domain(domain.strip().lower().lstrip("@"))
+
+        if not records:
+            raise ContactNotFoundError("No contacts found")
+
+        return [self._to_contact(record) for record in records]
+
+    def domain_counts(self) -> Dict[str, int]:
+        if self.reader is None:
+            return super().domain_counts()
+
+        return dict(
+            sorted(self.reader.domain_counts().items(), key=lambda item: (-item[1], item[0]))
+        )
+
+    def _take_snapshot(self, path: str):
+        # the book is saved from memory, the mapped file may be the one replaced
+        self._materialize()
+        return super()._take_snapshot(path)
+
+    def load(self, path: str, progress: Optional[Callable[[int, int], None]] = None):
+        # nothing to decode up front, progress is accepted for compatibility
+        reader = self.storage.open(path)
+
+        if self.reader is not None:
+            self.reader.close()
+
+        self._reset_indexes()
+        self.reader = reader
+        self._dirty = ChangeSet()
+        self._clear_history()
+        self._path = path
+        self.is_changed = False
+
+    def __len__(self):
+        if self.reader is None:
+            return super().__len__()
+
+        return len(self.reader)
+
+    def _materialize(self) -> None:
+        # decode every record into the in-memory contacts and indexes
+        if self.reader is None:
+            return
+
+        for record in range(len(self.reader)):
+            contact = self._to_contact(record)
+            self.contacts[contact.id] = contact
+            self._index_contact(contact, keep_sorted=False)
+
+        self._sort_indexes()
+        self.reader.close()
+        self.reader = None
+
+    def _to_contact(self, record: int) -> Contact:
+        return Contact.from_dict(self.reader.contact(record))
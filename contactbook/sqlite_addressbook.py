@@ -0,0 +1,331 @@
+import heapq
+import sqlite3
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+from .contacts import Contact
+from .addressbook import AddressBook
+from .dedupe import merged_contact
+from .storage import SqliteStorage
+from .contact_validators import PREFIX
+from .contact_exceptions import (
+    ContactNotFoundError,
+    DuplicateContactError,
+    StorageError,
+    UnsupportedOperationError,
+)
+
+# lowercase part of the email after the last "@" (emails have a single one)
+DOMAIN_SQL = "lower(substr(email, instr(email, '@') + 1))"
+
+
+class SqliteAddressBook(AddressBook):
+    # AddressBook that reads and writes straight from the database instead of
+    # keeping every contact in memory: load only opens the connection, so the
+    # startup time doesn't depend on the book size.
+    # Changes are committed on save (and rolled back on load), like the
+    # in-memory book they are lost if the user exits without saving.
+    def __init__(self, storage: SqliteStorage):
+        super().__init__(storage)
+        self.conn: Optional[sqlite3.Connection] = None
+
+    def add_contact(self, contact: Contact) -> None:
+        self._check_duplicate_contact(contact)
+
+        row = SqliteStorage.to_row(contact.to_dict())
+        self._db.execute(
+            f"INSERT INTO contacts ({SqliteStorage.COLUMNS}, name_key) VALUES (?, ?, ?, ?, ?, ?)",
+            row,
+        )
+        self.storage.index_names(self._db, [(row[0], row[-1])])
+        self.is_changed = True
+
+    def delete_contact(self, contact: Contact) -> None:
+        cursor = self._db.execute("DELETE FROM contacts WHERE id = ?", (contact.id,))
+
+        if cursor.rowcount == 0:
+            raise ContactNotFoundError("Contact not found")
+
+        self.storage.unindex_names(self._db, [contact.id])
+        self.is_changed = True
+
+    def update_contact(
+        self, contact_to_update: Contact, updated_contact: Contact
+    ) -> None:
+        if self.get_contact(contact_to_update.id) is None:
+            raise ContactNotFoundError("Contact not found.")
+
+        self._check_duplicate_contact(updated_contact, exclude_id=contact_to_update.id)
+
+        updated_contact.id = contact_to_update.id
+        row = SqliteStorage.to_row(updated_contact.to_dict())
+        self._db.execute(
+            "UPDATE contacts SET first_name = ?, last_name = ?, phone = ?, email = ?, name_key = ? "
+            "WHERE id = ?",
+            row[1:] + row[:1],
+        )
+        self.storage.unindex_names(self._db, [row[0]])
+        self.storage.index_names(self._db, [(row[0], row[-1])])
+        self.is_changed = True
+
+    def merge_contacts(self, keep: Contact, duplicates: Iterable[Contact]) -> Contact:
+        keep = self._stored_contact(keep)
+        duplicates = [
+            self._stored_contact(contact)
+            for contact in {contact.id: contact for contact in duplicates}.values()
+            if contact.id != keep.id
+        ]
+        merged = merged_contact(keep, duplicates)
+
+        self._db.executemany(
+            "DELETE FROM contacts WHERE id = ?", [(contact.id,) for contact in duplicates]
+        )
+        self.storage.unindex_names(self._db, [contact.id for contact in duplicates])
+        self.update_contact(keep, merged)
+
+        return merged
+
+    @contextmanager
+    def transaction(self):
+        # a savepoint inside the transaction that save commits, nested
+        # transactions are nested savepoints
+        if not self._db.in_transaction:
+            self._db.execute("BEGIN")
+
+        is_changed = self.is_changed
+        self._db.execute("SAVEPOINT contactbook")
+
+        try:
+            yield self
+        except BaseException:
+            self._db.execute("ROLLBACK TO contactbook")
+            self._db.execute("RELEASE contactbook")
+            self.is_changed = is_changed
+            raise
+
+        self._db.execute("RELEASE contactbook")
+
+    def undo(self) -> bool:
+        # the changes are only in the database, there is no operation log
+        raise UnsupportedOperationError("Undo is not supported for sqlite books.")
+
+    def redo(self) -> bool:
+        raise UnsupportedOperationError("Redo is not supported for sqlite books.")
+
+    def get_contact(self, id: str) -> Optional[Contact]:
+        row = self._db.execute(
+            f"SELECT {SqliteStorage.COLUMNS} FROM contacts WHERE id = ?", (id,)
+        ).fetchone()
+
+        return None if row is None else self._to_contact(row)
+
+    def list_contacts(self, offset: int = 0, limit: Optional[int] = None) -> List[Contact]:
+        rows = self._db.execute(
+            f"SELECT {SqliteStorage.COLUMNS} FROM contacts "
+            "ORDER BY last_name, first_name, id LIMIT ? OFFSET ?",
+            (-1 if limit is None else limit, offset),
+        )
+        return [self._to_contact(row) for row in rows]
+
+    def iter_contacts(
+        self, start: Optional[str] = None, end: Optional[str] = None
+    ) -> Iterator[Contact]:
+        rows = self._db.execute(
+            f"SELECT {SqliteStorage.COLUMNS} FROM contacts "
+            "WHERE (? IS NULL OR last_name >= ?) AND (? IS NULL OR last_name <= ?) "
+            "ORDER BY last_name, first_name, id",
+            (start, start, end, None if end is None else end + "\uffff"),
+        )
+
+        for row in rows:
+            yield self._to_contact(row)
+
+    def search_contact(self, query: str) -> List[Contact]:
+        normalized_query = query.strip().lower()
+
+        # The trigram index only helps queries of at least three characters,
+        # and fts5 can't use it with an ESCAPE clause: the queries with a LIKE
+        # wildcard (or the escape) in them scan the names instead
+        if (
+            self.storage.has_fts.get(self._path)
+            and len(normalized_query) >= 3
+            and not any(char in normalized_query for char in "%_\\")
+        ):
+            pattern = "%" + normalized_query + "%"
+            where = "rowid IN (SELECT rowid FROM contact_names WHERE name_key LIKE ?)"
+        else:
+            pattern = "%" + self._escape_like(normalized_query) + "%"
+            where = "name_key LIKE ? ESCAPE '\\'"
+
+        rows = self._db.execute(
+            f"SELECT {SqliteStorage.COLUMNS} FROM contacts WHERE {where} "
+            "ORDER BY last_name, first_name, id",
+            (pattern,),
+        ).fetchall()
+
+        if not rows:
+            raise ContactNotFoundError("No contacts found")
+
+        return [self._to_contact(row) for row in rows]
+
+    def search_fuzzy(
+        self, query: str, k: int = 5, max_distance: int = 2
+    ) -> List[Contact]:
+        # Same ranking as AddressBook.search_fuzzy, the token index is the
+        # one SqliteStorage keeps in the database
+        query_tokens = self._name_tokens(query)
+        scores: Dict[str, List[int]] = {}  # maps id -> best distance per query token
+        sort_keys: Dict[str, tuple] = {}
+
+        for i, query_token in enumerate(query_tokens):
+            for distance, token in self.storage.search_tokens(self._db, query_token, max_distance):
+                rows = self._db.execute(
+                    "SELECT c.id, c.last_name, c.first_name FROM name_tokens t "
+                    "JOIN contacts c ON c.id = t.id WHERE t.token = ?",
+                    (token,),
+                )
+                for id, last_name, first_name in rows:
+                    best = scores.setdefault(id, [max_distance + 1] * len(query_tokens))
+                    best[i] = min(best[i], distance)
+                    sort_keys[id] = (last_name, first_name, id)
+
+        if not scores:
+            raise ContactNotFoundError("No contacts found")
+
+        ranked = heapq.nsmallest(
+            k, scores.items(), key=lambda item: (sum(item[1]), sort_keys[item[0]])
+        )
+        return [self.get_contact(id) for id, _ in ranked]
+
+    def search_phone(
+        self, prefix: Optional[str] = None, suffix: Optional[str] = None
+    ) -> List[Contact]:
+        conditions = []
+        params = []
+
+        if prefix:
+            prefix = "".join(prefix.split())
+            if not prefix.startswith("+"):
+                prefix = PREFIX + prefix
+
+            # a range on the unique phone index
+            conditions.append("phone >= ? AND phone < ?")
+            params += [prefix, prefix + "\uffff"]
+
+        if suffix:
+            # no index on reversed phones, this one scans the table
+            conditions.append("phone LIKE ? ESCAPE '\\'")
+            params.append("%" + self._escape_like("".join(suffix.split())))
+
+        if not conditions:
+            raise ContactNotFoundError("No contacts found")
+
+        rows = self._db.execute(
+            f"SELECT {SqliteStorage.COLUMNS} FROM contacts WHERE {' AND '.join(conditions)} "
+            "ORDER BY last_name, first_name, id",
+            params,
+        ).fetchall()
+
+        if not rows:
+            raise ContactNotFoundError("No contacts found")
+
+        return [self._to_contact(row) for row in rows]
+
+    def contacts_by_domain(self, domain: str) -> List[Contact]:
+        domain = domain.strip().lower().lstrip("@")
+        rows = self._db.execute(
+            f"SELECT {SqliteStorage.COLUMNS} FROM contacts WHERE {DOMAIN_SQL} = ? "
+            "ORDER BY last_name, first_name, id",
+            (domain,),
+        ).fetchall()
+
+        if not rows:
+            raise ContactNotFoundError("No contacts found")
+
+        return [self._to_contact(row) for row in rows]
+
+    def domain_counts(self) -> Dict[str, int]:
+        rows = self._db.execute(
+            f"SELECT {DOMAIN_SQL} AS domain, COUNT(*) AS n FROM contacts "
+            "WHERE email IS NOT NULL GROUP BY domain ORDER BY n DESC, domain"
+        )
+        return dict(rows)
+
+    def _insert_many(self, contacts: List[Contact]) -> None:
+        rows = [SqliteStorage.to_row(contact.to_dict()) for contact in contacts]
+        self._db.executemany(
+            f"INSERT INTO contacts ({SqliteStorage.COLUMNS}, name_key) VALUES (?, ?, ?, ?, ?, ?)",
+            rows,
+        )
+        self.storage.index_names(self._db, [(row[0], row[-1]) for row in rows])
+
+    def _stored_contact(self, contact: Contact) -> Contact:
+        stored = self.get_contact(contact.id)
+
+        if stored is None:
+            raise ContactNotFoundError("Contact not found.")
+
+        return stored
+
+    def _check_duplicate_contact(
+        self, contact: Contact, exclude_id: Optional[str] = None
+    ) -> None:
+        row = self._db.execute(
+            "SELECT id FROM contacts WHERE phone = ?", (contact.phone_number,)
+        ).fetchone()
+
+        if row is not None and row[0] != exclude_id:
+            raise DuplicateContactError("Phone number already used by another contact")
+
+        if contact.email:
+            row = self._db.execute(
+                "SELECT id FROM contacts WHERE email = ?", (contact.email,)
+            ).fetchone()
+
+            if row is not None and row[0] != exclude_id:
+                raise DuplicateContactError("Email already used by another contact")
+
+    def save(self, path: str):
+        if path != self._path:
+            # saving to another file commits the changes and copies the whole
+            # database there, the book keeps working on its own file
+            try:
+                target = self.storage.connect(path, create=True)
+                self._db.commit()
+                self._db.backup(target)
+            except sqlite3.DatabaseError as e:
+                raise StorageError(f"Could not save the file to '{path}': {e}") from e
+        else:
+            self._db.commit()
+
+        self.is_changed = False
+
+    def _take_snapshot(self, path: str):
+        # sqlite connections belong to the thread that opened them
+        raise StorageError("Background saves are not supported for sqlite books.")
+
+    def load(self, path: str, progress: Optional[Callable[[int, int], None]] = None):
+        # nothing to read up front, progress is accepted for compatibility
+        if self.conn is not None:
+            self.conn.rollback()
+
+        self.conn = self.storage.connect(path)
+        self._path = path
+        self.is_changed = False
+
+    def __len__(self):
+        return self._db.execute("SELECT COUNT(*) FROM contacts").fetchone()[0]
+
+    @property
+    def _db(self) -> sqlite3.Connection:
+        if self.conn is None:
+            raise StorageError("No database loaded.")
+
+        return self.conn
+
+    @staticmethod
+    def _to_contact(row: tuple) -> Contact:
+        return Contact.from_dict(SqliteStorage.from_row(row))
+
+    @staticmethod
+    def _escape_like(text: str) -> str:
+        return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
@@ -1,32 +1,182 @@
 
 import os
+import bz2
+import sys
+import gzip
 import json
-from typing import Dict, Protocol
+import lzma
+import mmap
+import stat
+import codecs
+import struct
+import sqlite3
+import tempfile
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import chain, islice
+from json.encoder import encode_basestring_ascii
+from typing import IO, Callable, Dict, Iterable, Iterator, List, Optional, Protocol, Set, Tuple
+from .fuzzy import MAX_DISTANCE, deletes, levenshtein
 from .contact_exceptions import StorageError, FileCorruptionError
 
+JOURNAL_OPS = ("add", "update", "delete")
+# first entry of a JournalStorage snapshot, its generation
+GENERATION_KEY = "__generation__"
+CHUNK_SIZE = 1 << 16
+WRITE_BATCH = 1000  # encoded contacts joined per write by save_encoded
+WHITESPACE = " \t\n\r"
+
+# Compressed json books: the codec is detected on load from the first bytes
+# of the file, on save it's given to JsonStorage or taken from the extension
+CODECS = {"gzip": gzip, "bz2": bz2, "lzma": lzma}
+CODEC_MAGIC = {b"\x1f\x8b": "gzip", b"BZh": "bz2", b"\xfd7zXZ\x00": "lzma"}
+
+# read once: os.umask can only be read by setting it, which isn't safe while
+# the saves run on other threads
+UMASK = os.umask(0)
+os.umask(UMASK)
+CODEC_EXTENSIONS = {".gz": "gzip", ".bz2": "bz2", ".xz": "lzma"}
+# gzip level 9 is twice as slow as 6 for a 1% smaller book
+CODEC_SAVE_OPTIONS = {"gzip": {"compresslevel": 6}}
+# errors of a corrupted or truncated compressed stream
+CODEC_ERRORS = (OSError, EOFError, lzma.LZMAError)
+
+
+def _fsync_dir(dirpath: str) -> None:
+    # make the rename durable, not every platform can open a directory
+    try:
+        fd = os.open(dirpath, os.O_RDONLY)
+    except OSError:
+        return
+
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _write_atomic(path: str, write: Callable[[IO], None], mode: str = "w") -> None:
+    # write a temp file next to the book and rename it over the book, a crash
+    # half way leaves the old file as it was
+    if not path:
+        raise StorageError("Save path is empty.")
+
+    # ensure the directory exists
+    dirpath = os.path.dirname(path) or "."
+
+    tmp_path = None
+    try:
+        os.makedirs(dirpath, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(
+            dir=dirpath, prefix=os.path.basename(path) + ".", suffix=".tmp"
+        )
+        with os.fdopen(fd, mode) as file:
+            write(file)
+            file.flush()
+            os.fsync(file.fileno())
+
+        # mkstemp creates the file as 0600, keep the mode of the book (or
+        # the one a new file gets from the umask)
+        try:
+            file_mode = stat.S_IMODE(os.stat(path).st_mode)
+        except FileNotFoundError:
+            file_mode = 0o666 & ~UMASK
+        os.chmod(tmp_path, file_mode)
+
+        os.replace(tmp_path, path)
+        tmp_path = None
+        _fsync_dir(dirpath)
+
+    except StorageError:
+        raise
+
+    except Exception as e:
+        raise StorageError(f"Could not save the file to'{path}': {e}") from e
+
+    finally:
+        if tmp_path is not None and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
 
 class Storage(Protocol):
+    # Optional extensions, looked up with hasattr by AddressBook:
+    #   iter_load(path, progress)  stream the (id, contact) entries on load
+    #   save_delta(added, updated, deleted, path) -> bool
+    #                              write only the contacts changed since the
+    #                              last load/save of path, True when the whole
+    #                              book should be rewritten now (compaction)
+    #   encode_entry(id, contact) and save_encoded(entries, path)
+    #                              full save from entries encoded once and
+    #                              cached by the book for unchanged contacts
     def save(self, data: Dict[str, dict], path: str): ...
     def load(self, path: str) -> Dict[str, dict]: ...
 
 
 class JsonStorage:
+    def __init__(self, codec: Optional[str] = None):
+        if codec is not None and codec not in CODECS:
+            raise StorageError(f"Unknown codec '{codec}', expected one of {', '.join(CODECS)}.")
+
+        self.codec = codec
+
     def save(self, data: Dict[str, dict], path: str) -> None:
-        if not path:
-            raise StorageError("Save path is empty.")
+        codec = self.codec or CODEC_EXTENSIONS.get(os.path.splitext(path)[1])
 
-        # ensure the directory exists
-        dirpath = os.path.dirname(path) or "."
+        if codec is None:
+            _write_atomic(path, lambda file: json.dump(data, file, indent=4))
+            return
 
-        try:
-            os.makedirs(dirpath, exist_ok=True)
-            # first open a file and then in that file write data
-            with open(path, "w") as file:
-                json.dump(data, file, indent=4)
+        def write(file: IO) -> None:
+            # compressed while it's written, nobody reads these by hand so
+            # there's no indentation either
+            options = CODEC_SAVE_OPTIONS.get(codec, {})
+            with CODECS[codec].open(file, "wt", encoding="utf-8", **options) as text:
+                json.dump(data, text, separators=(",", ":"))
 
-        except Exception as e:
-            raise StorageError(f"Could not save the file to'{path}': {e}") from e
+        _write_atomic(path, write, "wb")
+
+    @staticmethod
+    def encode_entry(id: str, contact: dict) -> str:
+        # one '"id": {...}' entry of the top level dict, see save_encoded.
+        # Formatted directly like exporters._ndjson_line, a json.dumps per
+        # contact costs more than writing it.
+        fields = ", ".join(
+            f"{encode_basestring_ascii(key)}: {_encode_value(value)}"
+            for key, value in contact.items()
+        )
+        return f"{encode_basestring_ascii(id)}: {{{fields}}}"
+
+    def save_encoded(self, entries: Iterable[str], path: str) -> None:
+        # Same book as save, from entries made by encode_entry: AddressBook
+        # keeps them for the contacts that didn't change, so a full save
+        # doesn't encode the whole book again. One contact per line.
+        codec = self.codec or CODEC_EXTENSIONS.get(os.path.splitext(path)[1])
+        entries = iter(entries)
 
+        def write_entries(text: IO[str]) -> None:
+            first = True
+            while True:
+                batch = list(islice(entries, WRITE_BATCH))
+                if not batch:
+                    break
+
+                text.write(("{\n    " if first else ",\n    ") + ",\n    ".join(batch))
+                first = False
+
+            text.write("{}" if first else "\n}")
+
+        if codec is None:
+            _write_atomic(path, write_entries)
+            return
+
+        def write(file: IO) -> None:
+            options = CODEC_SAVE_OPTIONS.get(codec, {})
+            with CODECS[codec].open(file, "wt", encoding="utf-8", **options) as text:
+                write_entries(text)
+
+        _write_atomic(path, write, "wb")
 
     def load(self, path: str) -> Dict[str, dict]:
         if not path or not os.path.exists(path):
@@ -35,15 +185,1005 @@ class JsonStorage:
         if os.path.getsize(path) == 0:
             return {}
             
+        codec = self.detect_codec(path)
+
         try:
-            with open(path, "r") as contacts_file:
-                data = json.load(contacts_file)
+            if codec is None:
+                with open(path, "r") as contacts_file:
+                    data = json.load(contacts_file)
+            else:
+                with CODECS[codec].open(path, "rt", encoding="utf-8") as contacts_file:
+                    data = json.load(contacts_file)
 
         except json.JSONDecodeError as e:
             raise FileCorruptionError("Invalid JSON file.") from e
 
+        except CODEC_ERRORS as e:
+            raise FileCorruptionError(f"Invalid {codec} file: {e}") from e
+
         if not isinstance(data, dict):
             raise FileCorruptionError("Invalid format, expected a dict of contacts")
 
         return data
 
+    def iter_load(
+        self, path: str, progress: Optional[Callable[[int, int], None]] = None
+    ) -> Iterator[Tuple[str, dict]]:
+        # Parse the top level dict one (id, contact) entry at a time, reading the
+        # file in chunks, so the whole book is never in memory as a single dict.
+        # progress is called with (bytes read, file size) after every chunk.
+        if not path or not os.path.exists(path):
+            raise StorageError(f"File '{path}' not found.")
+
+        total = os.path.getsize(path)
+        if total == 0:
+            return
+
+        reader = _JsonEntryReader(path, total, progress, self.detect_codec(path))
+        yield from reader.entries()
+
+    @staticmethod
+    def detect_codec(path: str) -> Optional[str]:
+        try:
+            with open(path, "rb") as file:
+                head = file.read(max(map(len, CODEC_MAGIC)))
+
+        except OSError as e:
+            raise StorageError(f"Could not open '{path}': {e}") from e
+
+        for magic, codec in CODEC_MAGIC.items():
+            if head.startswith(magic):
+                return codec
+
+        return None
+
+
+def _encode_value(value) -> str:
+    if isinstance(value, str):
+        return encode_basestring_ascii(value)
+
+    return json.dumps(value)
+
+
+class _JsonEntryReader:
+    def __init__(
+        self,
+        path: str,
+        total: int,
+        progress: Optional[Callable[[int, int], None]],
+        codec: Optional[str] = None,
+    ):
+        self.path = path
+        self.total = total
+        self.progress = progress
+        self.codec = codec
+        self.decoder = json.JSONDecoder()
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+        self.read_bytes = 0
+
+    def entries(self) -> Iterator[Tuple[str, dict]]:
+        with open(self.path, "rb") as self.raw_file:
+            # compressed books are decompressed while they are read, progress
+            # follows the position in the compressed file
+            self.file = (
+                self.raw_file
+                if self.codec is None
+                else CODECS[self.codec].open(self.raw_file, "rb")
+            )
+            self.text_decoder = codecs.getincrementaldecoder("utf-8")()
+
+            if self._next_char() != "{":
+                raise FileCorruptionError("Invalid format, expected a dict of contacts")
+            self.pos += 1
+
+            if self._next_char() == "}":
+                self.pos += 1
+            else:
+                while True:
+                    id = self._value()
+                    if not isinstance(id, str):
+                        raise FileCorruptionError("Invalid JSON file.")
+
+                    self._expect(":")
+                    yield id, self._value()
+
+                    char = self._next_char()
+                    self.pos += 1
+                    if char == "}":
+                        break
+                    if char != ",":
+                        raise FileCorruptionError("Invalid JSON file.")
+
+            if self._next_char() is not None:
+                raise FileCorruptionError("Invalid JSON file.")
+
+    def _read_chunk(self) -> bool:
+        if self.eof:
+            return False
+
+        try:
+            chunk = self.file.read(CHUNK_SIZE)
+        except CODEC_ERRORS as e:
+            raise FileCorruptionError(f"Invalid {self.codec} file: {e}") from e
+
+        self.eof = not chunk
+        self.read_bytes = self.raw_file.tell()
+
+        try:
+            text = self.text_decoder.decode(chunk, final=self.eof)
+        except UnicodeDecodeError as e:
+            raise FileCorruptionError("Invalid JSON file.") from e
+
+        # drop what was already parsed before growing the buffer
+        self.buf = self.buf[self.pos :] + text
+        self.pos = 0
+
+        if self.progress is not None and chunk:
+            self.progress(self.read_bytes, self.total)
+
+        return not self.eof
+
+    def _next_char(self) -> Optional[str]:
+        # skip whitespace and return the next char without consuming it
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in WHITESPACE:
+                self.pos += 1
+
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+
+            if not self._read_chunk():
+                return None
+
+    def _expect(self, char: str) -> None:
+        if self._next_char() != char:
+            raise FileCorruptionError("Invalid JSON file.")
+        self.pos += 1
+
+    def _value(self):
+        if self._next_char() is None:
+            raise FileCorruptionError("Invalid JSON file.")
+
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+
+            except json.JSONDecodeError as e:
+                # the value may continue in the next chunk
+                if self._read_chunk():
+                    continue
+                raise FileCorruptionError("Invalid JSON file.") from e
+
+            # a number could be cut at the end of the buffer
+            if end == len(self.buf) and not isinstance(value, (dict, list, str)):
+                if self._read_chunk():
+                    continue
+
+            self.pos = end
+            return value
+
+
+class JournalStorage(JsonStorage):
+    # The snapshot is a normal JSON book, every change made after it is appended
+    # as one JSON line to "<path>.journal" and replayed on load.
+    # Every snapshot has a generation (its GENERATION_KEY entry) and every
+    # record the generation of the snapshot it was appended to: a journal
+    # left behind by a crash after a compaction is older than the snapshot
+    # and is not replayed over it.
+    def __init__(self, compact_threshold: int = 1000, codec: Optional[str] = None):
+        super().__init__(codec)
+        self.compact_threshold = compact_threshold
+        self._journal_len: Dict[str, int] = {}  # maps path -> records in journal
+        self._generation: Dict[str, int] = {}  # maps path -> snapshot generation
+
+    @staticmethod
+    def journal_path(path: str) -> str:
+        return path + ".journal"
+
+    def save(self, data: Dict[str, dict], path: str) -> None:
+        # a full save is also the compaction: write the snapshot, drop the journal
+        generation = self._next_generation(path)
+        super().save({GENERATION_KEY: generation, **data}, path)
+        self._compacted(path, generation)
+
+    def save_encoded(self, entries: Iterable[str], path: str) -> None:
+        generation = self._next_generation(path)
+        stamp = f"{encode_basestring_ascii(GENERATION_KEY)}: {generation}"
+        super().save_encoded(chain([stamp], entries), path)
+        self._compacted(path, generation)
+
+    def save_delta(
+        self,
+        added: Dict[str, dict],
+        updated: Dict[str, dict],
+        deleted: Iterable[str],
+        path: str,
+    ) -> bool:
+        # one record per changed contact, the book asks for a compaction
+        # (a full save) when the journal gets too long
+        records = [{"op": "delete", "id": id} for id in deleted]
+        records += [{"op": "add", "id": id, "contact": c} for id, c in added.items()]
+        records += [{"op": "update", "id": id, "contact": c} for id, c in updated.items()]
+
+        return self.append(records, path) >= self.compact_threshold
+
+    def append(self, records: List[dict], path: str) -> int:
+        if not path:
+            raise StorageError("Save path is empty.")
+
+        generation = self._snapshot_generation(path)
+
+        try:
+            with open(self.journal_path(path), "a") as journal:
+                journal.write(
+                    "".join(json.dumps({**record, "gen": generation}) + "\n" for record in records)
+                )
+                journal.flush()
+                os.fsync(journal.fileno())
+
+        except Exception as e:
+            raise StorageError(f"Could not write the journal of '{path}': {e}") from e
+
+        if path not in self._journal_len:
+            self._journal_len[path] = len(self._read_journal(path))
+        else:
+            self._journal_len[path] += len(records)
+
+        return self._journal_len[path]
+
+    def load(self, path: str) -> Dict[str, dict]:
+        data = super().load(path)
+        generation = self._check_generation(data.pop(GENERATION_KEY, 0))
+        records = self._read_journal(path)
+
+        for record in self._current(records, generation):
+            if record["op"] == "delete":
+                data.pop(record["id"], None)
+            else:
+                data[record["id"]] = record["contact"]
+
+        self._generation[path] = generation
+        self._journal_len[path] = len(records)
+        return data
+
+    def iter_load(
+        self, path: str, progress: Optional[Callable[[int, int], None]] = None
+    ) -> Iterator[Tuple[str, dict]]:
+        # the journal is small compared to the snapshot: read it first, stream
+        # the snapshot skipping the contacts it changed, then yield its contacts
+        records = self._read_journal(path)
+        entries = super().iter_load(path, progress)
+
+        generation = 0
+        first = next(entries, None)
+        if first is not None and first[0] == GENERATION_KEY:
+            generation = self._check_generation(first[1])
+        elif first is not None:
+            entries = chain([first], entries)
+
+        latest = {record["id"]: record for record in self._current(records, generation)}
+
+        for id, contact in entries:
+            if id not in latest:
+                yield id, contact
+
+        for id, record in latest.items():
+            if record["op"] != "delete":
+                yield id, record["contact"]
+
+        self._generation[path] = generation
+        self._journal_len[path] = len(records)
+
+    def _next_generation(self, path: str) -> int:
+        # newer than the snapshot and than every record of the journal, even
+        # one left by another book saved to path
+        journal_generations = (record.get("gen", 0) for record in self._read_journal(path))
+        return max(self._snapshot_generation(path), *journal_generations, 0) + 1
+
+    def _snapshot_generation(self, path: str) -> int:
+        if path in self._generation:
+            return self._generation[path]
+
+        # the generation is the first entry, only the first chunk is read
+        entries = super().iter_load(path)
+        try:
+            first = next(entries, None)
+        except StorageError:
+            # no snapshot (or a broken one) yet, it will be rewritten whole
+            return 0
+        finally:
+            entries.close()
+
+        if first is None or first[0] != GENERATION_KEY:
+            return 0
+
+        return self._check_generation(first[1])
+
+    def _compacted(self, path: str, generation: int) -> None:
+        # the snapshot is in place, the journal records are older from now on:
+        # dropping the journal only saves space and reading time
+        self._generation[path] = generation
+        self._drop_journal(path)
+
+    @staticmethod
+    def _current(records: List[dict], generation: int) -> List[dict]:
+        # the records appended after the snapshot of this generation
+        return [record for record in records if record.get("gen", 0) >= generation]
+
+    @staticmethod
+    def _check_generation(generation) -> int:
+        if not isinstance(generation, int):
+            raise FileCorruptionError("Invalid journal snapshot generation.")
+        return generation
+
+    def _drop_journal(self, path: str) -> None:
+        try:
+            if os.path.exists(self.journal_path(path)):
+                os.remove(self.journal_path(path))
+
+        except OSError as e:
+            raise StorageError(f"Could not compact the journal of '{path}': {e}") from e
+
+        self._journal_len[path] = 0
+
+    def _read_journal(self, path: str) -> List[dict]:
+        journal_path = self.journal_path(path)
+        if not os.path.exists(journal_path):
+            return []
+
+        with open(journal_path, "r") as journal:
+            lines = journal.read().splitlines()
+
+        records = []
+        for n, line in enumerate(lines):
+            try:
+                record = json.loads(line)
+
+            except json.JSONDecodeError as e:
+                # a torn last line means we crashed while appending, cut it off
+                # so the next append starts on a clean line (records are ascii)
+                if n == len(lines) - 1:
+                    os.truncate(journal_path, sum(len(l) + 1 for l in lines[:n]))
+                    break
+                raise FileCorruptionError(f"Invalid journal line {n + 1}.") from e
+
+            if (
+                not isinstance(record, dict)
+                or record.get("op") not in JOURNAL_OPS
+                or "id" not in record
+                or (record["op"] != "delete" and not isinstance(record.get("contact"), dict))
+                or not isinstance(record.get("gen", 0), int)
+            ):
+                raise FileCorruptionError(f"Invalid journal record at line {n + 1}.")
+
+            records.append(record)
+
+        return records
+
+
+class SqliteStorage:
+    # Contacts live in a sqlite database with indexed phone/email/name columns,
+    # SqliteAddressBook uses the connection directly to avoid loading the book
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS contacts (
+            id TEXT PRIMARY KEY,
+            first_name TEXT NOT NULL,
+            last_name TEXT NOT NULL,
+            phone TEXT NOT NULL UNIQUE,
+            email TEXT UNIQUE,
+            name_key TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS contacts_sort_idx
+            ON contacts (last_name, first_name, id);
+        CREATE TABLE IF NOT EXISTS name_tokens (
+            token TEXT NOT NULL,
+            id TEXT NOT NULL,
+            PRIMARY KEY (token, id)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS name_tokens_id_idx ON name_tokens (id);
+        CREATE TABLE IF NOT EXISTS token_deletes (
+            variant TEXT NOT NULL,
+            token TEXT NOT NULL,
+            PRIMARY KEY (variant, token)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS fuzzy_state (built INTEGER NOT NULL);
+    """
+    # name_tokens and token_deletes are the SymSpellIndex of the book kept in
+    # the database for search_fuzzy, updated with the contacts. fuzzy_state
+    # marks them as built: the databases created before them are indexed once
+    # when opened
+    # trigram full text index over name_key, used for substring searches when
+    # sqlite is built with fts5 (3.34+)
+    FTS_SCHEMA = """
+        CREATE VIRTUAL TABLE IF NOT EXISTS contact_names
+            USING fts5(name_key, content='contacts', content_rowid='rowid', tokenize='trigram');
+        CREATE TRIGGER IF NOT EXISTS contacts_ai AFTER INSERT ON contacts BEGIN
+            INSERT INTO contact_names (rowid, name_key) VALUES (new.rowid, new.name_key);
+        END;
+        CREATE TRIGGER IF NOT EXISTS contacts_ad AFTER DELETE ON contacts BEGIN
+            INSERT INTO contact_names (contact_names, rowid, name_key)
+                VALUES ('delete', old.rowid, old.name_key);
+        END;
+        CREATE TRIGGER IF NOT EXISTS contacts_au AFTER UPDATE ON contacts BEGIN
+            INSERT INTO contact_names (contact_names, rowid, name_key)
+                VALUES ('delete', old.rowid, old.name_key);
+            INSERT INTO contact_names (rowid, name_key) VALUES (new.rowid, new.name_key);
+        END;
+    """
+    COLUMNS = "id, first_name, last_name, phone, email"
+
+    def __init__(self):
+        self._connections: Dict[str, sqlite3.Connection] = {}
+        self.has_fts: Dict[str, bool] = {}  # maps path -> trigram index available
+
+    def connect(self, path: str, create: bool = False) -> sqlite3.Connection:
+        if not path:
+            raise StorageError("Database path is empty.")
+
+        if path in self._connections:
+            return self._connections[path]
+
+        if not create and not os.path.exists(path):
+            raise StorageError(f"File '{path}' not found.")
+
+        try:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            conn = sqlite3.connect(path)
+            conn.executescript(self.SCHEMA)
+
+            if not self._fuzzy_built(conn):
+                self._build_fuzzy(conn)
+
+            try:
+                conn.executescript(self.FTS_SCHEMA)
+                self.has_fts[path] = True
+            except sqlite3.OperationalError:
+                self.has_fts[path] = False
+
+            conn.commit()
+
+        except sqlite3.DatabaseError as e:
+            raise FileCorruptionError(f"Invalid database file '{path}': {e}") from e
+
+        except OSError as e:
+            raise StorageError(f"Could not open '{path}': {e}") from e
+
+        self._connections[path] = conn
+        return conn
+
+    def save(self, data: Dict[str, dict], path: str) -> None:
+        conn = self.connect(path, create=True)
+
+        try:
+            with conn:
+                conn.execute("DELETE FROM contacts")
+                conn.executemany(
+                    f"INSERT INTO contacts ({self.COLUMNS}, name_key) VALUES (?, ?, ?, ?, ?, ?)",
+                    (self.to_row(contact) for contact in data.values()),
+                )
+                self._build_fuzzy(conn)
+
+        except sqlite3.DatabaseError as e:
+            raise StorageError(f"Could not save the file to '{path}': {e}") from e
+
+    def save_delta(
+        self,
+        added: Dict[str, dict],
+        updated: Dict[str, dict],
+        deleted: Iterable[str],
+        path: str,
+    ) -> bool:
+        # the old rows of the updated contacts are deleted before inserting the
+        # new ones, so two contacts swapping a phone don't break UNIQUE
+        conn = self.connect(path, create=True)
+
+        try:
+            with conn:
+                removed = list(deleted) + list(updated)
+                rows = [self.to_row(c) for c in added.values()] + [
+                    self.to_row(c) for c in updated.values()
+                ]
+
+                conn.executemany("DELETE FROM contacts WHERE id = ?", [(id,) for id in removed])
+                conn.executemany(
+                    f"INSERT INTO contacts ({self.COLUMNS}, name_key) VALUES (?, ?, ?, ?, ?, ?)",
+                    rows,
+                )
+                self.unindex_names(conn, removed)
+                self.index_names(conn, [(row[0], row[-1]) for row in rows])
+
+        except sqlite3.DatabaseError as e:
+            raise StorageError(f"Could not save the file to '{path}': {e}") from e
+
+        return False
+
+    def load(self, path: str) -> Dict[str, dict]:
+        conn = self.connect(path)
+
+        try:
+            rows = conn.execute(f"SELECT {self.COLUMNS} FROM contacts").fetchall()
+        except sqlite3.DatabaseError as e:
+            raise FileCorruptionError(f"Invalid database file '{path}': {e}") from e
+
+        return {row[0]: self.from_row(row) for row in rows}
+
+    def search_tokens(
+        self, conn: sqlite3.Connection, word: str, max_distance: int
+    ) -> List[Tuple[int, str]]:
+        # SymSpellIndex.search over token_deletes: the name tokens within
+        # max_distance edits of word, as sorted (distance, token) pairs
+        max_distance = min(max_distance, MAX_DISTANCE)
+        variants = list(deletes(word, max_distance))
+        candidates: Set[str] = set()
+
+        # under the default limit of 999 parameters of older sqlite versions
+        for start in range(0, len(variants), 900):
+            batch = variants[start : start + 900]
+            rows = conn.execute(
+                "SELECT DISTINCT token FROM token_deletes "
+                f"WHERE variant IN ({', '.join('?' * len(batch))})",
+                batch,
+            )
+            candidates.update(token for token, in rows)
+
+        found = []
+        for candidate in candidates:
+            if abs(len(candidate) - len(word)) > max_distance:
+                continue
+
+            distance = levenshtein(word, candidate)
+            if distance <= max_distance:
+                found.append((distance, candidate))
+
+        return sorted(found)
+
+    def index_names(self, conn: sqlite3.Connection, rows: Iterable[Tuple[str, str]]) -> None:
+        # adds the (id, name_key) rows of new contacts to the fuzzy tables
+        new_tokens: Set[str] = set()
+        for id, name_key in rows:
+            for token in set(name_key.split()):
+                if not self._has_token(conn, token):
+                    new_tokens.add(token)
+
+                conn.execute(
+                    "INSERT OR IGNORE INTO name_tokens (token, id) VALUES (?, ?)", (token, id)
+                )
+
+        conn.executemany(
+            "INSERT OR IGNORE INTO token_deletes (variant, token) VALUES (?, ?)",
+            ((variant, token) for token in new_tokens for variant in deletes(token, MAX_DISTANCE)),
+        )
+
+    def unindex_names(self, conn: sqlite3.Connection, ids: Iterable[str]) -> None:
+        # removes the contacts from the fuzzy tables, with the deletes of the
+        # tokens no other contact has
+        tokens: Set[str] = set()
+        for id in ids:
+            tokens.update(
+                token
+                for token, in conn.execute("SELECT token FROM name_tokens WHERE id = ?", (id,))
+            )
+            conn.execute("DELETE FROM name_tokens WHERE id = ?", (id,))
+
+        conn.executemany(
+            "DELETE FROM token_deletes WHERE variant = ? AND token = ?",
+            (
+                (variant, token)
+                for token in tokens
+                if not self._has_token(conn, token)
+                for variant in deletes(token, MAX_DISTANCE)
+            ),
+        )
+
+    def close(self) -> None:
+        for conn in self._connections.values():
+            conn.close()
+
+        self._connections.clear()
+
+    def _build_fuzzy(self, conn: sqlite3.Connection) -> None:
+        token_ids: Dict[str, List[str]] = {}
+        for id, name_key in conn.execute("SELECT id, name_key FROM contacts"):
+            for token in set(name_key.split()):
+                token_ids.setdefault(token, []).append(id)
+
+        conn.execute("DELETE FROM name_tokens")
+        conn.execute("DELETE FROM token_deletes")
+        conn.execute("DELETE FROM fuzzy_state")
+        conn.executemany(
+            "INSERT INTO name_tokens (token, id) VALUES (?, ?)",
+            ((token, id) for token, ids in token_ids.items() for id in ids),
+        )
+        conn.executemany(
+            "INSERT INTO token_deletes (variant, token) VALUES (?, ?)",
+            ((variant, token) for token in token_ids for variant in deletes(token, MAX_DISTANCE)),
+        )
+        conn.execute("INSERT INTO fuzzy_state (built) VALUES (1)")
+
+    @staticmethod
+    def _fuzzy_built(conn: sqlite3.Connection) -> bool:
+        return conn.execute("SELECT 1 FROM fuzzy_state").fetchone() is not None
+
+    @staticmethod
+    def _has_token(conn: sqlite3.Connection, token: str) -> bool:
+        row = conn.execute("SELECT 1 FROM name_tokens WHERE token = ? LIMIT 1", (token,))
+        return row.fetchone() is not None
+
+    @staticmethod
+    def to_row(contact: dict) -> tuple:
+        # same key as AddressBook._name_keys (lowercase Contact.get_full_name)
+        name_key = f"{contact['first_name'].capitalize()} {contact['last_name'].capitalize()}".lower()
+        return (
+            contact["id"],
+            contact["first_name"],
+            contact["last_name"],
+            contact["phone"],
+            contact.get("email"),
+            name_key,
+        )
+
+    @staticmethod
+    def from_row(row: tuple) -> dict:
+        return {
+            "id": row[0],
+            "first_name": row[1],
+            "last_name": row[2],
+            "phone": row[3],
+            "email": row[4],
+        }
+
+
+
+class SnapshotStorage:
+    # Binary columnar snapshot of the book, read through mmap by SnapshotReader
+    # without decoding it: SnapshotAddressBook opens a million contacts book in
+    # milliseconds and decodes the contacts it touches.
+    # Layout: header (MAGIC, VERSION, number of contacts), then the sections
+    # in SNAPSHOT_SECTIONS order, each one a little-endian u64 byte length
+    # followed by the payload, padded to 8 bytes:
+    #   string_offsets  u32 start of every string in strings, plus the end
+    #   strings         every distinct utf-8 string (ids, names, phones, emails)
+    #   records         5 u32 string numbers per contact: id, first name, last
+    #                   name, phone, email (NO_STRING without), sorted by
+    #                   (last name, first name, id) like list_contacts
+    #   id_index        record numbers sorted by id
+    #   phone_index     record numbers sorted by phone
+    #   email_index     record numbers of the contacts with an email, sorted by
+    #                   (domain, email)
+    #   name_offsets    u32 start of every record's name key in names, plus the end
+    #   names           the name keys (lowercase full names) joined by "\n", a
+    #                   substring search is a find over this section
+    MAGIC = b"CBKSNAP\0"
+    VERSION = 1
+    HEADER = struct.Struct("<8sII")
+    SECTION_LEN = struct.Struct("<Q")
+    SECTIONS = (
+        "string_offsets",
+        "strings",
+        "records",
+        "id_index",
+        "phone_index",
+        "email_index",
+        "name_offsets",
+        "names",
+    )
+    RECORD_FIELDS = 5
+    NO_STRING = 0xFFFFFFFF
+
+    def save(self, data: Dict[str, dict], path: str) -> None:
+        sections = self._build_sections(data)
+        _write_atomic(path, lambda file: self._write_sections(file, len(data), sections), "wb")
+
+    def load(self, path: str) -> Dict[str, dict]:
+        return dict(self.iter_load(path))
+
+    def iter_load(
+        self, path: str, progress: Optional[Callable[[int, int], None]] = None
+    ) -> Iterator[Tuple[str, dict]]:
+        reader = self.open(path)
+
+        try:
+            total = len(reader)
+            for n in range(total):
+                contact = reader.contact(n)
+                yield contact["id"], contact
+
+                # progress in bytes like the json storages, estimated per record
+                if progress is not None and (n + 1) % CHUNK_SIZE == 0:
+                    progress(reader.size * (n + 1) // total, reader.size)
+
+            if progress is not None:
+                progress(reader.size, reader.size)
+
+        finally:
+            reader.close()
+
+    def open(self, path: str) -> "SnapshotReader":
+        return SnapshotReader(path)
+
+    def _build_sections(self, data: Dict[str, dict]) -> Dict[str, bytes]:
+        contacts = sorted(
+            data.values(),
+            key=lambda contact: (contact["last_name"], contact["first_name"], contact["id"]),
+        )
+        strings: Dict[str, int] = {}  # maps string -> string number
+
+        records = array("I")
+        for contact in contacts:
+            email = contact.get("email")
+            records.extend(
+                (
+                    strings.setdefault(contact["id"], len(strings)),
+                    strings.setdefault(contact["first_name"], len(strings)),
+                    strings.setdefault(contact["last_name"], len(strings)),
+                    strings.setdefault(contact["phone"], len(strings)),
+                    strings.setdefault(email, len(strings)) if email else self.NO_STRING,
+                )
+            )
+
+        encoded = [string.encode() for string in strings]
+        names = [SqliteStorage.to_row(contact)[5].encode() for contact in contacts]
+        numbers = range(len(contacts))
+
+        return {
+            "string_offsets": self._offsets(encoded, separator=0),
+            "strings": b"".join(encoded),
+            "records": records,
+            "id_index": array("I", sorted(numbers, key=lambda n: contacts[n]["id"])),
+            "phone_index": array("I", sorted(numbers, key=lambda n: contacts[n]["phone"])),
+            "email_index": array(
+                "I",
+                sorted(
+                    (n for n in numbers if contacts[n].get("email")),
+                    key=lambda n: SnapshotReader.email_key(contacts[n]["email"]),
+                ),
+            ),
+            "name_offsets": self._offsets(names, separator=1),
+            "names": b"\n".join(names),
+        }
+
+    def _write_sections(self, file: IO, count: int, sections: Dict[str, bytes]) -> None:
+        file.write(self.HEADER.pack(self.MAGIC, self.VERSION, count))
+
+        for name in self.SECTIONS:
+            payload = sections[name]
+            if isinstance(payload, array):
+                if sys.byteorder != "little":
+                    payload.byteswap()
+                payload = payload.tobytes()
+
+            file.write(self.SECTION_LEN.pack(len(payload)))
+            file.write(payload)
+            file.write(b"\0" * (-len(payload) % 8))
+
+    def _offsets(self, encoded: List[bytes], separator: int) -> array:
+        offsets = array("I", [0])
+        end = 0
+        for item in encoded:
+            end += len(item) + separator
+            offsets.append(end)
+
+        if end > self.NO_STRING:
+            raise StorageError("The book is too big for a snapshot file.")
+
+        return offsets
+
+
+class SnapshotReader:
+    # Read only view of a SnapshotStorage file: the file is memory mapped and
+    # the u32 sections are used in place, contacts are decoded when accessed
+    def __init__(self, path: str):
+        if not path or not os.path.exists(path):
+            raise StorageError(f"File '{path}' not found.")
+
+        try:
+            with open(path, "rb") as file:
+                self._mm = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        except ValueError as e:
+            # an empty file can't be mapped
+            raise FileCorruptionError("Invalid snapshot file.") from e
+
+        except OSError as e:
+            raise StorageError(f"Could not open '{path}': {e}") from e
+
+        self.path = path
+        self.size = len(self._mm)
+        self._views: List[memoryview] = []
+
+        try:
+            self._read_sections()
+        except FileCorruptionError:
+            self.close()
+            raise
+
+    def __len__(self) -> int:
+        return self._count
+
+    def close(self) -> None:
+        # the memoryviews must be released before the mmap can be closed
+        for view in self._views:
+            view.release()
+
+        self._views.clear()
+        self._mm.close()
+
+    def string(self, number: int) -> Optional[str]:
+        if number == SnapshotStorage.NO_STRING:
+            return None
+
+        start = self._strings + self._string_offsets[number]
+        end = self._strings + self._string_offsets[number + 1]
+        return self._mm[start:end].decode()
+
+    def field(self, record: int, field: int) -> Optional[str]:
+        return self.string(self._records[record * SnapshotStorage.RECORD_FIELDS + field])
+
+    def contact(self, record: int) -> dict:
+        id, first_name, last_name, phone, email = (
+            self.string(number)
+            for number in self._records[
+                record * SnapshotStorage.RECORD_FIELDS : (record + 1) * SnapshotStorage.RECORD_FIELDS
+            ]
+        )
+        return {
+            "id": id,
+            "first_name": first_name,
+            "last_name": last_name,
+            "phone": phone,
+            "email": email,
+        }
+
+    def find_id(self, id: str) -> Optional[int]:
+        return self._find(self._id_index, id, lambda record: self.field(record, 0))
+
+    def find_phone(self, phone: str) -> Optional[int]:
+        return self._find(self._phone_index, phone, lambda record: self.field(record, 3))
+
+    def find_email(self, email: str) -> Optional[int]:
+        return self._find(
+            self._email_index,
+            self.email_key(email),
+            lambda record: self.email_key(self.field(record, 4)),
+        )
+
+    def phone_prefix(self, prefix: str) -> List[int]:
+        key = lambda pos: self.field(self._phone_index[pos], 3)
+        lo = bisect_left(range(len(self._phone_index)), prefix, key=key)
+        hi = bisect_left(range(len(self._phone_index)), prefix + "\uffff", key=key)
+        return sorted(self._phone_index[lo:hi])
+
+    def domain(self, domain: str) -> List[int]:
+        lo, hi = self._domain_range(domain, 0)
+        return sorted(self._email_index[lo:hi])
+
+    def domain_counts(self) -> Dict[str, int]:
+        # one bisect per distinct domain instead of a pass over every email
+        counts = {}
+        lo = 0
+        while lo < len(self._email_index):
+            domain = self.email_key(self.field(self._email_index[lo], 4))[0]
+            _, hi = self._domain_range(domain, lo)
+            counts[domain] = hi - lo
+            lo = hi
+
+        return counts
+
+    def last_name_range(self, start: Optional[str], end: Optional[str]) -> range:
+        key = lambda record: self.field(record, 2)
+        lo = 0 if start is None else bisect_left(range(self._count), start, key=key)
+        hi = (
+            self._count
+            if end is None
+            else bisect_right(range(self._count), end + "\uffff", key=key)
+        )
+        return range(lo, hi)
+
+    def search_names(self, normalized_query: str) -> List[int]:
+        # records whose name key contains the query, in record (sorted) order
+        query = normalized_query.encode()
+        records = []
+        start = self._names
+        end = self._names_end
+
+        # after the last name start goes past end (names has no trailing "\n")
+        while self._count and start <= end:
+            pos = self._mm.find(query, start, end)
+            if pos < 0:
+                break
+
+            # a match across the "\n" between two names isn't a match
+            record = bisect_right(self._name_offsets, pos - self._names) - 1
+            next_name = self._names + self._name_offsets[record + 1]
+
+            if pos + len(query) < next_name:
+                records.append(record)
+                start = next_name
+            else:
+                start = pos + 1
+
+        return records
+
+    @staticmethod
+    def email_key(email: str) -> Tuple[str, str]:
+        return email.rpartition("@")[2].lower(), email
+
+    def _domain_range(self, domain: str, lo: int) -> Tuple[int, int]:
+        key = lambda pos: self.email_key(self.field(self._email_index[pos], 4))[0]
+        positions = range(len(self._email_index))
+        return (
+            bisect_left(positions, domain, lo=lo, key=key),
+            bisect_right(positions, domain, lo=lo, key=key),
+        )
+
+    def _find(self, index: memoryview, value, key) -> Optional[int]:
+        positions = range(len(index))
+        pos = bisect_left(positions, value, key=lambda pos: key(index[pos]))
+
+        if pos < len(index) and key(index[pos]) == value:
+            return index[pos]
+
+        return None
+
+    def _read_sections(self) -> None:
+        header = SnapshotStorage.HEADER
+        if self.size < header.size:
+            raise FileCorruptionError("Invalid snapshot file.")
+
+        magic, version, self._count = header.unpack_from(self._mm, 0)
+        if magic != SnapshotStorage.MAGIC:
+            raise FileCorruptionError("Invalid snapshot file.")
+
+        if version != SnapshotStorage.VERSION:
+            raise FileCorruptionError(f"Unsupported snapshot version {version}.")
+
+        offset = header.size
+        sections = {}
+        for name in SnapshotStorage.SECTIONS:
+            if offset + SnapshotStorage.SECTION_LEN.size > self.size:
+                raise FileCorruptionError("Truncated snapshot file.")
+
+            (length,) = SnapshotStorage.SECTION_LEN.unpack_from(self._mm, offset)
+            offset += SnapshotStorage.SECTION_LEN.size
+
+            if offset + length > self.size:
+                raise FileCorruptionError("Truncated snapshot file.")
+
+            sections[name] = (offset, length)
+            offset += length + (-length % 8)
+
+        self._strings = sections["strings"][0]
+        self._names = sections["names"][0]
+        self._names_end = self._names + sections["names"][1]
+        self._string_offsets = self._u32(*sections["string_offsets"])
+        self._records = self._u32(*sections["records"])
+        self._id_index = self._u32(*sections["id_index"])
+        self._phone_index = self._u32(*sections["phone_index"])
+        self._email_index = self._u32(*sections["email_index"])
+        self._name_offsets = self._u32(*sections["name_offsets"])
+
+        if (
+            len(self._records) != self._count * SnapshotStorage.RECORD_FIELDS
+            or len(self._id_index) != self._count
+            or len(self._phone_index) != self._count
+            or len(self._name_offsets) != self._count + 1
+            or self._string_offsets[-1] != sections["strings"][1]
+            or self._name_offsets[-1] > sections["names"][1] + 1
+        ):
+            raise FileCorruptionError("Invalid snapshot file.")
+
+    def _u32(self, offset: int, length: int):
+        if length % 4:
+            raise FileCorruptionError("Invalid snapshot file.")
+
+        if sys.byteorder != "little":
+            # big endian machines read a swapped copy instead of the mapping
+            values = array("I", self._mm[offset : offset + length])
+            values.byteswap()
+            return values
+
+        view = memoryview(self._mm)[offset : offset + length].cast("I")
+        self._views.append(view)
+        return view
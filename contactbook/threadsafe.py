@@ -0,0 +1,259 @@
+import threading
+from bisect import bisect_left, bisect_right
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+from .addressbook import AddressBook, ImportReport
+from .contacts import Contact
+from .storage import Storage
+
+# contacts yielded by iter_contacts per read lock, so a long listing doesn't
+# keep the writers waiting
+ITER_BATCH_SIZE = 500
+
+
+@dataclass(eq=False)
+class Iteration:
+    # an iter_contacts in progress: the last key it read, and the ids at or
+    # before it the writers took out of the sorted keys since (an update can
+    # put them back after last_key, they are skipped when read again)
+    last_key: Optional[Tuple[str, str, str]] = None
+    moved: Set[str] = field(default_factory=set)
+
+
+class RWLock:
+    # Many readers or one writer. A waiting writer stops new readers from
+    # entering, so a steady flow of searches can't starve the writes.
+    # The writer can take the lock again (read or write), so a transaction
+    # can call the other locked methods.
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._readers = 0
+        self._writer: Optional[int] = None  # thread id of the writer
+        self._waiting_writers = 0
+
+    @contextmanager
+    def read(self):
+        if self._writer == threading.get_ident():
+            yield
+            return
+
+        with self._cond:
+            while self._writer or self._waiting_writers:
+                self._cond.wait()
+            self._readers += 1
+
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        if self._writer == threading.get_ident():
+            yield
+            return
+
+        with self._cond:
+            self._waiting_writers += 1
+            while self._writer is not None or self._readers:
+                self._cond.wait()
+            self._waiting_writers -= 1
+            self._writer = threading.get_ident()
+
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = None
+                self._cond.notify_all()
+
+
+class ThreadSafeAddressBook(AddressBook):
+    # AddressBook that can be shared between threads: lookups run under the
+    # read lock (concurrently), mutations under the write lock, so the
+    # non atomic index updates are never seen half done.
+    # Saves only hold the read lock while copying the book (see
+    # _take_snapshot), writing it blocks neither readers nor writers; a
+    # mutex keeps two saves from running at the same time. It is taken
+    # before the read lock, never while holding it.
+    # The search cache is the only state changed by reads, it has its own lock.
+    def __init__(self, storage: Storage):
+        super().__init__(storage)
+        self._lock = RWLock()
+        self._save_lock = threading.RLock()
+        self._cache_lock = threading.Lock()
+        self._iterations: Set[Iteration] = set()
+        self._iterations_lock = threading.Lock()
+
+    # writers
+    def add_contact(self, contact: Contact) -> None:
+        with self._lock.write():
+            super().add_contact(contact)
+
+    def delete_contact(self, contact: Contact) -> None:
+        with self._lock.write():
+            super().delete_contact(contact)
+
+    def update_contact(
+        self, contact_to_update: Contact, updated_contact: Contact
+    ) -> None:
+        with self._lock.write():
+            super().update_contact(contact_to_update, updated_contact)
+
+    def add_validated(
+        self,
+        rows: Iterable[Tuple[int, object]],
+        atomic: bool = False,
+        seen: Optional[Dict[str, int]] = None,
+    ) -> ImportReport:
+        # bulk_add ends up here with a lazy generator: validate the rows
+        # before taking the lock, not while the readers wait
+        rows = list(rows)
+
+        with self._lock.write():
+            return super().add_validated(rows, atomic, seen)
+
+    def merge_contacts(self, keep: Contact, duplicates: Iterable[Contact]) -> Contact:
+        # the deletes and the update of a merge are seen all at once
+        with self._lock.write():
+            return super().merge_contacts(keep, duplicates)
+
+    @contextmanager
+    def transaction(self):
+        # the other threads wait for the whole transaction
+        with self._lock.write(), super().transaction():
+            yield self
+
+    def undo(self) -> bool:
+        with self._lock.write():
+            return super().undo()
+
+    def redo(self) -> bool:
+        with self._lock.write():
+            return super().redo()
+
+    def load(self, path: str, progress=None):
+        with self._lock.write():
+            super().load(path, progress)
+
+    def save(self, path: str):
+        # the copy and its write, with no other save in between
+        with self._save_lock:
+            super().save(path)
+
+    def _take_snapshot(self, path: str):
+        # the copy needs a book no writer is changing, the write doesn't
+        with self._lock.read():
+            return super()._take_snapshot(path)
+
+    def _write_snapshot(self, snapshot) -> None:
+        with self._save_lock:
+            super()._write_snapshot(snapshot)
+
+    # readers
+    def get_contact(self, id: str) -> Optional[Contact]:
+        with self._lock.read():
+            return super().get_contact(id)
+
+    def list_contacts(self, offset: int = 0, limit: Optional[int] = None) -> List[Contact]:
+        with self._lock.read():
+            return super().list_contacts(offset, limit)
+
+    def iter_contacts(
+        self, start: Optional[str] = None, end: Optional[str] = None
+    ) -> Iterator[Contact]:
+        # yield in batches, every batch restarts after the last key yielded,
+        # so writes between two batches don't make it skip or repeat contacts.
+        # An update can still move a contact already yielded after last_key,
+        # _unindex_contact records it in the moved ids of the iteration.
+        iteration = Iteration()
+        with self._iterations_lock:
+            self._iterations.add(iteration)
+
+        try:
+            while True:
+                with self._lock.read():
+                    self._sort_pending()
+                    keys = self._sorted_keys
+                    if iteration.last_key is None:
+                        lo = 0 if start is None else bisect_left(keys, (start,))
+                    else:
+                        lo = bisect_right(keys, iteration.last_key)
+
+                    hi = len(keys) if end is None else bisect_right(keys, (end + "\uffff",))
+                    batch_keys = keys[lo : min(hi, lo + ITER_BATCH_SIZE)]
+                    if not batch_keys:
+                        return
+
+                    iteration.last_key = batch_keys[-1]
+                    # the previous batches are all yielded: a moved id found
+                    # again is a repeat
+                    moved = iteration.moved
+                    batch = [self.contacts[id] for *_, id in batch_keys if id not in moved]
+                    if moved:
+                        moved.difference_update(id for *_, id in batch_keys)
+
+                yield from batch
+
+        finally:
+            with self._iterations_lock:
+                self._iterations.discard(iteration)
+
+    def search_contact(self, query: str) -> List[Contact]:
+        with self._lock.read():
+            return super().search_contact(query)
+
+    def search_fuzzy(self, query: str, k: int = 5, max_distance: int = 2) -> List[Contact]:
+        with self._lock.read():
+            return super().search_fuzzy(query, k, max_distance)
+
+    def search_phone(
+        self, prefix: Optional[str] = None, suffix: Optional[str] = None
+    ) -> List[Contact]:
+        with self._lock.read():
+            return super().search_phone(prefix, suffix)
+
+    def contacts_by_domain(self, domain: str) -> List[Contact]:
+        with self._lock.read():
+            return super().contacts_by_domain(domain)
+
+    def domain_counts(self) -> Dict[str, int]:
+        with self._lock.read():
+            return super().domain_counts()
+
+    def cache_stats(self) -> Dict[str, int]:
+        with self._cache_lock:
+            return super().cache_stats()
+
+    def __len__(self):
+        with self._lock.read():
+            return super().__len__()
+
+    def _unindex_contact(self, contact: Contact) -> None:
+        # under the write lock: the contact may be put back after the last key
+        # of an iteration that already yielded it
+        if self._iterations:
+            key = self._sort_key(contact)
+            with self._iterations_lock:
+                for iteration in self._iterations:
+                    if iteration.last_key is not None and key <= iteration.last_key:
+                        iteration.moved.add(contact.id)
+
+        super()._unindex_contact(contact)
+
+    # search cache, shared by the concurrent readers
+    def _cached_search(self, normalized_query: str):
+        with self._cache_lock:
+            return super()._cached_search(normalized_query)
+
+    def _narrowed_search(self, normalized_query: str):
+        with self._cache_lock:
+            return super()._narrowed_search(normalized_query)
+
+    def _cache_search(self, normalized_query: str, ids: Tuple[str, ...]) -> None:
+        with self._cache_lock:
+            super()._cache_search(normalized_query, ids)
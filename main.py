@@ -2,12 +2,22 @@ import sys
 from os import name, system
 from contactbook.contacts import Contact
 from contactbook.addressbook import AddressBook
-from contactbook.storage import Storage, JsonStorage
+from contactbook.threadsafe import ThreadSafeAddressBook
+from contactbook.storage import Storage, JsonStorage, SnapshotStorage, SqliteStorage
+from contactbook.sqlite_addressbook import SqliteAddressBook
+from contactbook.snapshot_addressbook import SnapshotAddressBook
 from contactbook.contact_validators import validate_phone_number, validate_email
+from contactbook.importers import import_file
+from contactbook.autosave import BackgroundSaver
 from contactbook.helpers import (
     prompt_contact_fields,
     render_contacts,
+    page_contacts,
     get_contact,
+    print_load_progress,
+    print_import_progress,
+    end_import_progress,
+    PAGE_SIZE,
 )
 from contactbook.contact_exceptions import (
     InvalidPhoneError,
@@ -15,20 +25,26 @@ from contactbook.contact_exceptions import (
     ContactValidationError,
     DuplicateContactError,
     ContactNotFoundError,
+    UnsupportedOperationError,
     StorageError,
     FileCorruptionError,
 )
 
 
+AUTOSAVE_INTERVAL = 60.0  # seconds, once turned on with the autosave command
+
+
 def main():
+    # json books are thread safe, the autosave thread copies them while the
+    # prompt changes them
     storage: Storage = JsonStorage()
-    addressbook: AddressBook = AddressBook(storage)
+    addressbook: AddressBook = ThreadSafeAddressBook(storage)
 
     while True:
         print("""\nStarting menu commands: 
 
 new: start a new address book.
-load: load from json file.
+load: load from json file (or sqlite .db, snapshot .cbk file).
 clear: clear the screen
 exit: exit from the program.
 """)
@@ -36,15 +52,23 @@ exit: exit from the program.
         cmd = input("> ").strip().lower()
 
         if cmd == "new":
-            addressbook: AddressBook = AddressBook(storage)
+            addressbook = ThreadSafeAddressBook(storage)
             print("Started a new address book.")
             break
 
         elif cmd == "load":
             path = input("Path to JSON: ").strip()
 
+            # sqlite and snapshot books are opened lazily instead of loaded in memory
+            if path.endswith((".db", ".sqlite")):
+                addressbook = SqliteAddressBook(SqliteStorage())
+            elif path.endswith(".cbk"):
+                addressbook = SnapshotAddressBook(SnapshotStorage())
+            else:
+                addressbook = ThreadSafeAddressBook(storage)
+
             try:
-                addressbook.load(path)
+                addressbook.load(path, progress=print_load_progress)
                 print(f"Loaded {len(addressbook)} contacts from {path}.")
                 break
 
@@ -67,6 +91,30 @@ exit: exit from the program.
         else:
             print("Invalid command.")
 
+    # json books are written on a background thread, the prompt doesn't wait
+    # for big saves; sqlite books only commit, they keep saving inline
+    saver = None
+    if not isinstance(addressbook, SqliteAddressBook):
+        saver = BackgroundSaver(addressbook)
+
+    def save(path: str) -> None:
+        if saver is None:
+            addressbook.save(path)
+        else:
+            saver.request_save(path)
+
+    def finish_saves() -> bool:
+        # wait for the background writes, False if the last one failed
+        if saver is None:
+            return True
+
+        saver.close()
+        if saver.last_error is not None:
+            print(f"Error: {saver.last_error}")
+            return False
+
+        return True
+
     while True:
         print("""\nCommands: 
 
@@ -75,7 +123,11 @@ list: list all contacts
 search: search a contact
 edit: edit a contact
 delete: delete a contact
+undo: undo the last change
+redo: redo the last undone change
+import: import contacts from a csv or vcard (.vcf) file
 save: save the changes
+autosave: save the changes every minute (on/off)
 clear: clear the screen
 exit: exit from the application
 """)
@@ -98,7 +150,10 @@ exit: exit from the application
             print(f"\nContact '{contact.get_full_name()}' added successfully.")
 
         elif cmd == "list":
-            render_contacts(addressbook.list_contacts())
+            if len(addressbook) > PAGE_SIZE:
+                page_contacts(addressbook)
+            else:
+                render_contacts(addressbook.iter_contacts())
 
         elif cmd == "search":
             query = input("\nSearch contact: ")
@@ -192,13 +247,67 @@ exit: exit from the application
                     f"\nContact '{contact_found.get_full_name()}' removed successfully."
                 )
 
+        elif cmd in ("undo", "redo"):
+            try:
+                done = addressbook.undo() if cmd == "undo" else addressbook.redo()
+            except UnsupportedOperationError as e:
+                print(e)
+                continue
+
+            print("Done." if done else f"Nothing to {cmd}.")
+
+        elif cmd == "import":
+            path = input("Path to CSV or vCard: ").strip()
+
+            try:
+                report = import_file(addressbook, path, progress=print_import_progress)
+                end_import_progress(report)
+            except StorageError as e:
+                print(f"Error: {e}")
+                continue
+
+            for row_number, error in report.errors:
+                print(f"Row {row_number}: {error}")
+
+            print(
+                f"\nImported {len(report.added)} contacts, {len(report.errors)} rows skipped "
+                f"({report.rows_per_sec:,.0f} rows/s)."
+            )
+
         elif cmd == "save":
             path = input("Path to save JSON: ").strip()
-            addressbook.save(path)
-            print(f"Saved to '{path}'.")
+
+            try:
+                save(path)
+            except StorageError as e:
+                print(f"Error: {e}")
+                continue
+
+            if finish_saves():
+                print(f"Saved to '{path}'.")
 
             break
 
+        elif cmd == "autosave":
+            if not isinstance(addressbook, ThreadSafeAddressBook):
+                print("Autosave is only available for JSON books.")
+                continue
+
+            if saver.autosave_interval:
+                saver.set_autosave(None)
+                print("Autosave off.")
+                continue
+
+            path = input("Path to save JSON: ").strip()
+
+            try:
+                saver.set_autosave(AUTOSAVE_INTERVAL, path)
+            except StorageError as e:
+                print(f"Error: {e}")
+                continue
+
+            print(f"Autosave on, the changes are saved to '{path}' every minute.")
+
         elif cmd == "clear":
             if name == "nt":
                 system("cls")
@@ -219,9 +328,10 @@ exit: exit from the application
 
                 if answer == "y":
                     path = input("Path to save JSON: ").strip()
-                    addressbook.save(path)
+                    save(path)
                     print("\nChanges saved correctly.")
 
+            finish_saves()
             print("\nExiting from the contact book.")
             sys.exit()
 
@@ -230,4 +340,10 @@ exit: exit from the application
 
 
 if __name__ == "__main__":
+    # with arguments run the non interactive commands (see contactbook/cli.py)
+    if len(sys.argv) > 1:
+        from contactbook.cli import main as cli_main
+
+        sys.exit(cli_main(sys.argv[1:]))
+
     main()
@@ -1,4 +1,5 @@
 import unittest
+from unittest.mock import patch
 from contactbook.storage import JsonStorage
 from contactbook.contacts import Contact
 from contactbook.addressbook import AddressBook
@@ -86,6 +87,335 @@ class TestAddressBook(unittest.TestCase):
         with self.assertRaises(ContactNotFoundError):
             self.addressbook.search_contact("leonardo")
 
+    def test_search_contact_uses_name_index(self):
+        self.addressbook.add_contact(self.contact)
+        leonardo = Contact(
+            first_name="Leonardo",
+            last_name="Da Vinci",
+            phone_number="+39 339 1111111",
+        )
+        self.addressbook.add_contact(leonardo)
+
+        # query spanning first and last name and queries shorter than a trigram
+        self.assertEqual(self.addressbook.search_contact("rt ein"), [self.contact])
+        self.assertEqual(len(self.addressbook.search_contact("e")), 2)
+
+        self.addressbook.delete_contact(leonardo)
+        with self.assertRaises(ContactNotFoundError):
+            self.addressbook.search_contact("vinci")
+        self.assertNotIn(leonardo.id, self.addressbook._name_keys)
+
+    def test_search_contact_after_update(self):
+        self.addressbook.add_contact(self.contact)
+
+        updated_contact = Contact(
+            first_name="Isaac",
+            last_name="Newton",
+            phone_number="+39 339 3842348",
+        )
+        self.addressbook.update_contact(self.contact, updated_contact)
+
+        self.assertEqual(updated_contact.id, self.contact.id)
+        self.assertEqual(self.addressbook.search_contact("newt"), [updated_contact])
+        with self.assertRaises(ContactNotFoundError):
+            self.addressbook.search_contact("einstein")
+
+
+    def test_list_contacts_sorted_and_paginated(self):
+        names = [("Marie", "Curie"), ("Isaac", "Newton"), ("Max", "Planck"), ("Niels", "Bohr")]
+        for i, (first_name, last_name) in enumerate(names):
+            self.addressbook.add_contact(
+                Contact(
+                    first_name=first_name,
+                    last_name=last_name,
+                    phone_number=f"+39339000000{i}",
+                )
+            )
+
+        last_names = [c.last_name for c in self.addressbook.list_contacts()]
+        self.assertEqual(last_names, ["Bohr", "Curie", "Newton", "Planck"])
+
+        page = self.addressbook.list_contacts(offset=1, limit=2)
+        self.assertEqual([c.last_name for c in page], ["Curie", "Newton"])
+
+        # end is inclusive as a prefix
+        in_range = self.addressbook.iter_contacts("C", "P")
+        self.assertEqual([c.last_name for c in in_range], ["Curie", "Newton", "Planck"])
+
+        newton = self.addressbook.search_contact("newton")[0]
+        self.addressbook.update_contact(
+            newton,
+            Contact(first_name="Isaac", last_name="Asimov", phone_number="+393390000001"),
+        )
+        last_names = [c.last_name for c in self.addressbook.list_contacts()]
+        self.assertEqual(last_names, ["Asimov", "Bohr", "Curie", "Planck"])
+
+    def test_search_fuzzy(self):
+        self.addressbook.add_contact(self.contact)
+        newton = Contact(first_name="Isaac", last_name="Newton", phone_number="+393390000001")
+        self.addressbook.add_contact(newton)
+        self.addressbook.add_contact(
+            Contact(first_name="Albert", last_name="Camus", phone_number="+393390000002")
+        )
+
+        self.assertEqual(self.addressbook.search_fuzzy("Einstien")[0], self.contact)
+        self.assertEqual(self.addressbook.search_fuzzy("albrt einstien", k=1), [self.contact])
+        self.assertEqual(len(self.addressbook.search_fuzzy("albert")), 2)
+
+        self.addressbook.delete_contact(newton)
+        with self.assertRaises(ContactNotFoundError):
+            self.addressbook.search_fuzzy("newtn")
+
+        self.addressbook.update_contact(
+            self.contact,
+            Contact(first_name="Isaac", last_name="Newton", phone_number="+393393842348"),
+        )
+        self.assertEqual(self.addressbook.search_fuzzy("newtn")[0].id, self.contact.id)
+        with self.assertRaises(ContactNotFoundError):
+            self.addressbook.search_fuzzy("einstien")
+
+    def test_search_phone(self):
+        self.addressbook.add_contact(self.contact)
+        newton = Contact(first_name="Isaac", last_name="Newton", phone_number="+393471232348")
+        self.addressbook.add_contact(newton)
+
+        self.assertEqual(self.addressbook.search_phone(prefix="+39 347 123"), [newton])
+        self.assertEqual(self.addressbook.search_phone(prefix="34712"), [newton])
+        self.assertEqual(len(self.addressbook.search_phone(suffix="2348")), 2)
+        self.assertEqual(
+            self.addressbook.search_phone(prefix="347", suffix="2348"), [newton]
+        )
+
+        self.addressbook.update_contact(
+            newton,
+            Contact(first_name="Isaac", last_name="Newton", phone_number="+393480000000"),
+        )
+        self.assertEqual(self.addressbook.search_phone(suffix="2348"), [self.contact])
+        self.assertEqual(self.addressbook.search_phone(prefix="348")[0].id, newton.id)
+
+        self.addressbook.delete_contact(self.contact)
+        with self.assertRaises(ContactNotFoundError):
+            self.addressbook.search_phone(suffix="2348")
+
+    def test_domain_index(self):
+        self.addressbook.add_contact(self.contact)
+        newton = Contact(
+            first_name="Isaac",
+            last_name="Newton",
+            phone_number="+393390000001",
+            email="isaac@Test.com",
+        )
+        self.addressbook.add_contact(newton)
+        self.addressbook.add_contact(
+            Contact(
+                first_name="Max",
+                last_name="Planck",
+                phone_number="+393390000002",
+                email="max@physics.org",
+            )
+        )
+
+        self.assertEqual(
+            self.addressbook.domain_counts(), {"test.com": 2, "physics.org": 1}
+        )
+        self.assertEqual(
+            self.addressbook.contacts_by_domain("@test.com"), [self.contact, newton]
+        )
+
+        self.addressbook.update_contact(
+            newton,
+            Contact(
+                first_name="Isaac",
+                last_name="Newton",
+                phone_number="+393390000001",
+                email="isaac@physics.org",
+            ),
+        )
+        self.assertEqual(
+            self.addressbook.domain_counts(), {"physics.org": 2, "test.com": 1}
+        )
+
+        self.addressbook.delete_contact(self.contact)
+        with self.assertRaises(ContactNotFoundError):
+            self.addressbook.contacts_by_domain("test.com")
+        self.assertEqual(self.addressbook.domain_counts(), {"physics.org": 2})
+
+    def test_search_cache(self):
+        self.addressbook.add_contact(self.contact)
+        newton = Contact(first_name="Isaac", last_name="Newton", phone_number="+393390000001")
+        self.addressbook.add_contact(newton)
+
+        self.assertEqual(self.addressbook.search_contact("n"), [self.contact, newton])
+        self.assertEqual(self.addressbook.search_contact(" N "), [self.contact, newton])
+        # "ne" narrows the cached "n" results
+        self.assertEqual(self.addressbook.search_contact("ne"), [newton])
+        self.assertEqual(
+            self.addressbook.cache_stats(),
+            {"hits": 1, "misses": 2, "narrowed": 1, "entries": 2, "ids": 3},
+        )
+
+        # adding a matching contact invalidates the "n" and "ne" entries only
+        self.addressbook.search_contact("einstein")
+        planck = Contact(first_name="Ernest", last_name="Planck", phone_number="+393390000002")
+        self.addressbook.add_contact(planck)
+        self.assertEqual(list(self.addressbook._search_cache), ["einstein"])
+        self.assertEqual(self.addressbook.search_contact("ne"), [newton, planck])
+
+        self.addressbook.delete_contact(newton)
+        self.assertEqual(self.addressbook.search_contact("ne"), [planck])
+
+        # "einst" has a trigram rarer than the cached "e" results, it uses the index
+        self.addressbook.search_contact("e")
+        narrowed = self.addressbook.cache_narrowed
+        self.assertEqual(self.addressbook.search_contact("einst"), [self.contact])
+        self.assertEqual(self.addressbook.cache_narrowed, narrowed)
+
+        self.addressbook.update_contact(
+            planck, Contact(first_name="Max", last_name="Planck", phone_number="+393390000002")
+        )
+        with self.assertRaises(ContactNotFoundError):
+            self.addressbook.search_contact("ne")
+
+    def test_find_duplicates(self):
+        mario = Contact("Mario", "Rossi", "+393390000001", email="mario.rossi@test.com")
+        swapped = Contact("Rossi", "Mario", "+393470000002")
+        typo = Contact("Mario", "Rossii", "+393470000001", email="mariorossi@work.it")
+        luigi = Contact("Luigi", "Verdi", "+393390000003", email="luigi@test.com")
+        luigi_swapped = Contact("Verdi", "Luigi", "+393470000003")
+        for contact in (mario, swapped, typo, luigi, luigi_swapped):
+            self.addressbook.add_contact(contact)
+
+        suggestions = self.addressbook.find_duplicates()
+
+        # the same name with nothing else in common (swapped) is not suggested,
+        # a name (even with a typo) needs the same phone ending or email local part
+        self.assertEqual(
+            [(s.keep, s.duplicate) for s in suggestions],
+            [(luigi, luigi_swapped), (mario, typo)],
+        )
+        self.assertGreater(suggestions[1].score, 0.8)
+        self.assertEqual(self.addressbook.find_duplicates(threshold=0.9), [suggestions[0]])
+
+    def test_apply_merges(self):
+        swapped = Contact("Rossi", "Mario", "+393470000002", email="mario@test.com")
+        mario = Contact("Mario", "Rossi", "+393390000001", email="mario@work.it")
+        typo = Contact("Mario", "Rosi", "+393390000002")
+        for contact in (swapped, mario, typo):
+            self.addressbook.add_contact(contact)
+
+        suggestions = self.addressbook.find_duplicates()
+        self.assertEqual(self.addressbook.apply_merges(suggestions), 2)
+
+        # the one with an email is kept
+        self.assertEqual(list(self.addressbook.contacts), [swapped.id])
+        self.assertEqual(self.addressbook._phone_idx, {swapped.phone_number: swapped.id})
+        self.assertEqual(self.addressbook._email_idx, {"mario@test.com": swapped.id})
+        self.assertEqual([c.id for c in self.addressbook.search_contact("ros")], [swapped.id])
+        # nothing left to merge, the merged contacts are gone
+        self.assertEqual(self.addressbook.apply_merges(suggestions), 0)
+
+        # all the merges are undone at once
+        self.assertTrue(self.addressbook.undo())
+        self.assertEqual(len(self.addressbook), 3)
+
+    def test_merge_contacts_takes_the_duplicate_email(self):
+        self.addressbook.add_contact(self.contact)
+        keep = Contact("Albert", "Einstein", "+393390000001")
+        self.addressbook.add_contact(keep)
+
+        with self.assertRaises(ContactNotFoundError):
+            self.addressbook.merge_contacts(keep, [Contact("Max", "Planck", "+393390000002")])
+        self.assertEqual(len(self.addressbook), 2)
+
+        merged = self.addressbook.merge_contacts(keep, [self.contact])
+
+        self.assertEqual((merged.id, merged.email), (keep.id, self.contact.email))
+        self.assertEqual(self.addressbook._email_idx, {self.contact.email: keep.id})
+        self.assertEqual(self.addressbook._phone_idx, {keep.phone_number: keep.id})
+
+        # the merge is undone in one step
+        self.assertTrue(self.addressbook.undo())
+        self.assertEqual(self.addressbook.contacts[self.contact.id], self.contact)
+        self.assertIsNone(self.addressbook.contacts[keep.id].email)
+
+    def test_undo_redo(self):
+        newton = Contact(first_name="Isaac", last_name="Newton", phone_number="+393390000001")
+        self.addressbook.add_contact(self.contact)
+        self.addressbook.add_contact(newton)
+        updated = Contact(first_name="Isaac", last_name="Abel", phone_number="+393390000002")
+        self.addressbook.update_contact(newton, updated)
+        self.addressbook.delete_contact(self.contact)
+
+        self.assertTrue(self.addressbook.undo())
+        self.assertTrue(self.addressbook.undo())
+        self.assertEqual(self.addressbook.list_contacts(), [self.contact, newton])
+        self.assertEqual([c.id for c in self.addressbook.search_phone(suffix="0001")], [newton.id])
+
+        self.assertTrue(self.addressbook.redo())
+        self.assertEqual(self.addressbook.list_contacts(), [updated, self.contact])
+
+        # a new change drops what is left to redo
+        self.addressbook.delete_contact(updated)
+        self.assertFalse(self.addressbook.redo())
+
+        while self.addressbook.undo():
+            pass
+        self.assertEqual(self.addressbook.list_contacts(), [])
+        self.assertEqual(self.addressbook._phone_idx, {})
+
+    def test_transaction(self):
+        self.addressbook.add_contact(self.contact)
+        newton = Contact(first_name="Isaac", last_name="Newton", phone_number="+393390000001")
+
+        with self.assertRaises(DuplicateContactError):
+            with self.addressbook.transaction():
+                self.addressbook.add_contact(newton)
+                self.addressbook.delete_contact(self.contact)
+                self.addressbook.add_contact(
+                    Contact(first_name="Max", last_name="Planck", phone_number="+393390000001")
+                )
+
+        # rolled back, the indexes are the ones before the transaction
+        self.assertEqual(self.addressbook.list_contacts(), [self.contact])
+        self.assertEqual(self.addressbook._phone_sorted, [self.contact.phone_number])
+        self.assertEqual(self.addressbook._phone_idx, {self.contact.phone_number: self.contact.id})
+
+        with self.addressbook.transaction():
+            self.addressbook.add_contact(newton)
+            self.addressbook.delete_contact(self.contact)
+            # lookups inside the transaction see its changes
+            self.assertEqual(self.addressbook.list_contacts(), [newton])
+            self.addressbook.add_contact(self.contact)
+
+        self.assertEqual(self.addressbook.list_contacts(), [self.contact, newton])
+        self.assertTrue(self.addressbook.undo())
+        self.assertEqual(self.addressbook.list_contacts(), [self.contact])
+
+    def test_big_batches_are_sorted_once(self):
+        contacts = [Contact("Max", f"Planck{i}", f"+39339000000{i}") for i in reversed(range(6))]
+
+        # small batches keep the lists sorted with bisect, from 3 changes they
+        # are sorted at the end
+        with patch("contactbook.addressbook.SORT_BATCH_MIN", 3):
+            with self.addressbook.transaction():
+                self.addressbook.add_contact(contacts[0])
+                self.assertIsNone(self.addressbook._pending_removals)
+                for contact in contacts[1:]:
+                    self.addressbook.add_contact(contact)
+                self.assertIsNotNone(self.addressbook._pending_removals)
+                self.addressbook.delete_contact(contacts[2])
+
+            self.assertIsNone(self.addressbook._pending_removals)
+            expected = sorted(contacts[:2] + contacts[3:], key=lambda c: c.last_name)
+            self.assertEqual(self.addressbook.list_contacts(), expected)
+            self.assertEqual(self.addressbook._phone_sorted, sorted(c.phone_number for c in expected))
+
+            self.addressbook.add_contact(contacts[2])
+            self.assertTrue(self.addressbook.undo())
+            self.assertTrue(self.addressbook.undo())
+            self.assertEqual(self.addressbook._sorted_keys, [])
+            self.assertTrue(self.addressbook.redo())
+            self.assertEqual(self.addressbook.list_contacts(), expected)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,84 @@
+import os
+import tempfile
+import unittest
+from contactbook.storage import JsonStorage, JournalStorage
+from contactbook.contacts import Contact
+from contactbook.addressbook import AddressBook
+from contactbook.autosave import BackgroundSaver
+from contactbook.threadsafe import ThreadSafeAddressBook
+from contactbook.contact_exceptions import StorageError
+
+
+class TestBackgroundSaver(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "book.json")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def add_contacts(self, addressbook, start, stop):
+        for i in range(start, stop):
+            addressbook.add_contact(Contact("Max", f"Planck{i}", f"+3933900{i:05d}"))
+
+    def test_requests_are_coalesced(self):
+        storage = JournalStorage(compact_threshold=100)
+        addressbook = AddressBook(storage)
+        saver = BackgroundSaver(addressbook)
+
+        self.add_contacts(addressbook, 0, 5)
+        saver.request_save(self.path)
+
+        # hold the lock so the writer can't take the next requests, they
+        # queue up and become a single write
+        with saver._cond:
+            for i in range(5, 10):
+                self.add_contacts(addressbook, i, i + 1)
+                saver.request_save(self.path)
+
+            self.assertLessEqual(len(saver._pending), 1)
+
+        saver.close()
+
+        self.assertIsNone(saver.last_error)
+        self.assertLessEqual(saver.saves, 3)
+        self.assertFalse(addressbook.is_changed)
+
+        loaded = AddressBook(storage)
+        loaded.load(self.path)
+        self.assertEqual(len(loaded), 10)
+
+    def test_autosave_changed_book(self):
+        addressbook = ThreadSafeAddressBook(JsonStorage())
+        saver = BackgroundSaver(addressbook)
+
+        # off until asked for
+        self.add_contacts(addressbook, 0, 3)
+        saver.flush(timeout=0.05)
+        self.assertTrue(addressbook.is_changed)
+
+        saver.set_autosave(0.01, self.path)
+        while addressbook.is_changed:
+            saver.flush(timeout=0.05)
+
+        saver.close()
+
+        loaded = AddressBook(JsonStorage())
+        loaded.load(self.path)
+        self.assertEqual(len(loaded), 3)
+
+    def test_failed_save_is_reported(self):
+        addressbook = AddressBook(JsonStorage())
+        saver = BackgroundSaver(addressbook)
+        self.add_contacts(addressbook, 0, 1)
+
+        # the path is a directory, the rename fails
+        saver.request_save(self.tmpdir.name)
+        saver.close()
+
+        self.assertIsInstance(saver.last_error, StorageError)
+        self.assertTrue(addressbook.is_changed)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,111 @@
+import io
+import os
+import json
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from contactbook.cli import main, open_book, run_stdin
+
+
+class TestCli(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "book.json")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def run_cli(self, *argv):
+        out = io.StringIO()
+        with redirect_stdout(out):
+            code = main(["--file", self.path, *argv])
+
+        return code, json.loads(out.getvalue())
+
+    def test_subcommands(self):
+        code, response = self.run_cli(
+            "add", "--first-name", "albert", "--last-name", "einstein", "--phone", "339 384 2348"
+        )
+        self.assertEqual(code, 0)
+        id = response["result"]["id"]
+
+        code, response = self.run_cli(
+            "add", "--first-name", "max", "--last-name", "planck", "--phone", "339 384 2348"
+        )
+        self.assertEqual(code, 1)
+        self.assertIn("Phone number already used", response["error"])
+
+        code, response = self.run_cli("search", "einst")
+        self.assertEqual([c["id"] for c in response["result"]], [id])
+
+        code, response = self.run_cli("delete", id)
+        self.assertEqual(code, 0)
+        self.assertEqual(self.run_cli("list")[1]["result"], [])
+
+    def test_export_converts_between_formats(self):
+        self.run_cli("add", "--first-name", "albert", "--last-name", "einstein", "--phone", "339 384 2348")
+        snapshot_path = os.path.join(self.tmpdir.name, "book.cbk")
+        json_path = os.path.join(self.tmpdir.name, "copy.json")
+
+        self.assertEqual(self.run_cli("export", snapshot_path)[1]["result"], {"saved": 1})
+        code = main(["--file", snapshot_path, "export", json_path])
+
+        self.assertEqual(code, 0)
+        with open(self.path) as original, open(json_path) as converted:
+            self.assertEqual(json.load(original), json.load(converted))
+
+        ndjson_path = os.path.join(self.tmpdir.name, "book.txt")
+        self.run_cli("export", ndjson_path, "--format", "ndjson")
+        with open(ndjson_path) as file:
+            self.assertEqual(json.loads(file.readline())["last_name"], "Einstein")
+
+    def test_dedupe(self):
+        self.run_cli("add", "--first-name", "mario", "--last-name", "rossi", "--phone", "339 000 0001")
+        self.run_cli("add", "--first-name", "rossi", "--last-name", "mario", "--phone", "347 000 0001")
+        self.run_cli("add", "--first-name", "mario", "--last-name", "rossi", "--phone", "339 000 0002")
+
+        # the second "Mario Rossi" shares only the name, it's another person
+        code, response = self.run_cli("dedupe")
+        self.assertEqual(code, 0)
+        self.assertEqual(len(response["result"]["suggestions"]), 1)
+        self.assertEqual(response["result"]["merged"], 0)
+
+        self.assertEqual(self.run_cli("dedupe", "--apply")[1]["result"]["merged"], 1)
+        self.assertEqual(len(self.run_cli("list")[1]["result"]), 2)
+
+    def test_stdin_commands(self):
+        commands = [
+            {"cmd": "add", "first_name": "Max", "last_name": "Planck", "phone": "339 000 0001"},
+            {"cmd": "list", "limit": 1},
+            {"cmd": "get", "id": "missing"},
+        ]
+        stdin = io.StringIO("\n".join(json.dumps(c) for c in commands) + "\nnot json\n")
+        stdout = io.StringIO()
+
+        code = run_stdin(open_book(self.path, create=True), self.path, stdin, stdout)
+
+        responses = [json.loads(line) for line in stdout.getvalue().splitlines()]
+        self.assertEqual(code, 1)
+        self.assertEqual([r["ok"] for r in responses], [True, True, False, False])
+        id = responses[0]["result"]["id"]
+        self.assertEqual(responses[1]["result"][0]["id"], id)
+
+        # the book is saved at the end of the input
+        self.assertEqual(len(open_book(self.path)), 1)
+
+    def test_stdin_export_keeps_the_changes_to_save(self):
+        copy_path = os.path.join(self.tmpdir.name, "copy.json")
+        commands = [
+            {"cmd": "add", "first_name": "Max", "last_name": "Planck", "phone": "339 000 0001"},
+            {"cmd": "export", "path": copy_path},
+        ]
+        stdin = io.StringIO("\n".join(json.dumps(c) for c in commands) + "\n")
+
+        run_stdin(open_book(self.path, create=True), self.path, stdin, io.StringIO())
+
+        self.assertEqual(len(open_book(self.path)), 1)
+        self.assertEqual(len(open_book(copy_path)), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,5 +1,10 @@
 import unittest
-from contactbook.contact_validators import validate_name, validate_email, validate_phone_number
+from contactbook.contact_validators import (
+    validate_name,
+    validate_email,
+    validate_phone_number,
+    validate_many,
+)
 from contactbook.contact_exceptions import (
     InvalidEmailError,
     InvalidPhoneError,
@@ -42,5 +47,31 @@ class TestValidators(unittest.TestCase):
                 with self.assertRaises(InvalidPhoneError):
                     validate_phone_number(invalid_number)
 
+    def test_validate_many(self):
+        records = [
+            {"first_name": " isaac", "last_name": "newton", "phone": "344\t555 4466"},
+            {"first_name": "Max", "last_name": "Planck", "phone_number": "34423"},
+            {"first_name": "Max", "last_name": 3, "phone_number": "344 555 4466"},
+        ]
+        results = list(validate_many(records))
+
+        self.assertEqual(
+            results[0],
+            {
+                "first_name": "Isaac",
+                "last_name": "Newton",
+                "phone_number": "+393445554466",
+                "email": None,
+            },
+        )
+        self.assertTrue(results[1].startswith("Invalid phone"))
+        self.assertTrue(results[2].startswith("Invalid field value"))
+
+        # only some fields, one at a time in the prompts
+        results = list(validate_many(records, fields=["phone_number"]))
+        self.assertEqual(results[0], {"phone_number": "+393445554466"})
+        self.assertEqual(results[2], {"phone_number": "+393445554466"})
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,67 @@
+import io
+import json
+import unittest
+from unittest.mock import patch
+from contactbook.storage import JsonStorage
+from contactbook.contacts import Contact
+from contactbook.addressbook import AddressBook
+from contactbook.importers import import_csv
+from contactbook.contact_exceptions import StorageError
+
+
+class TestExport(unittest.TestCase):
+    def setUp(self):
+        self.addressbook = AddressBook(JsonStorage())
+        self.addressbook.add_contact(
+            Contact("Max", "Planck", "+393390000001", email="max@test.com")
+        )
+        self.addressbook.add_contact(Contact("Albert", "Einstein, Jr; È", "+393393842348"))
+
+    def export(self, fmt):
+        out = io.StringIO(newline="")
+        self.assertEqual(self.addressbook.export(fmt, out), 2)
+        return out.getvalue()
+
+    def test_csv_can_be_imported_back(self):
+        # batches smaller than the book
+        with patch("contactbook.exporters.WRITE_BATCH", 1):
+            data = self.export("csv")
+
+        imported = AddressBook(JsonStorage())
+        report = import_csv(imported, io.StringIO(data, newline=""))
+
+        self.assertEqual(report.errors, [])
+        self.assertEqual(
+            [(c.first_name, c.last_name, c.phone_number, c.email) for c in imported.list_contacts()],
+            [
+                (c.first_name, c.last_name, c.phone_number, c.email)
+                for c in self.addressbook.list_contacts()
+            ],
+        )
+
+    def test_ndjson(self):
+        lines = self.export("ndjson").splitlines()
+
+        self.assertEqual(
+            [json.loads(line) for line in lines],
+            [c.to_dict() for c in self.addressbook.list_contacts()],
+        )
+
+    def test_vcard(self):
+        vcard3 = self.export("vcard3")
+        vcard4 = self.export("vcard4")
+
+        self.assertEqual(vcard3.count("BEGIN:VCARD\r\n"), 2)
+        self.assertIn("VERSION:3.0\r\n", vcard3)
+        self.assertIn("N:Einstein\\, Jr\\; È;Albert;;;\r\n", vcard3)
+        self.assertIn("EMAIL;TYPE=INTERNET:max@test.com\r\n", vcard3)
+        self.assertIn("TEL;VALUE=uri;TYPE=cell:tel:+393393842348\r\n", vcard4)
+        self.assertTrue(all(len(line.encode()) <= 75 for line in vcard4.split("\r\n")))
+
+    def test_unknown_format(self):
+        with self.assertRaises(StorageError):
+            self.addressbook.export("xml", io.StringIO())
+
+
+if __name__ == "__main__":
+    unittest.main()
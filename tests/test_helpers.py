@@ -0,0 +1,66 @@
+import io
+import unittest
+from contextlib import redirect_stdout
+from unittest.mock import patch
+from contactbook.storage import JsonStorage
+from contactbook.contacts import Contact
+from contactbook.addressbook import AddressBook
+from contactbook.helpers import render_contacts, page_contacts, prompt_contact_fields
+
+
+class TestRenderContacts(unittest.TestCase):
+    def setUp(self):
+        self.addressbook = AddressBook(JsonStorage())
+        names = [("Marie", "Curie"), ("Isaac", "Newton"), ("Max", "Planck")]
+        for i, (first_name, last_name) in enumerate(names):
+            self.addressbook.add_contact(
+                Contact(first_name, last_name, f"+39339000000{i}")
+            )
+
+    def test_render_from_iterator(self):
+        out = io.StringIO()
+        with redirect_stdout(out):
+            count = render_contacts(self.addressbook.iter_contacts(), batch_size=2)
+
+        self.assertEqual(count, 3)
+        lines = out.getvalue().splitlines()
+        self.assertEqual(len(lines), 5)
+        self.assertTrue(lines[2].startswith("Curie"))
+        self.assertIn("+39 339 000 0000", lines[2])
+
+    def test_render_empty(self):
+        out = io.StringIO()
+        with redirect_stdout(out):
+            self.assertEqual(render_contacts(iter([])), 0)
+
+        self.assertEqual(out.getvalue(), "No contacts in address book.\n")
+
+    def test_page_contacts_jump_to_letter(self):
+        out = io.StringIO()
+        with patch("builtins.input", side_effect=["p", "q"]), redirect_stdout(out):
+            page_contacts(self.addressbook, page_size=1)
+
+        lines = out.getvalue().splitlines()
+        rows = [line for line in lines if line.startswith(("Curie", "Newton", "Planck"))]
+        self.assertEqual([row.split()[0] for row in rows], ["Curie", "Planck"])
+
+
+class TestPrompts(unittest.TestCase):
+    def test_invalid_answers_are_asked_again(self):
+        answers = ["", "max", "planck", "34423", "339 000 0001", "max@", ""]
+        out = io.StringIO()
+        with patch("builtins.input", side_effect=answers), redirect_stdout(out):
+            fields = prompt_contact_fields()
+
+        self.assertEqual(
+            fields,
+            {"first_name": "Max", "last_name": "Planck", "phone_number": "+393390000001", "email": None},
+        )
+        errors = out.getvalue().splitlines()
+        self.assertEqual(errors[0], "Missing required field")
+        self.assertTrue(errors[1].startswith("Invalid phone"))
+        self.assertTrue(errors[2].startswith("Invalid email"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,219 @@
+import io
+import csv
+import os
+import tempfile
+import unittest
+from contactbook.storage import JsonStorage
+from contactbook.contacts import Contact
+from contactbook.addressbook import AddressBook
+from contactbook.contact_exceptions import FileCorruptionError
+from contactbook.importers import (
+    import_csv,
+    import_parallel,
+    import_records,
+    import_vcard,
+    read_vcards,
+)
+
+
+CSV = """first_name,last_name,phone,email
+albert,einstein,339 384 2348,albert@test.com
+Isaac,Newton,not a phone,
+Max,Planck,+39 339 000 0001,
+Marie,Curie,339 000 0001,marie@test.com
+Niels,Bohr,339 000 0002,alberteinstein@test.com
+"""
+
+VCARDS = """BEGIN:VCARD\r
+VERSION:3.0\r
+N:Einstein\\, Jr;Albert;;;\r
+FN:Albert Einstein\r
+item1.TEL;TYPE=HOME:+39 06 1234 5678\r
+TEL;TYPE=CELL:+39 339 38\r
+ 4 2348\r
+EMAIL;TYPE=INTERNET:albert@test.com\r
+END:VCARD\r
+BEGIN:VCARD
+VERSION:4.0
+FN:Marie Curie
+TEL;VALUE=uri:tel:+393390000002
+END:VCARD
+BEGIN:VCARD
+FN:Max
+END:VCARD
+"""
+
+
+class TestBulkImport(unittest.TestCase):
+    def setUp(self):
+        self.addressbook = AddressBook(JsonStorage())
+        self.addressbook.add_contact(
+            Contact(
+                first_name="Albert",
+                last_name="Einstein",
+                phone_number="+393393842348",
+                email="alberteinstein@test.com",
+            )
+        )
+        self.addressbook.is_changed = False
+
+    def test_import_reports_errors_per_row(self):
+        report = import_csv(self.addressbook, io.StringIO(CSV))
+
+        self.assertEqual([c.last_name for c in report.added], ["Planck"])
+        self.assertEqual([row for row, _ in report.errors], [1, 2, 4, 5])
+        self.assertIn("row 3", report.errors[2][1])
+
+        self.assertEqual(len(self.addressbook), 2)
+        self.assertIn("+393390000001", self.addressbook._phone_idx)
+        self.assertEqual(
+            [c.last_name for c in self.addressbook.list_contacts()], ["Einstein", "Planck"]
+        )
+        self.assertTrue(self.addressbook.is_changed)
+
+    def test_atomic_import_adds_nothing_on_error(self):
+        report = import_csv(self.addressbook, io.StringIO(CSV), atomic=True)
+
+        self.assertEqual(report.added, [])
+        self.assertEqual(len(report.errors), 4)
+        self.assertEqual(len(self.addressbook), 1)
+        self.assertFalse(self.addressbook.is_changed)
+
+    def test_chunked_import_is_undone_at_once(self):
+        rows = "".join(f"Max,Planck{i},339 000 {i:04d}\n" for i in range(25))
+        report = import_records(
+            self.addressbook,
+            csv.DictReader(io.StringIO("first_name,last_name,phone\n" + rows)),
+            chunk_size=10,
+        )
+        self.assertEqual(len(report.added), 25)
+
+        self.assertTrue(self.addressbook.undo())
+        self.assertEqual(len(self.addressbook), 1)
+
+    def test_unreadable_csv_is_a_corrupted_file(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "contacts.csv")
+
+            # a latin-1 file with the BOM spreadsheets add to utf-8 ones
+            with open(path, "wb") as file:
+                file.write(b"\xef\xbb\xbffirst_name,last_name,phone\nNiccol\xf2,Machiavelli,339 000 0009\n")
+            with self.assertRaises(FileCorruptionError):
+                import_csv(self.addressbook, path)
+
+            # a field over the csv module limit
+            with open(path, "w", encoding="utf-8-sig") as file:
+                file.write("first_name,last_name,phone\nNiccolo,%s,339\n" % ("M" * 200_000))
+            with self.assertRaises(FileCorruptionError):
+                import_csv(self.addressbook, path)
+
+            with open(path, "w", encoding="utf-8-sig") as file:
+                file.write("first_name,last_name,phone\nNiccol\u00f2,Machiavelli,339 000 0009\n")
+            report = import_csv(self.addressbook, path)
+            self.assertEqual([c.first_name for c in report.added], ["Niccol\u00f2"])
+
+    def test_bulk_add_validates_fields(self):
+        report = self.addressbook.bulk_add(
+            [
+                {"first_name": "  isaac ", "last_name": "newton", "phone_number": "339 111 2222"},
+                {"first_name": "", "last_name": "Nobody", "phone_number": "339 111 3333"},
+                {"first_name": 1, "last_name": "Nobody", "phone_number": "339 111 4444"},
+            ]
+        )
+
+        self.assertEqual(report.added[0].get_full_name(), "Isaac Newton")
+        self.assertEqual(report.added[0].phone_number, "+393391112222")
+        self.assertEqual([row for row, _ in report.errors], [2, 3])
+        self.assertEqual(self.addressbook.search_contact("newton"), report.added)
+
+    def test_parallel_import_matches_serial_import(self):
+        serial = import_csv(self.addressbook, io.StringIO(CSV))
+
+        parallel_book = AddressBook(JsonStorage())
+        parallel_book.add_contact(self.addressbook.search_contact("einstein")[0])
+        parallel = import_csv(parallel_book, io.StringIO(CSV), workers=2)
+
+        self.assertEqual(parallel.errors, serial.errors)
+        self.assertEqual(
+            [c.phone_number for c in parallel.added],
+            [c.phone_number for c in serial.added],
+        )
+
+    def test_parallel_import_first_row_wins(self):
+        rows = [
+            {"first_name": "Max", "last_name": "Planck", "phone": f"339 111 {i:04}"}
+            for i in range(50)
+        ]
+        report = import_parallel(
+            self.addressbook, rows + rows[:1], workers=2, chunk_size=7
+        )
+
+        self.assertEqual(len(report.added), 50)
+        self.assertEqual(report.errors, [(51, "Phone number already used by row 1")])
+        self.assertEqual(len(self.addressbook), 51)
+
+    def test_chunked_import_reports_progress(self):
+        rows = [
+            {" First Name": "Max", "Surname": "Planck", "Mobile": f" 339 111 {i:04} "}
+            for i in range(25)
+        ]
+        reports = []
+        report = import_records(
+            self.addressbook,
+            iter(rows + rows[:1]),
+            chunk_size=10,
+            progress=lambda report: reports.append(report.rows),
+        )
+
+        self.assertEqual(reports, [10, 20, 26])
+        self.assertEqual(len(report.added), 25)
+        # the duplicate of a row of an earlier chunk still names the row
+        self.assertEqual(report.errors, [(26, "Phone number already used by row 1")])
+        self.assertEqual(report.rows, 26)
+        self.assertGreater(report.rows_per_sec, 0)
+
+
+class TestVcardImport(unittest.TestCase):
+    def test_read_vcards(self):
+        cards = read_vcards(io.StringIO(VCARDS))
+
+        self.assertEqual(
+            list(cards),
+            [
+                {
+                    "first_name": "Albert",
+                    "last_name": "Einstein, Jr",
+                    "phone": "+39 339 384 2348",
+                    "email": "albert@test.com",
+                },
+                {
+                    "first_name": "Marie",
+                    "last_name": "Curie",
+                    "phone": "+393390000002",
+                    "email": None,
+                },
+                {"first_name": "Max", "last_name": None, "phone": None, "email": None},
+            ],
+        )
+
+    def test_exported_vcards_are_imported_back(self):
+        addressbook = AddressBook(JsonStorage())
+        addressbook.add_contact(Contact("Max", "Planck; È", "+393390000001", email="max@test.com"))
+        addressbook.add_contact(Contact("Albert", " ".join(["Einstein"] * 10), "+393393842348"))
+
+        for fmt in ("vcard3", "vcard4"):
+            out = io.StringIO(newline="")
+            addressbook.export(fmt, out)
+
+            imported = AddressBook(JsonStorage())
+            report = import_vcard(imported, io.StringIO(out.getvalue()))
+
+            self.assertEqual(report.errors, [])
+            self.assertEqual(
+                [(c.last_name, c.phone_number, c.email) for c in imported.list_contacts()],
+                [(c.last_name, c.phone_number, c.email) for c in addressbook.list_contacts()],
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
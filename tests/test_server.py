@@ -0,0 +1,147 @@
+import os
+import json
+import time
+import asyncio
+import tempfile
+import unittest
+from unittest.mock import patch
+from contactbook.cli import open_book
+from contactbook.server import ContactServer
+
+
+class TestContactServer(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "book.json")
+        self.socket_path = os.path.join(self.tmpdir.name, "book.sock")
+
+        self.server = ContactServer(
+            open_book(self.path, create=True), self.path, save_delay=0.05
+        )
+        await self.server.start(socket_path=self.socket_path)
+
+    async def asyncTearDown(self):
+        await self.server.close()
+        self.tmpdir.cleanup()
+
+    async def request(self, reader, writer, command):
+        writer.write(json.dumps(command).encode() + b"\n")
+        await writer.drain()
+        return json.loads(await reader.readline())
+
+    async def test_commands_and_debounced_save(self):
+        reader, writer = await asyncio.open_unix_connection(self.socket_path)
+
+        for i in range(3):
+            response = await self.request(
+                reader,
+                writer,
+                {"cmd": "add", "first_name": "Max", "last_name": "Planck", "phone": f"339000000{i}"},
+            )
+            self.assertTrue(response["ok"])
+
+        response = await self.request(reader, writer, {"cmd": "search", "query": "planck"})
+        self.assertEqual(len(response["result"]), 3)
+
+        response = await self.request(reader, writer, {"cmd": "get", "id": "missing"})
+        self.assertFalse(response["ok"])
+
+        # the three writes are saved once, after the delay
+        self.assertFalse(os.path.exists(self.path))
+        await asyncio.sleep(0.2)
+        self.assertEqual(self.server.saves, 1)
+        self.assertEqual(len(open_book(self.path)), 3)
+
+        writer.close()
+        await writer.wait_closed()
+
+    async def test_undo_is_saved(self):
+        reader, writer = await asyncio.open_unix_connection(self.socket_path)
+        await self.request(
+            reader, writer, {"cmd": "add", "first_name": "Max", "last_name": "Planck", "phone": "3390000001"}
+        )
+        await asyncio.sleep(0.2)
+        self.assertEqual(len(open_book(self.path)), 1)
+
+        response = await self.request(reader, writer, {"cmd": "undo"})
+        self.assertEqual(response["result"], {"done": True})
+        await asyncio.sleep(0.2)
+        self.assertEqual(self.server.saves, 2)
+        self.assertEqual(len(open_book(self.path)), 0)
+
+        writer.close()
+        await writer.wait_closed()
+
+    async def test_save_command_waits_for_the_running_write(self):
+        reader, writer = await asyncio.open_unix_connection(self.socket_path)
+        addressbook = self.server.addressbook
+        write_snapshot = addressbook._write_snapshot
+        written = []
+
+        def slow_write(snapshot):
+            if not written:
+                time.sleep(0.2)
+            write_snapshot(snapshot)
+            written.append(len(snapshot.contacts))
+
+        with patch.object(addressbook, "_write_snapshot", side_effect=slow_write):
+            await self.request(
+                reader, writer, {"cmd": "add", "first_name": "Max", "last_name": "Planck", "phone": "3390000001"}
+            )
+            # the debounced save is still writing when a newer book is saved
+            await asyncio.sleep(0.1)
+            await self.request(
+                reader, writer, {"cmd": "add", "first_name": "Ada", "last_name": "Lovelace", "phone": "3390000002"}
+            )
+            response = await self.request(reader, writer, {"cmd": "save"})
+            self.assertEqual(response["result"], {"saved": 2})
+
+            response = await self.request(reader, writer, {"cmd": "export", "path": self.path})
+            self.assertEqual(response["result"], {"saved": 2})
+
+        self.assertEqual(written, [1, 2, 2])
+        self.assertEqual(len(open_book(self.path)), 2)
+
+        writer.close()
+        await writer.wait_closed()
+
+    async def test_concurrent_clients(self):
+        async def add_contacts(client_id):
+            reader, writer = await asyncio.open_unix_connection(self.socket_path)
+            for i in range(10):
+                await self.request(
+                    reader,
+                    writer,
+                    {"cmd": "add", "first_name": "Max", "last_name": "Planck", "phone": f"33{client_id}000000{i}"},
+                )
+            writer.close()
+            await writer.wait_closed()
+
+        await asyncio.gather(*(add_contacts(i) for i in range(5)))
+
+        self.assertEqual(len(self.server.addressbook), 50)
+        self.assertEqual(self.server.requests, 50)
+
+    async def test_import_is_read_off_the_loop(self):
+        csv_path = os.path.join(self.tmpdir.name, "contacts.csv")
+        with open(csv_path, "w") as file:
+            file.write("first_name,last_name,phone\nMax,Planck,339 000 0001\nAda,Lovelace,nope\n")
+
+        reader, writer = await asyncio.open_unix_connection(self.socket_path)
+        response = await self.request(reader, writer, {"cmd": "import", "path": csv_path})
+        self.assertEqual(response["result"]["added"], 1)
+        self.assertEqual([e["row"] for e in response["result"]["errors"]], [2])
+
+        response = await self.request(reader, writer, {"cmd": "import", "path": "missing.csv"})
+        self.assertFalse(response["ok"])
+
+        # the snapshot is written in the executor, close waits for it
+        writer.close()
+        await writer.wait_closed()
+        await self.server.close()
+        self.assertEqual(self.server.saves, 1)
+        self.assertEqual(len(open_book(self.path)), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,467 @@
+import os
+import json
+import tempfile
+import unittest
+from unittest.mock import patch
+from contactbook.storage import (
+    GENERATION_KEY,
+    JsonStorage,
+    JournalStorage,
+    SnapshotStorage,
+    SqliteStorage,
+)
+from contactbook.contacts import Contact
+from contactbook.addressbook import AddressBook
+from contactbook.sqlite_addressbook import SqliteAddressBook
+from contactbook.snapshot_addressbook import SnapshotAddressBook
+from contactbook.contact_exceptions import (
+    ContactNotFoundError,
+    DuplicateContactError,
+    FileCorruptionError,
+    StorageError,
+    UnsupportedOperationError,
+)
+
+
+class TestJsonStorage(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "book.json")
+        self.storage = JsonStorage()
+        self.data = {
+            str(i): Contact(
+                "Max", "Planck \u00e8", f"+39339000000{i}", id=str(i), email=f"max{i}@test.com"
+            ).to_dict()
+            for i in range(10)
+        }
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_iter_load_matches_load(self):
+        self.storage.save(self.data, self.path)
+
+        # tiny chunks so values and utf-8 chars are split between reads
+        progress = []
+        with patch("contactbook.storage.CHUNK_SIZE", 7):
+            entries = list(
+                self.storage.iter_load(self.path, lambda done, total: progress.append(done))
+            )
+
+        self.assertEqual(dict(entries), self.storage.load(self.path))
+        self.assertEqual(progress[-1], os.path.getsize(self.path))
+
+    def test_iter_load_corrupted_file_keeps_the_old_book(self):
+        addressbook = AddressBook(self.storage)
+        self.storage.save(self.data, self.path)
+        addressbook.load(self.path)
+
+        corrupted_path = os.path.join(self.tmpdir.name, "corrupted.json")
+        with open(corrupted_path, "w") as file:
+            file.write(json.dumps(self.data)[:-30])
+
+        with self.assertRaises(FileCorruptionError):
+            addressbook.load(corrupted_path)
+
+        self.assertEqual(len(addressbook), 10)
+        self.assertEqual(len(addressbook.list_contacts()), 10)
+
+    def test_compressed_books(self):
+        for codec, extension in (("gzip", ".gz"), ("bz2", ".bz2"), ("lzma", ".xz")):
+            # the codec is taken from the extension on save, detected on load
+            path = self.path + extension
+            self.storage.save(self.data, path)
+
+            self.assertEqual(JsonStorage.detect_codec(path), codec)
+            self.assertEqual(self.storage.load(path), self.data)
+            with patch("contactbook.storage.CHUNK_SIZE", 7):
+                self.assertEqual(dict(self.storage.iter_load(path)), self.data)
+
+        # an explicit codec wins over the extension
+        JsonStorage(codec="bz2").save(self.data, self.path)
+        self.assertEqual(JsonStorage.detect_codec(self.path), "bz2")
+
+        with open(self.path, "rb") as file:
+            truncated = file.read()[:-20]
+        with open(self.path, "wb") as file:
+            file.write(truncated)
+
+        with self.assertRaises(FileCorruptionError):
+            self.storage.load(self.path)
+        with self.assertRaises(FileCorruptionError):
+            list(self.storage.iter_load(self.path))
+
+    def test_failed_save_keeps_the_old_file(self):
+        self.storage.save(self.data, self.path)
+
+        with patch("contactbook.storage.json.dump", side_effect=OSError("disk full")):
+            with self.assertRaises(StorageError):
+                self.storage.save({}, self.path)
+
+        # the old file is untouched and the temp file is removed
+        self.assertEqual(self.storage.load(self.path), self.data)
+        self.assertEqual(os.listdir(self.tmpdir.name), ["book.json"])
+
+    def test_save_keeps_the_file_mode(self):
+        with patch("contactbook.storage.UMASK", 0o022):
+            self.storage.save(self.data, self.path)
+        self.assertEqual(os.stat(self.path).st_mode & 0o777, 0o644)
+
+        os.chmod(self.path, 0o640)
+        self.storage.save(self.data, self.path)
+        self.assertEqual(os.stat(self.path).st_mode & 0o777, 0o640)
+
+    def test_full_save_encodes_only_the_changed_contacts(self):
+        addressbook = AddressBook(self.storage)
+        contacts = [Contact.from_dict(contact) for contact in self.data.values()]
+        for contact in contacts:
+            addressbook.add_contact(contact)
+
+        with patch.object(JsonStorage, "encode_entry", wraps=JsonStorage.encode_entry) as encode:
+            addressbook.save(self.path)
+            self.assertEqual(encode.call_count, 10)
+
+            addressbook.update_contact(contacts[0], Contact("Ada", "Lovelace", "+393391111111"))
+            addressbook.delete_contact(contacts[1])
+            addressbook.save(self.path + ".gz")
+            self.assertEqual(encode.call_count, 11)
+
+        self.assertEqual(self.storage.load(self.path), self.data)
+        # the streaming loader reads the encoded entries too
+        loaded = AddressBook(JsonStorage())
+        loaded.load(self.path + ".gz")
+        self.assertEqual(loaded.contacts, addressbook.contacts)
+
+        AddressBook(self.storage).save(self.path)
+        self.assertEqual(self.storage.load(self.path), {})
+
+
+class TestJournalStorage(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "book.json")
+        self.storage = JournalStorage(compact_threshold=3)
+        self.addressbook = AddressBook(self.storage)
+        self.contact = Contact(
+            first_name="Albert",
+            last_name="Einstein",
+            phone_number="+393393842348",
+            email="alberteinstein@test.com",
+        )
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def load_book(self):
+        addressbook = AddressBook(JournalStorage())
+        addressbook.load(self.path)
+        return addressbook
+
+    def test_save_appends_changes_and_load_replays_them(self):
+        self.addressbook.add_contact(self.contact)
+        self.addressbook.save(self.path)
+        self.assertFalse(os.path.exists(self.storage.journal_path(self.path)))
+
+        leonardo = Contact("Leonardo", "Da Vinci", "+393391111111")
+        self.addressbook.add_contact(leonardo)
+        self.addressbook.delete_contact(self.contact)
+        self.addressbook.save(self.path)
+
+        # the snapshot still has the old book, the journal has the changes
+        self.assertEqual(list(JsonStorage().load(self.path)), [GENERATION_KEY, self.contact.id])
+        with open(self.storage.journal_path(self.path)) as journal:
+            self.assertEqual(len(journal.readlines()), 2)
+
+        loaded = self.load_book()
+        self.assertEqual(list(loaded.contacts), [leonardo.id])
+        self.assertIn(leonardo.phone_number, loaded._phone_idx)
+
+    def test_save_writes_only_the_net_changes(self):
+        self.addressbook.add_contact(self.contact)
+        self.addressbook.save(self.path)
+
+        # added and deleted before a save, deleted and added back by undo
+        leonardo = Contact("Leonardo", "Da Vinci", "+393391111111")
+        self.addressbook.add_contact(leonardo)
+        self.addressbook.delete_contact(leonardo)
+        self.addressbook.delete_contact(self.contact)
+        self.addressbook.undo()
+        updated = Contact("Albert", "Einstein", "+393390000001")
+        self.addressbook.update_contact(self.contact, updated)
+        self.addressbook.save(self.path)
+
+        with open(self.storage.journal_path(self.path)) as journal:
+            records = [json.loads(line) for line in journal]
+        self.assertEqual(
+            records,
+            [{"op": "update", "id": self.contact.id, "contact": updated.to_dict(), "gen": 1}],
+        )
+        self.assertEqual(self.load_book().contacts, self.addressbook.contacts)
+
+    def test_journal_is_compacted(self):
+        self.addressbook.save(self.path)
+
+        for i in range(3):
+            self.addressbook.add_contact(Contact("Max", "Planck", f"+39339000000{i}"))
+
+        self.addressbook.save(self.path)
+
+        self.assertFalse(os.path.exists(self.storage.journal_path(self.path)))
+        self.assertEqual(len(self.load_book()), 3)
+
+    def test_torn_last_line_is_ignored(self):
+        self.addressbook.save(self.path)
+        self.addressbook.add_contact(self.contact)
+        self.addressbook.save(self.path)
+
+        with open(self.storage.journal_path(self.path), "a") as journal:
+            journal.write('{"op": "delete", "id"')
+
+        self.assertEqual(len(self.load_book()), 1)
+
+        # the torn line was cut off, a new record must still be readable
+        self.storage.append([{"op": "delete", "id": self.contact.id}], self.path)
+        self.assertEqual(len(self.load_book()), 0)
+
+        with open(self.storage.journal_path(self.path), "a") as journal:
+            journal.write('{"op": "add"}\n{"op": "delete"}\n')
+
+        with self.assertRaises(FileCorruptionError):
+            self.load_book()
+
+    def test_journal_left_by_a_compaction_is_not_replayed(self):
+        self.addressbook.add_contact(self.contact)
+        self.addressbook.save(self.path)
+        self.addressbook.delete_contact(self.contact)
+        self.addressbook.save(self.path)
+
+        # a crash after the new snapshot is in place, before the journal with
+        # the delete is dropped
+        with patch.object(self.storage, "_drop_journal"):
+            self.storage.save({self.contact.id: self.contact.to_dict()}, self.path)
+
+        self.assertTrue(os.path.exists(self.storage.journal_path(self.path)))
+        self.assertEqual(list(self.load_book().contacts), [self.contact.id])
+        self.assertEqual(list(JournalStorage().load(self.path)), [self.contact.id])
+
+
+if __name__ == "__main__":
+    unittest.main()
+
+
+class TestSqliteAddressBook(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "book.db")
+        self.storage = SqliteStorage()
+
+        # write a book with the full save path, then open it lazily
+        addressbook = AddressBook(self.storage)
+        self.contact = Contact(
+            first_name="Albert",
+            last_name="Einstein",
+            phone_number="+393393842348",
+            email="alberteinstein@test.com",
+        )
+        addressbook.add_contact(self.contact)
+        addressbook.add_contact(Contact("Max", "Planck", "+393390000001"))
+        addressbook.save(self.path)
+
+        self.addressbook = SqliteAddressBook(self.storage)
+        self.addressbook.load(self.path)
+
+    def tearDown(self):
+        self.storage.close()
+        self.tmpdir.cleanup()
+
+    def test_queries_are_served_from_the_database(self):
+        self.assertEqual(len(self.addressbook), 2)
+        self.assertEqual(self.addressbook.contacts, {})
+
+        self.assertEqual(self.addressbook.search_contact("rt ein")[0].id, self.contact.id)
+        self.assertEqual(len(self.addressbook.search_contact("a")), 2)
+        # the LIKE wildcards are searched as they are
+        for query in ("100%", "al_ert", "a\\b"):
+            with self.assertRaises(ContactNotFoundError):
+                self.addressbook.search_contact(query)
+
+        last_names = [c.last_name for c in self.addressbook.iter_contacts("F", "P")]
+        self.assertEqual(last_names, ["Planck"])
+        self.assertEqual(self.addressbook.list_contacts(offset=1)[0].last_name, "Planck")
+
+        self.assertEqual(self.addressbook.search_phone(prefix="339 384")[0].id, self.contact.id)
+        self.assertEqual(
+            self.addressbook.search_phone(prefix="+39", suffix="0001")[0].last_name, "Planck"
+        )
+
+        fuzzy = self.addressbook.search_fuzzy("Albret Einstien")
+        self.assertEqual([c.id for c in fuzzy], [self.contact.id])
+        self.assertEqual(self.addressbook.search_fuzzy("plank", k=1)[0].last_name, "Planck")
+        with self.assertRaises(ContactNotFoundError):
+            self.addressbook.search_fuzzy("curie")
+
+        self.assertEqual(self.addressbook.domain_counts(), {"test.com": 1})
+        self.assertEqual(
+            self.addressbook.contacts_by_domain("TEST.com")[0].id, self.contact.id
+        )
+
+    def test_changes_are_committed_on_save(self):
+        with self.assertRaises(DuplicateContactError):
+            self.addressbook.add_contact(Contact("Leonardo", "Da Vinci", "+393390000001"))
+
+        updated_contact = Contact("Isaac", "Newton", "+393393842348")
+        self.addressbook.update_contact(self.contact, updated_contact)
+        self.assertEqual(self.addressbook.search_contact("newton")[0].id, self.contact.id)
+
+        # load discards the uncommitted changes
+        self.addressbook.load(self.path)
+        self.assertEqual(self.addressbook.search_contact("einstein")[0].id, self.contact.id)
+
+        self.addressbook.delete_contact(self.contact)
+        self.addressbook.save(self.path)
+        self.assertEqual(list(self.storage.load(self.path)), [
+            c.id for c in self.addressbook.list_contacts()
+        ])
+        self.assertEqual(len(self.addressbook), 1)
+
+    def test_in_memory_book_saves_only_the_changes(self):
+        addressbook = AddressBook(self.storage)
+        addressbook.load(self.path)
+        planck = addressbook.search_contact("planck")[0]
+
+        # the two contacts swap phones, the database must not see a duplicate
+        addressbook.update_contact(planck, Contact("Max", "Planck", "+393399999999"))
+        addressbook.update_contact(self.contact, Contact("Albert", "Einstein", "+393390000001"))
+        addressbook.update_contact(planck, Contact("Max", "Planck", "+393393842348"))
+        addressbook.add_contact(Contact("Isaac", "Newton", "+393390000002"))
+
+        with patch.object(SqliteStorage, "save", side_effect=AssertionError("full save")):
+            addressbook.save(self.path)
+
+        self.assertEqual(
+            self.storage.load(self.path),
+            {id: contact.to_dict() for id, contact in addressbook.contacts.items()},
+        )
+
+    def test_fuzzy_index_follows_the_changes(self):
+        newton = Contact("Isaac", "Newton", "+393390000002")
+        self.addressbook.add_contact(newton)
+        self.assertEqual(self.addressbook.search_fuzzy("newtn")[0].id, newton.id)
+
+        eddington = Contact("Albert", "Eddington", "+393393842348")
+        self.addressbook.update_contact(self.contact, eddington)
+        self.assertEqual(self.addressbook.search_fuzzy("edingtn")[0].id, self.contact.id)
+        with self.assertRaises(ContactNotFoundError):
+            self.addressbook.search_fuzzy("einstien")
+
+        self.addressbook.delete_contact(newton)
+        with self.assertRaises(ContactNotFoundError):
+            self.addressbook.search_fuzzy("newtn")
+
+        # no deletes are left behind for the tokens of the removed names
+        rows = self.addressbook.conn.execute("SELECT DISTINCT token FROM token_deletes")
+        self.assertEqual({token for token, in rows}, {"albert", "eddington", "max", "planck"})
+
+    def test_older_database_is_indexed_when_opened(self):
+        conn = self.storage.connect(self.path)
+        conn.executescript("DROP TABLE name_tokens; DROP TABLE token_deletes; DROP TABLE fuzzy_state;")
+        self.storage.close()
+
+        addressbook = SqliteAddressBook(self.storage)
+        addressbook.load(self.path)
+        self.assertEqual(addressbook.search_fuzzy("Einstien")[0].id, self.contact.id)
+
+    def test_transaction_rolls_back_to_a_savepoint(self):
+        self.addressbook.delete_contact(self.contact)
+
+        with self.assertRaises(DuplicateContactError):
+            with self.addressbook.transaction():
+                self.addressbook.add_contact(Contact("Isaac", "Newton", "+393390000002"))
+                self.addressbook.add_contact(Contact("Leonardo", "Da Vinci", "+393390000001"))
+
+        # only the transaction is rolled back, the delete is still there to save
+        self.assertEqual([c.last_name for c in self.addressbook.list_contacts()], ["Planck"])
+        self.addressbook.save(self.path)
+        self.assertEqual(len(self.storage.load(self.path)), 1)
+
+    def test_undo_is_not_supported(self):
+        with self.assertRaises(UnsupportedOperationError):
+            self.addressbook.undo()
+
+
+class TestSnapshotAddressBook(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "book.cbk")
+        self.storage = SnapshotStorage()
+
+        addressbook = AddressBook(self.storage)
+        self.contact = Contact(
+            first_name="Albert",
+            last_name="Einstein",
+            phone_number="+393393842348",
+            email="alberteinstein@test.com",
+        )
+        addressbook.add_contact(self.contact)
+        addressbook.add_contact(Contact("Max", "Planck", "+393390000001"))
+        addressbook.add_contact(Contact("Marie", "Curie", "+393390000002", email="mc@Test.com"))
+        addressbook.save(self.path)
+
+        self.addressbook = SnapshotAddressBook(self.storage)
+        self.addressbook.load(self.path)
+
+    def tearDown(self):
+        if self.addressbook.reader is not None:
+            self.addressbook.reader.close()
+        self.tmpdir.cleanup()
+
+    def test_queries_are_served_from_the_snapshot(self):
+        self.assertEqual(len(self.addressbook), 3)
+        self.assertEqual(self.addressbook.contacts, {})
+
+        self.assertEqual(self.addressbook.get_contact(self.contact.id), self.contact)
+        self.assertIsNone(self.addressbook.get_contact("missing"))
+        self.assertEqual(self.addressbook.search_contact("rt ein")[0].id, self.contact.id)
+        self.assertEqual(len(self.addressbook.search_contact("ma")), 2)
+        with self.assertRaises(ContactNotFoundError):
+            # would only match across two names
+            self.addressbook.search_contact("stein\nmarie")
+
+        last_names = [c.last_name for c in self.addressbook.iter_contacts("D", "P")]
+        self.assertEqual(last_names, ["Einstein", "Planck"])
+        self.assertEqual(self.addressbook.list_contacts(offset=1, limit=1)[0].last_name, "Einstein")
+
+        self.assertEqual(self.addressbook.search_phone(prefix="339 384")[0].id, self.contact.id)
+        self.assertEqual(self.addressbook.domain_counts(), {"test.com": 2})
+        self.assertEqual(
+            [c.last_name for c in self.addressbook.contacts_by_domain("TEST.com")],
+            ["Curie", "Einstein"],
+        )
+        self.assertIsNotNone(self.addressbook.reader)
+
+    def test_changes_load_the_book_in_memory(self):
+        with self.assertRaises(DuplicateContactError):
+            self.addressbook.add_contact(Contact("Leonardo", "Da Vinci", "+393390000001"))
+
+        self.assertIsNone(self.addressbook.reader)
+        self.addressbook.delete_contact(self.contact)
+        self.addressbook.save(self.path)
+
+        self.addressbook.load(self.path)
+        self.assertEqual(
+            [c.last_name for c in self.addressbook.list_contacts()], ["Curie", "Planck"]
+        )
+        self.assertEqual(self.storage.load(self.path), {
+            c.id: c.to_dict() for c in self.addressbook.list_contacts()
+        })
+
+    def test_invalid_file(self):
+        corrupted_path = os.path.join(self.tmpdir.name, "corrupted.cbk")
+        with open(self.path, "rb") as file, open(corrupted_path, "wb") as corrupted:
+            corrupted.write(file.read(40))
+
+        with self.assertRaises(FileCorruptionError):
+            self.addressbook.load(corrupted_path)
+
+        # the old snapshot is still open
+        self.assertEqual(len(self.addressbook), 3)
@@ -0,0 +1,169 @@
+import random
+import threading
+import unittest
+from unittest.mock import patch
+from contactbook.storage import JsonStorage
+from contactbook.contacts import Contact
+from contactbook.threadsafe import ThreadSafeAddressBook
+from contactbook.contact_exceptions import ContactNotFoundError, DuplicateContactError
+
+NAMES = ["Albert", "Isaac", "Marie", "Max", "Niels", "Enrico", "Rita", "Ada"]
+
+
+class TestThreadSafeAddressBook(unittest.TestCase):
+    def setUp(self):
+        self.addressbook = ThreadSafeAddressBook(JsonStorage())
+        self.errors = []
+
+    def check_consistency(self):
+        book = self.addressbook
+        contacts = book.contacts
+
+        self.assertEqual({key[2] for key in book._sorted_keys}, set(contacts))
+        self.assertEqual(book._sorted_keys, sorted(book._sorted_keys))
+        self.assertEqual(sorted(book._phone_idx.values()), sorted(contacts))
+        self.assertEqual(sorted(book._phone_sorted), sorted(book._phone_idx))
+        self.assertEqual(set(book._name_keys), set(contacts))
+        for id, contact in contacts.items():
+            self.assertEqual(book._phone_idx[contact.phone_number], id)
+
+    def writer(self, seed):
+        rnd = random.Random(seed)
+        added = []
+        try:
+            for i in range(300):
+                if added and rnd.random() < 0.3:
+                    self.addressbook.delete_contact(added.pop(rnd.randrange(len(added))))
+                elif added and rnd.random() < 0.3:
+                    old = added.pop(rnd.randrange(len(added)))
+                    new = Contact(rnd.choice(NAMES), rnd.choice(NAMES), old.phone_number)
+                    self.addressbook.update_contact(old, new)
+                    added.append(new)
+                else:
+                    contact = Contact(
+                        rnd.choice(NAMES), rnd.choice(NAMES), f"+39339{seed}{i:05}"
+                    )
+                    self.addressbook.add_contact(contact)
+                    added.append(contact)
+        except Exception as e:
+            self.errors.append(e)
+
+    def reader(self, seed, stop):
+        rnd = random.Random(seed)
+        try:
+            while not stop.is_set():
+                try:
+                    for contact in self.addressbook.search_contact(rnd.choice(NAMES)[:3]):
+                        self.assertIsNotNone(contact)
+                except ContactNotFoundError:
+                    pass
+
+                listed = list(self.addressbook.iter_contacts())
+                self.assertEqual(len({c.id for c in listed}), len(listed))
+                len(self.addressbook)
+        except Exception as e:
+            self.errors.append(e)
+
+    def test_concurrent_readers_and_writers(self):
+        stop = threading.Event()
+        readers = [threading.Thread(target=self.reader, args=(i, stop)) for i in range(4)]
+        writers = [threading.Thread(target=self.writer, args=(i,)) for i in range(3)]
+
+        for thread in readers + writers:
+            thread.start()
+        for thread in writers:
+            thread.join()
+        stop.set()
+        for thread in readers:
+            thread.join()
+
+        self.assertEqual(self.errors, [])
+        self.check_consistency()
+
+        # the search cache is still precise after all the writes
+        for name in NAMES:
+            query = name[:3].lower()
+            expected = {id for id, key in self.addressbook._name_keys.items() if query in key}
+            try:
+                found = {c.id for c in self.addressbook.search_contact(query)}
+            except ContactNotFoundError:
+                found = set()
+            self.assertEqual(found, expected)
+
+    def test_iter_contacts_skips_the_moved_contacts(self):
+        contacts = [Contact(name, "Planck", f"+3933900000{i:02}") for i, name in enumerate(NAMES)]
+        for contact in contacts:
+            self.addressbook.add_contact(contact)
+
+        listed = []
+        with patch("contactbook.threadsafe.ITER_BATCH_SIZE", 2):
+            for contact in self.addressbook.iter_contacts():
+                listed.append(contact.id)
+                if len(listed) == 3:
+                    # "Ada" (yielded) moves to the end, "Rita" (not yet) to the start
+                    ada, *_, rita = self.addressbook.list_contacts()
+                    self.addressbook.update_contact(ada, Contact("Ada", "Zuse", ada.phone_number))
+                    self.addressbook.update_contact(rita, Contact("Rita", "Abel", rita.phone_number))
+
+        self.assertEqual(len(listed), len(set(listed)))
+        self.assertEqual(len(listed), len(NAMES) - 1)
+        self.assertEqual(self.addressbook._iterations, set())
+
+    def test_transaction_keeps_other_threads_waiting(self):
+        contact = Contact("Max", "Planck", "+393390000001")
+        seen = []
+        reader = threading.Thread(target=lambda: seen.append(len(self.addressbook)))
+
+        with self.addressbook.transaction():
+            self.addressbook.add_contact(contact)
+            reader.start()
+            reader.join(0.05)
+            self.assertEqual(self.addressbook.list_contacts(), [contact])
+            self.addressbook.delete_contact(contact)
+            self.addressbook.add_contact(Contact("Ada", "Lovelace", "+393390000002"))
+
+        reader.join()
+        self.assertEqual(seen, [1])
+        self.check_consistency()
+
+        self.assertTrue(self.addressbook.undo())
+        self.assertEqual(len(self.addressbook), 0)
+
+    def test_snapshot_doesnt_wait_for_a_save(self):
+        # a save writing to disk (holding the save lock) must not stop
+        # another thread from taking its snapshot
+        saving = threading.Event()
+        release = threading.Event()
+
+        def slow_save():
+            with self.addressbook._save_lock:
+                saving.set()
+                release.wait(5)
+
+        saver = threading.Thread(target=slow_save)
+        saver.start()
+        saving.wait()
+
+        snapshots = []
+        taker = threading.Thread(target=lambda: snapshots.append(self.addressbook._take_snapshot("x")))
+        taker.start()
+        taker.join(1)
+        taken_during_save = not taker.is_alive()
+        release.set()
+        saver.join()
+        taker.join()
+
+        self.assertTrue(taken_during_save)
+        self.assertEqual(len(snapshots), 1)
+
+    def test_bulk_add_duplicates(self):
+        rows = [{"first_name": "Max", "last_name": "Planck", "phone": "339 000 0001"}] * 2
+        report = self.addressbook.bulk_add(rows)
+
+        self.assertEqual(len(report.added), 1)
+        with self.assertRaises(DuplicateContactError):
+            self.addressbook.add_contact(Contact("Max", "Planck", "+393390000001"))
+
+
+if __name__ == "__main__":
+    unittest.main()